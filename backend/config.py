@@ -36,9 +36,28 @@ class Settings:
         self.TRIPOSR_PYTHON = d.get('TRIPOSR_PYTHON', None)
         self.TRIPOSR_BAKE_TEXTURE = d.get('TRIPOSR_BAKE_TEXTURE', True)
         self.TRIPOSR_OUTPUT_FORMAT = d.get('TRIPOSR_OUTPUT_FORMAT', 'glb')
+        # 'worker' keeps one TripoSR process with the model loaded; 'subprocess' runs run.py per request
+        self.TRIPOSR_MODE = d.get('TRIPOSR_MODE', 'worker')
+        # worker mode: jobs arriving within BATCH_WAIT_MS share one model forward (up to MAX_BATCH)
+        self.TRIPOSR_MAX_BATCH = d.get('TRIPOSR_MAX_BATCH', 4)
+        self.TRIPOSR_BATCH_WAIT_MS = d.get('TRIPOSR_BATCH_WAIT_MS', 15)
+        # worker mode on CUDA: autocast precision ('fp16', 'bf16', 'fp32') and torch.compile of the backbone/decoder
+        self.TRIPOSR_PRECISION = d.get('TRIPOSR_PRECISION', 'fp16')
+        self.TRIPOSR_COMPILE = d.get('TRIPOSR_COMPILE', True)
+        # results are cached by image content under cache/triposr_cache; LRU-evicted above this size (0 disables)
+        self.TRIPOSR_CACHE_MAX_GB = d.get('TRIPOSR_CACHE_MAX_GB', 2)
+        # scratch dir for TripoSR inputs/outputs (default: <cache>/tmp, same filesystem as the cache)
+        self.TRIPOSR_TMP_DIR = d.get('TRIPOSR_TMP_DIR', None)
+        # copy every TripoSR output dir to cache/triposr_debug/<ts> for offline debugging
+        self.TRIPOSR_DEBUG_SNAPSHOT = d.get('TRIPOSR_DEBUG_SNAPSHOT', False)
+        # post-process GLB results with `gltf-transform optimize` (meshopt + WebP); clients need a meshopt decoder
+        self.GLB_OPTIMIZE = d.get('GLB_OPTIMIZE', False)
+        self.GLB_OPTIMIZE_CMD = d.get('GLB_OPTIMIZE_CMD', 'gltf-transform')
         self.SD_MODEL_ID = d.get('SD_MODEL_ID', 'runwayml/stable-diffusion-v1-5')
         # Path to an external python executable for SD worker (optional)
         self.SD_VENV_PYTHON = d.get('SD_VENV_PYTHON', None)
+        # with SD_VENV_PYTHON: 'worker' keeps one SD process with the pipeline loaded; 'subprocess' runs sd_worker.py per image
+        self.SD_MODE = d.get('SD_MODE', 'worker')
         # VLM (Gemma3 / LMStudio) settings
         # VLM_URL: if present, the pipeline will POST image bytes (base64 JSON) to this URL
         # and expect a JSON response with fields: category, colors, size, orientation, details
@@ -49,6 +68,16 @@ class Settings:
         self.VLM_RETRIES = d.get('VLM_RETRIES', 2)
         # VLM mode: 'image_b64' (default), 'openai_chat' (LMStudio chat-like messages), or 'multipart'
         self.VLM_MODE = d.get('VLM_MODE', 'image_b64')
+        # name of the model served at VLM_URL (informational); part of the attribute cache key,
+        # so switching models does not keep serving the old model's answers
+        self.VLM_MODEL = d.get('VLM_MODEL', None)
+        # entries kept in cache/vlm_attrs (least recently used evicted first); 0 or less disables the bound
+        self.VLM_ATTR_CACHE_MAX = d.get('VLM_ATTR_CACHE_MAX', 4096)
+        # reuse the light result of an already generated tile whose dHash differs by at most this many bits
+        # and whose mean colour is identical (re-encodes of the same pixels); negative or null disables it
+        self.PHASH_MAX_DISTANCE = d.get('PHASH_MAX_DISTANCE', -1)
+        # tiles of one light job processed concurrently (VLM calls overlap, SD stays serialized)
+        self.TILE_CONCURRENCY = d.get('TILE_CONCURRENCY', 4)
         # Optional externally reachable public URL (e.g. set by ngrok), used by frontends to build absolute links
         self.PUBLIC_URL = d.get('PUBLIC_URL', None)
 
@@ -0,0 +1,28 @@
+"""Small file helpers shared by pipeline and three_d."""
+from __future__ import annotations
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    """Make dst a hard link to src (a copy where links are unsupported), replacing any existing dst.
+
+    The new file is created under a temporary name and renamed over dst, so a
+    dst that was itself a hard link elsewhere is replaced, never written through.
+    """
+    tmp = dst.with_name(f'.{dst.name}.{uuid.uuid4().hex}.tmp')
+    try:
+        try:
+            os.link(str(src), str(tmp))
+        except OSError:
+            # other filesystem / no hardlink support
+            shutil.copy2(str(src), str(tmp))
+        os.replace(str(tmp), str(dst))
+    except Exception:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        raise
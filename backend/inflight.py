@@ -0,0 +1,31 @@
+"""Per-key locks for work that must not run twice at once for the same input
+(the same tile in pipeline, the same TripoSR cache entry in three_d).
+"""
+from __future__ import annotations
+import contextlib
+import threading
+from typing import Dict
+
+
+class InflightLocks:
+    """`with locks(key):` serializes callers that share key; a key's lock is
+    dropped when its last caller leaves, so the table only holds live keys.
+    """
+
+    def __init__(self):
+        self._slots: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def __call__(self, key: str):
+        with self._lock:
+            slot = self._slots.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if not slot[1]:
+                    del self._slots[key]
@@ -13,7 +13,7 @@ from fastapi import APIRouter
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Set, Tuple
+from typing import List, Dict, Set, Tuple, Optional
 import uvicorn
 from pathlib import Path
 import json
@@ -25,9 +25,10 @@ try:
     Image.MAX_IMAGE_PIXELS = 1000000000  # 1 billion pixels
 except Exception:
     pass
+import itertools
 import threading
 from fastapi.staticfiles import StaticFiles
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 from concurrent.futures import TimeoutError as _TO
 try:
     # when run as a package (python -m backend.main) relative imports work
@@ -220,12 +221,33 @@ def save_canvas(img: Image.Image):
     img.save(CANVAS_PATH)
 
 
+def _write_objects_locked(objects: list):
+    # temp file + rename: the static /assets route reads objects.json without the lock
+    _write_file_atomic(OBJECTS_JSON, json.dumps(objects, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
 def save_objects(objects: list):
     ASSET_GLB_DIR.mkdir(parents=True, exist_ok=True)
     # protect concurrent writes to objects.json
     with OBJECTS_LOCK:
-        with open(OBJECTS_JSON, 'w', encoding='utf-8') as f:
-            json.dump(objects, f, ensure_ascii=False, indent=2)
+        _write_objects_locked(objects)
+
+
+def upsert_objects(entries: List[dict]):
+    """Replace (by id) or append a batch of entries in one locked read-modify-write.
+
+    Jobs collect their entries and call this once, so concurrent jobs merge into
+    the current file instead of overwriting each other's results.
+    """
+    if not entries:
+        return
+    ASSET_GLB_DIR.mkdir(parents=True, exist_ok=True)
+    with OBJECTS_LOCK:
+        objects = json.loads(OBJECTS_JSON.read_text(encoding='utf-8')) if OBJECTS_JSON.exists() else []
+        ids = {e['id'] for e in entries}
+        objects = [o for o in objects if o.get('id') not in ids]
+        objects.extend(entries)
+        _write_objects_locked(objects)
 
 
 def load_objects() -> list:
@@ -241,23 +263,48 @@ def tile_bbox(tile_x: int, tile_y: int, tile_size: int) -> Tuple[int,int,int,int
     return x0, y0, x0 + tile_size, y0 + tile_size
 
 
+def _write_file_atomic(path: Path, data: bytes) -> None:
+    # paints run on worker threads; readers (and a concurrent paint of the same tile) never see a torn PNG
+    tmp = path.with_name(f'{path.name}.{threading.get_ident()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _pixels_to_image(pixels: List[List[int]], tile_size: int) -> Image.Image:
+    # one bulk copy of the [r,g,b,a] rows instead of building a tuple per pixel
+    try:
+        flat = bytes(itertools.chain.from_iterable(pixels))
+        if len(flat) == tile_size * tile_size * 4:
+            return Image.frombytes('RGBA', (tile_size, tile_size), flat)
+    except (TypeError, ValueError):
+        pass
+    # out-of-range or non-RGBA pixels: let PIL handle them as before
+    tile_img = Image.new('RGBA', (tile_size, tile_size))
+    tile_img.putdata([tuple(p) for p in pixels])
+    return tile_img
+
+
 def write_tile_to_canvas(payload: PaintPayload):
     # Save per-tile PNG under data/tiles to avoid reopening the huge canvas
     tiles_dir = DATA_DIR / 'tiles'
     tiles_dir.mkdir(parents=True, exist_ok=True)
     if len(payload.pixels) != payload.tile_size * payload.tile_size:
         raise ValueError('pixel length mismatch')
-    tile_img = Image.new('RGBA', (payload.tile_size, payload.tile_size))
-    tile_img.putdata([tuple(p) for p in payload.pixels])
+    tile_img = _pixels_to_image(payload.pixels, payload.tile_size)
     tile_path = tiles_dir / f'tile_{payload.tile_x}_{payload.tile_y}.png'
-    tile_img.save(tile_path)
+    # encode once; both copies are written from these bytes. Level 1 DEFLATE (as for the
+    # placeholder tiles) is ~3x cheaper than the default 6 for a few % more bytes
+    from io import BytesIO
+    bio = BytesIO()
+    tile_img.save(bio, format='PNG', compress_level=1)
+    tile_bytes = bio.getvalue()
+    _write_file_atomic(tile_path, tile_bytes)
     # Also update disk cache and in-memory cache so that /api/tile serves the latest tile
     try:
         cache_dir = settings.cache_path / 'images'
         cache_dir.mkdir(parents=True, exist_ok=True)
         cache_path = cache_dir / tile_path.name
-        tile_bytes = tile_path.read_bytes()
-        cache_path.write_bytes(tile_bytes)
+        _write_file_atomic(cache_path, tile_bytes)
         # update in-memory cache if available
         try:
             key = f"{payload.tile_x},{payload.tile_y}"
@@ -297,7 +344,7 @@ def generate_glb_for_tile(tile_x: int, tile_y: int, tile_size: int) -> Path:
 
 def job_thread(job_id: str, tiles: List[Tuple[int,int]], tile_size: int):
     current_jobs[job_id]['status'] = 'processing'
-    objects = load_objects()
+    entries = {}
     for (tx,ty) in tiles:
         glb_path = generate_glb_for_tile(tx,ty,tile_size)
         # 3D配置座標: タイル座標をそのまま平面へ (Z=0)
@@ -311,11 +358,10 @@ def job_thread(job_id: str, tiles: List[Tuple[int,int]], tile_size: int):
             'glb_url': f'/assets/glb/{glb_path.name}',
             'quality': 'light'
         }
-        # 既存置換
-        objects = [o for o in objects if o['id'] != entry['id']]
-        objects.append(entry)
+        # 既存置換 (upsert_objects で id ごとに置き換え)
+        entries[entry['id']] = entry
         current_jobs[job_id]['progress'] = f"generated {entry['id']}"
-    save_objects(objects)
+    upsert_objects(list(entries.values()))
     current_jobs[job_id]['status'] = 'done'
     modified_tiles.difference_update(tiles)
     current_jobs[job_id]['progress'] = 'completed'
@@ -338,13 +384,34 @@ def _cut_tile_image(tile_x: int, tile_y: int, tile_size: int) -> bytes:
 
 def _run_light_job(job_id: str, tiles: List[Tuple[int,int]], refine: bool):
     current_jobs[job_id]['status'] = 'processing'
-    objects = load_objects()
+    # entry id -> entry; written to objects.json in one batch when the job ends
+    entries = {}
     print(f'[JOB {job_id}] started processing {len(tiles)} tiles')
-    for idx,(tx,ty) in enumerate(tiles):
+    # cut every tile first, then hand the whole batch to the pipeline at once; a tile that
+    # cannot be cut gets a failed future so its error is reported in tile order like the rest
+    cut: List[Optional[bytes]] = []
+    cut_errors = {}
+    for i, (tx, ty) in enumerate(tiles):
+        try:
+            cut.append(_cut_tile_image(tx, ty, settings.tile_px))
+        except Exception as e:
+            cut.append(None)
+            cut_errors[i] = e
+    # set on the first error: tiles already running stop at their next stage
+    abort = threading.Event()
+    submitted = iter(pipeline.run_light_pipeline_many([b for b in cut if b is not None], abort=abort))
+    futures = []
+    for i, b in enumerate(cut):
+        if b is None:
+            failed = Future()
+            failed.set_exception(cut_errors[i])
+            futures.append(failed)
+        else:
+            futures.append(next(submitted))
+    for idx,((tx,ty),fut) in enumerate(zip(tiles, futures)):
         try:
             print(f'[JOB {job_id}] processing tile {tx},{ty} ({idx+1}/{len(tiles)})')
-            tile_bytes = _cut_tile_image(tx,ty,settings.tile_px)
-            glb_path, meta = pipeline.run_light_pipeline(tile_bytes)
+            glb_path, meta = fut.result()
             entry_id = f'tile_{tx}_{ty}'
             entry = {
                 'id': entry_id,
@@ -357,8 +424,7 @@ def _run_light_job(job_id: str, tiles: List[Tuple[int,int]], refine: bool):
                 'quality': 'light',
                 'meta': meta,
             }
-            objects = [o for o in objects if o['id'] != entry_id]
-            objects.append(entry)
+            entries[entry_id] = entry
             current_jobs[job_id]['progress'] = f'{idx+1}/{len(tiles)} light generated'
             print(f'[JOB {job_id}] generated {entry_id} -> {glb_path}')
             # use thread-safe scheduling to broadcast from worker thread
@@ -374,10 +440,14 @@ def _run_light_job(job_id: str, tiles: List[Tuple[int,int]], refine: bool):
             current_jobs[job_id]['error_tb'] = tb
             # broadcast error and stop
             schedule_broadcast({'type':'job_error','job_id':job_id,'message': str(e), 'tile': [tx,ty]})
-            save_objects(objects)
+            upsert_objects(list(entries.values()))
+            # queued tiles are dropped; running ones stop before their next VLM/SD/3D step
+            abort.set()
+            for f in futures[idx+1:]:
+                f.cancel()
             return
     # all tiles processed
-    save_objects(objects)
+    upsert_objects(list(entries.values()))
     modified_tiles.difference_update(tiles)
     current_jobs[job_id]['status'] = 'light_ready'
     schedule_broadcast({'type':'job_done','job_id':job_id,'stage':'light'})
@@ -386,12 +456,14 @@ def _run_light_job(job_id: str, tiles: List[Tuple[int,int]], refine: bool):
     if refine and settings.enable_refiner:
         current_jobs[job_id]['status'] = 'refining'
         def _refine_job():
-            objects_local = load_objects()
+            # id lookup instead of a scan of every object per tile
+            objects_by_id = {o.get('id'): o for o in load_objects()}
+            refined = {}
             print(f'[JOB {job_id}] starting refine for {len(tiles)} tiles')
             for idx,(tx,ty) in enumerate(tiles):
                 try:
                     entry_id = f'tile_{tx}_{ty}'
-                    obj = next((o for o in objects_local if o['id']==entry_id), None)
+                    obj = objects_by_id.get(entry_id)
                     if not obj:
                         print(f'[JOB {job_id}] refine: object {entry_id} not found; skipping')
                         continue
@@ -408,6 +480,7 @@ def _run_light_job(job_id: str, tiles: List[Tuple[int,int]], refine: bool):
                     obj['glb_url'] = f'/assets/{settings.glb_subdir}/{refined_path.name}'
                     obj['quality'] = 'refined'
                     obj['meta_refined'] = meta
+                    refined[entry_id] = obj
                     current_jobs[job_id]['progress'] = f'{idx+1}/{len(tiles)} refined'
                     schedule_broadcast({'type':'job_progress','job_id':job_id,'stage':'refine','entry':obj})
                 except Exception as e:
@@ -419,9 +492,9 @@ def _run_light_job(job_id: str, tiles: List[Tuple[int,int]], refine: bool):
                     current_jobs[job_id]['error'] = str(e)
                     current_jobs[job_id]['error_tb'] = tb
                     schedule_broadcast({'type':'job_error','job_id':job_id,'message': str(e), 'tile': [tx,ty]})
-                    save_objects(objects_local)
+                    upsert_objects(list(refined.values()))
                     return
-            save_objects(objects_local)
+            upsert_objects(list(refined.values()))
             current_jobs[job_id]['status'] = 'refined_ready'
             schedule_broadcast({'type':'job_done','job_id':job_id,'stage':'refine'})
         threading.Thread(target=_refine_job, daemon=True).start()
@@ -453,6 +526,30 @@ async def admin_clear_cache():
 async def admin_clear_cache_wr():
     return await admin_clear_cache()
 
+
+@router.post('/admin/clear_search_cache')
+async def admin_clear_search_cache():
+    # drop memoized LMStudio ranking responses used by /api/search
+    from .models import search as searchmod
+    return {'ok': True, 'cleared': searchmod.clear_lm_cache()}
+
+
+@app.post('/api/admin/clear_search_cache')
+async def admin_clear_search_cache_wr():
+    return await admin_clear_search_cache()
+
+
+@router.post('/admin/clear_vlm_cache')
+async def admin_clear_vlm_cache():
+    # drop cached VLM tile attributes (cache/vlm_attrs), e.g. after changing the VLM setup
+    from .models import vlm as vlmmod
+    return {'ok': True, 'cleared': vlmmod.clear_attr_cache()}
+
+
+@app.post('/api/admin/clear_vlm_cache')
+async def admin_clear_vlm_cache_wr():
+    return await admin_clear_vlm_cache()
+
 @router.get('/tiles')
 async def list_tiles():
     """List all available tiles"""
@@ -597,7 +694,8 @@ async def get_tiles_wr():
 @router.post('/paint')
 async def paint(payload: PaintPayload):
     try:
-        write_tile_to_canvas(payload)
+        # PNG encoding and file writes run off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, write_tile_to_canvas, payload)
         modified_tiles.add((payload.tile_x, payload.tile_y))
         return {'ok': True, 'modified_count': len(modified_tiles)}
     except Exception as e:
@@ -698,16 +796,11 @@ async def startup_load_models():
 
     def _load():
         try:
-            from .models import sd as sdmod
-            # read model id from config
-            try:
-                cfg = __import__('..config', fromlist=['get_config'])
-                model_id = cfg.get_config().get('SD_MODEL_ID')
-            except Exception:
-                model_id = None
-            sd = sdmod.load_sd_model(model_id)
-            model_status['sd_loaded'] = sd is not None
-            model_status['sd_error'] = None if sd is not None else 'diffusers/torch unavailable or failed'
+            # same locked initializer the pipeline uses: a job arriving meanwhile waits for
+            # this load instead of starting its own, and its first tile skips the load entirely
+            status = pipeline.ensure_models()
+            model_status['sd_loaded'] = status['sd_loaded']
+            model_status['sd_error'] = None if status['sd_loaded'] else 'diffusers/torch unavailable or failed'
         except Exception as e:
             model_status['sd_loaded'] = False
             model_status['sd_error'] = str(e)
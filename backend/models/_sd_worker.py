@@ -0,0 +1,119 @@
+"""Persistent Stable Diffusion worker — runs under SD_VENV_PYTHON.
+
+  python _sd_worker.py [--model runwayml/stable-diffusion-v1-5]
+
+Started once by sd.py; imports diffusers and loads the pipeline a single time
+(scripts/sd_worker.py pays both for every image), then serves jobs as
+newline-delimited JSON on stdin:
+
+  {"id": 1, "prompt": "...", "steps": 20, "width": 512, "height": 512, "seed": 1009,
+   "shm": "<name>"}
+
+"shm" names a shared memory block of width*height*3 bytes owned by the caller;
+the RGB pixels are written there. Without it the image comes back inline as a
+base64 PNG. Each job is answered with one JSON line on stdout:
+
+  {"id": 1, "status": "ok", "size": [512, 512]}            (pixels in the block)
+  {"id": 1, "status": "ok", "data": "<base64 png>"}        (no block)
+  {"id": 1, "status": "error", "error": "...", "trace": "..."}
+"""
+import argparse
+import json
+import os
+import sys
+import traceback
+
+# stdout carries the protocol; anything the libraries print goes to stderr instead
+_PROTO = sys.stdout
+sys.stdout = sys.stderr
+
+
+def _send(msg: dict) -> None:
+    _PROTO.write(json.dumps(msg) + '\n')
+    _PROTO.flush()
+
+
+def _load(model_id: str):
+    import torch
+    from diffusers import StableDiffusionPipeline
+    pipe = StableDiffusionPipeline.from_pretrained(model_id)
+    # attention backend: SDPA -> xFormers -> attention slicing (same ladder as sd_worker.py)
+    try:
+        from diffusers.models.attention_processor import AttnProcessor2_0
+        if not hasattr(torch.nn.functional, 'scaled_dot_product_attention'):
+            raise RuntimeError('torch without SDPA')
+        pipe.unet.set_attn_processor(AttnProcessor2_0())
+    except Exception:
+        try:
+            pipe.enable_xformers_memory_efficient_attention()
+        except Exception:
+            try:
+                pipe.enable_attention_slicing()
+            except Exception:
+                pass
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    if device == 'cuda':
+        pipe = pipe.to('cuda')
+    return torch, pipe, device
+
+
+def _put_pixels(name: str, image) -> None:
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        if os.name == 'posix':
+            # the caller unlinks the block; keep our resource tracker from doing it too
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        data = image.tobytes()
+        shm.buf[:len(data)] = data
+    finally:
+        shm.close()
+
+
+def _run(torch, pipe, device: str, job: dict) -> dict:
+    generator = None
+    if job.get('seed') is not None:
+        generator = torch.Generator(device).manual_seed(int(job['seed']))
+    w, h = int(job.get('width') or 512), int(job.get('height') or 512)
+    out = pipe(job['prompt'], num_inference_steps=int(job.get('steps') or 20),
+               width=w, height=h, generator=generator)
+    image = out.images[0].convert('RGB')
+    if job.get('shm'):
+        _put_pixels(job['shm'], image)
+        return {'status': 'ok', 'size': list(image.size)}
+    import base64
+    from io import BytesIO
+    bio = BytesIO()
+    image.save(bio, format='PNG')
+    return {'status': 'ok', 'data': base64.b64encode(bio.getvalue()).decode('ascii')}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='runwayml/stable-diffusion-v1-5')
+    args = parser.parse_args()
+    try:
+        torch, pipe, device = _load(args.model)
+    except Exception as e:
+        _send({'status': 'error', 'error': str(e), 'trace': traceback.format_exc()})
+        return 2
+    _send({'status': 'ready', 'device': device})
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.get('id')
+            reply = _run(torch, pipe, device, job)
+        except Exception as e:
+            reply = {'status': 'error', 'error': str(e), 'trace': traceback.format_exc()}
+        reply['id'] = job_id
+        _send(reply)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
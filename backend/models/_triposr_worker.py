@@ -0,0 +1,253 @@
+"""Persistent TripoSR worker — runs under TRIPOSR_PYTHON with cwd = TRIPOSR_DIR.
+
+  python _triposr_worker.py [--max-batch 4] [--batch-wait-ms 15] [--precision fp16] [--compile]
+
+Started once by three_d.py; imports TripoSR and loads the model a single time,
+then serves jobs as newline-delimited JSON on stdin:
+
+  {"id": 1, "input": "<png>", "output_dir": "<dir>", "format": "obj", "bake_texture": true}
+
+or, instead of "input", already-decoded pixels in a shared memory block owned by
+the caller: {"shm": "<name>", "size": [w, h], "mode": "RGB" | "RGBA"}, or the
+encoded image inline: {"data": "<base64>"}.
+
+and answers each job with one JSON line on stdout:
+
+  {"id": 1, "status": "ok", "out": "<mesh path>"}
+  {"id": 1, "status": "error", "error": "...", "trace": "..."}
+
+Outputs follow run.py's layout (<output_dir>/0/mesh.<fmt>, texture.png, input.png)
+so the caller's discovery / OBJ post-processing works unchanged.
+
+Jobs arriving within --batch-wait-ms of each other are coalesced (up to
+--max-batch) into one model forward; mesh extraction and texture baking stay
+per job. Replies may therefore arrive out of order; match them by id.
+
+On CUDA the forward runs under autocast (--precision fp16/bf16) and, with
+--compile, the transformer backbone and triplane decoder go through
+torch.compile; a dummy image is pushed through at startup so the first real
+job does not pay for compilation.
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+
+# stdout carries the protocol; anything the libraries print goes to stderr instead
+_PROTO = sys.stdout
+sys.stdout = sys.stderr
+# run.py is executed from the TripoSR checkout, which makes `tsr` importable
+sys.path.insert(0, os.getcwd())
+
+PRETRAINED = 'stabilityai/TripoSR'
+CHUNK_SIZE = 8192
+MC_RESOLUTION = 256
+FOREGROUND_RATIO = 0.85
+TEXTURE_RESOLUTION = 2048
+
+
+def _send(msg: dict) -> None:
+    _PROTO.write(json.dumps(msg) + '\n')
+    _PROTO.flush()
+
+
+class _Runner:
+    def __init__(self, precision: str = 'fp32', compile_model: bool = False):
+        import torch
+        from tsr.system import TSR
+        self.torch = torch
+        self.device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+        self.model = TSR.from_pretrained(PRETRAINED, config_name='config.yaml', weight_name='model.ckpt')
+        self.model.renderer.set_chunk_size(CHUNK_SIZE)
+        self.model.to(self.device).eval()
+        self._rembg_session = None
+        self.dtype = None
+        if self.device.startswith('cuda'):
+            if precision == 'bf16' and torch.cuda.is_bf16_supported():
+                self.dtype = torch.bfloat16
+            elif precision in ('fp16', 'bf16'):
+                self.dtype = torch.float16
+            if not (compile_model and self._compile()):
+                self._warmup()
+
+    def _compile(self) -> bool:
+        """Compile hot submodules and warm them up; False leaves the model eager."""
+        if not hasattr(self.torch, 'compile'):
+            return False
+        eager = (self.model.backbone, self.model.decoder)
+        try:
+            self.model.backbone = self.torch.compile(self.model.backbone, mode='reduce-overhead')
+            self.model.decoder = self.torch.compile(self.model.decoder, dynamic=True)
+            self._warmup()
+            return True
+        except Exception:
+            # e.g. no Triton on Windows: keep the eager modules
+            traceback.print_exc()
+            self.model.backbone, self.model.decoder = eager
+            return False
+
+    def _warmup(self) -> None:
+        from PIL import Image
+        self._encode([Image.new('RGB', (512, 512), (127, 127, 127))])
+
+    @staticmethod
+    def _load_image(job: dict):
+        from PIL import Image
+        if job.get('data'):
+            import base64
+            from io import BytesIO
+            return Image.open(BytesIO(base64.b64decode(job['data'])))
+        if not job.get('shm'):
+            return Image.open(job['input'])
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(name=job['shm'])
+        try:
+            if os.name == 'posix':
+                # the caller unlinks the block; keep our resource tracker from doing it too
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            w, h = job['size']
+            mode = job.get('mode') or 'RGB'
+            # frombytes copies, so the block can be released right away
+            view = shm.buf[:w * h * len(mode)]
+            try:
+                return Image.frombytes(mode, (w, h), view)
+            finally:
+                view.release()
+        finally:
+            shm.close()
+
+    def _preprocess(self, job: dict, save_dir: str):
+        """Same preprocessing as run.py: background removal, recentre, grey matte."""
+        import numpy as np
+        from PIL import Image
+        from tsr.utils import remove_background, resize_foreground
+        if self._rembg_session is None:
+            import rembg
+            self._rembg_session = rembg.new_session()
+        image = remove_background(self._load_image(job), self._rembg_session)
+        image = resize_foreground(image, FOREGROUND_RATIO)
+        image = np.array(image).astype(np.float32) / 255.0
+        image = image[:, :, :3] * image[:, :, 3:4] + (1 - image[:, :, 3:4]) * 0.5
+        image = Image.fromarray((image * 255.0).astype(np.uint8))
+        image.save(os.path.join(save_dir, 'input.png'))
+        return image
+
+    def _export(self, job: dict, save_dir: str, scene_code) -> str:
+        import numpy as np
+        from PIL import Image
+        fmt = job.get('format') or 'obj'
+        bake = bool(job.get('bake_texture', True))
+        meshes = self.model.extract_mesh(scene_code.unsqueeze(0), not bake, resolution=MC_RESOLUTION)
+        out_mesh_path = os.path.join(save_dir, f'mesh.{fmt}')
+        if bake:
+            import xatlas
+            from tsr.bake_texture import bake_texture
+            bake_output = bake_texture(meshes[0], self.model, scene_code, TEXTURE_RESOLUTION)
+            xatlas.export(out_mesh_path, meshes[0].vertices[bake_output['vmapping']], bake_output['indices'],
+                          bake_output['uvs'], meshes[0].vertex_normals[bake_output['vmapping']])
+            Image.fromarray((bake_output['colors'] * 255.0).astype(np.uint8)).transpose(Image.FLIP_TOP_BOTTOM).save(
+                os.path.join(save_dir, 'texture.png'))
+        else:
+            meshes[0].export(out_mesh_path)
+        return out_mesh_path
+
+    def _encode(self, images: list):
+        with self.torch.inference_mode():
+            if self.dtype is None:
+                return self.model(images, device=self.device)
+            with self.torch.autocast(device_type='cuda', dtype=self.dtype):
+                codes = self.model(images, device=self.device)
+            # marching cubes / texture baking expect fp32 scene codes
+            return codes.float()
+
+    def run_batch(self, lines: list) -> None:
+        """Run a group of queued jobs, replying to each by id."""
+        ready = []
+        for line in lines:
+            job_id = None
+            try:
+                job = json.loads(line)
+                job_id = job.get('id')
+                save_dir = os.path.join(job['output_dir'], '0')
+                os.makedirs(save_dir, exist_ok=True)
+                ready.append((job, save_dir, self._preprocess(job, save_dir)))
+            except Exception as e:
+                _send({'id': job_id, 'status': 'error', 'error': str(e), 'trace': traceback.format_exc()})
+        if not ready:
+            return
+        try:
+            # one encoder/decoder forward for the whole batch
+            scene_codes = list(self._encode([image for _, _, image in ready]))
+        except Exception:
+            # e.g. out of memory on a large batch: encode one at a time below
+            scene_codes = [None] * len(ready)
+        for (job, save_dir, image), scene_code in zip(ready, scene_codes):
+            try:
+                if scene_code is None:
+                    scene_code = self._encode([image])[0]
+                out = self._export(job, save_dir, scene_code)
+                _send({'id': job.get('id'), 'status': 'ok', 'out': out})
+            except Exception as e:
+                _send({'id': job.get('id'), 'status': 'error', 'error': str(e), 'trace': traceback.format_exc()})
+
+
+def _read_jobs(jobs: 'queue.Queue') -> None:
+    for line in sys.stdin:
+        line = line.strip()
+        if line:
+            jobs.put(line)
+    jobs.put(None)
+
+
+def _next_batch(jobs: 'queue.Queue', max_batch: int, wait_s: float) -> list:
+    """Block for one job, then take whatever else arrives within wait_s (up to max_batch)."""
+    first = jobs.get()
+    if first is None:
+        return []
+    batch = [first]
+    deadline = time.monotonic() + wait_s
+    while len(batch) < max_batch:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            line = jobs.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if line is None:
+            # stdin closed: finish this batch, stop on the next call
+            jobs.put(None)
+            break
+        batch.append(line)
+    return batch
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-batch', type=int, default=4)
+    parser.add_argument('--batch-wait-ms', type=int, default=15)
+    parser.add_argument('--precision', choices=('fp32', 'fp16', 'bf16'), default='fp32')
+    parser.add_argument('--compile', action='store_true')
+    args = parser.parse_args()
+    try:
+        runner = _Runner(args.precision, args.compile)
+    except Exception as e:
+        _send({'status': 'error', 'error': str(e), 'trace': traceback.format_exc()})
+        return 2
+    _send({'status': 'ready', 'device': runner.device})
+    jobs: 'queue.Queue' = queue.Queue()
+    threading.Thread(target=_read_jobs, args=(jobs,), daemon=True).start()
+    while True:
+        batch = _next_batch(jobs, max(1, args.max_batch), max(0, args.batch_wait_ms) / 1000.0)
+        if not batch:
+            return 0
+        runner.run_batch(batch)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
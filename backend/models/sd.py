@@ -5,15 +5,208 @@ is not available or GPU device is not present.
 from __future__ import annotations
 from typing import Optional
 from io import BytesIO
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageFont
 import traceback
 import subprocess
+import threading
 import json
+import atexit
+import base64
+import os
+import queue
+import time
 from pathlib import Path
 from datetime import datetime
 
 _PIPELINE = None
 _DEVICE = None
+# Serializes pipeline loading so concurrent cold-start requests don't each
+# call from_pretrained (duplicate multi-GB loads).
+_LOAD_LOCK = threading.Lock()
+# In-process and per-call subprocess generation: the diffusers pipeline is shared
+# and sd_worker.py writes a fixed output file, so one at a time.
+_GEN_LOCK = threading.Lock()
+
+# Paths used by the sd_worker subprocess path; fixed for the process lifetime.
+_ROOT = Path(__file__).resolve().parents[2]
+_WORKER_PATH = _ROOT / 'scripts' / 'sd_worker.py'
+_OUT_PATH = _WORKER_PATH.parent / 'tmp_sd_out.png'
+_LOG_DIR = _ROOT / 'backend' / 'cache' / 'sd_logs'
+
+# Persistent worker (SD_MODE: worker): loads the pipeline once under SD_VENV_PYTHON
+_SD_WORKER_SCRIPT = Path(__file__).resolve().parent / '_sd_worker.py'
+# model load (first start may download weights) / single image
+_SD_WORKER_START_TIMEOUT = 600
+_SD_WORKER_JOB_TIMEOUT = 240
+# after a failed start, requests use the per-call sd_worker.py for this long before retrying
+_SD_WORKER_RETRY_DELAY = 60
+# no console window on Windows
+_SPAWN_KW = {'creationflags': getattr(subprocess, 'CREATE_NO_WINDOW', 0)} if os.name == 'nt' else {}
+
+
+class _SDWorker:
+    """Long-lived SD process (see _sd_worker.py); one image at a time.
+
+    Jobs and replies are JSON lines over stdin/stdout; the RGB pixels come back
+    through a shared memory block this side creates and unlinks.
+    """
+
+    def __init__(self, python_exec: str, model_id: str):
+        self.python_exec = python_exec
+        self.model_id = model_id
+        self.proc: Optional[subprocess.Popen] = None
+        self.lock = threading.Lock()
+        self._replies: 'queue.Queue[Optional[dict]]' = queue.Queue()
+        self._next_id = 0
+        self._retry_at = 0.0
+
+    def _start(self) -> None:
+        _LOG_DIR.mkdir(parents=True, exist_ok=True)
+        cmd = [self.python_exec, str(_SD_WORKER_SCRIPT), '--model', self.model_id]
+        # worker stderr (library output, tracebacks) is appended to one log file
+        with open(_LOG_DIR / 'sd_worker.log', 'ab') as errlog:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errlog,
+                                    text=True, encoding='utf-8', bufsize=1, **_SPAWN_KW)
+        self.proc = proc
+        self._replies = queue.Queue()
+        threading.Thread(target=self._pump, args=(proc, self._replies), daemon=True).start()
+        try:
+            ready = self._replies.get(timeout=_SD_WORKER_START_TIMEOUT)
+        except queue.Empty:
+            ready = None
+        if not ready or ready.get('status') != 'ready':
+            raise RuntimeError(f"SD worker failed to start: {(ready or {}).get('error', 'no ready message')}")
+        print('[SD] worker ready on', ready.get('device'))
+
+    @staticmethod
+    def _pump(proc: subprocess.Popen, replies: 'queue.Queue[Optional[dict]]') -> None:
+        for line in proc.stdout:
+            try:
+                replies.put(json.loads(line))
+            except ValueError:
+                continue
+        replies.put(None)
+
+    def run(self, job: dict) -> dict:
+        with self.lock:
+            try:
+                if self.proc is None or self.proc.poll() is not None:
+                    if time.monotonic() < self._retry_at:
+                        raise RuntimeError('SD worker failed to start recently; not retrying yet')
+                    try:
+                        self._start()
+                    except Exception:
+                        self._retry_at = time.monotonic() + _SD_WORKER_RETRY_DELAY
+                        raise
+                self._next_id += 1
+                job = dict(job, id=self._next_id)
+                self.proc.stdin.write(json.dumps(job) + '\n')
+                self.proc.stdin.flush()
+                while True:
+                    msg = self._replies.get(timeout=_SD_WORKER_JOB_TIMEOUT)
+                    if msg is None:
+                        raise RuntimeError('SD worker exited')
+                    if msg.get('id') == job['id']:
+                        return msg
+            except Exception:
+                # exited, wedged (queue.Empty) or broken pipe: the next job starts a fresh worker
+                self._stop_locked()
+                raise
+
+    def _stop_locked(self) -> None:
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        try:
+            proc.kill()
+            proc.wait(timeout=5)
+        except Exception:
+            pass
+
+    def stop(self) -> None:
+        with self.lock:
+            self._stop_locked()
+
+
+_SD_WORKER: Optional[_SDWorker] = None
+_SD_WORKER_LOCK = threading.Lock()
+
+
+def _get_sd_worker(python_exec: str, model_id: str) -> _SDWorker:
+    global _SD_WORKER
+    with _SD_WORKER_LOCK:
+        if _SD_WORKER is not None and (_SD_WORKER.python_exec, _SD_WORKER.model_id) != (python_exec, model_id):
+            _SD_WORKER.stop()
+            _SD_WORKER = None
+        if _SD_WORKER is None:
+            _SD_WORKER = _SDWorker(python_exec, model_id)
+        return _SD_WORKER
+
+
+@atexit.register
+def _stop_sd_worker() -> None:
+    if _SD_WORKER is not None:
+        _SD_WORKER.stop()
+
+
+def _worker_image(python_exec: str, model_id: str, prompt: str, seed: Optional[int]) -> bytes:
+    """Generate one 512px image on the persistent worker and return PNG bytes."""
+    job = {'prompt': prompt, 'steps': 20, 'width': 512, 'height': 512, 'seed': seed}
+    shm = None
+    try:
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(create=True, size=512 * 512 * 3)
+        job['shm'] = shm.name
+    except Exception:
+        shm = None
+    try:
+        msg = _get_sd_worker(python_exec, model_id).run(job)
+        if msg.get('status') != 'ok':
+            raise RuntimeError(f"SD worker error: {msg.get('error')}")
+        if msg.get('data'):
+            return base64.b64decode(msg['data'])
+        w, h = msg.get('size') or (512, 512)
+        img = Image.frombytes('RGB', (w, h), bytes(shm.buf[:w * h * 3]))
+    finally:
+        if shm is not None:
+            shm.close()
+            try:
+                shm.unlink()
+            except Exception:
+                pass
+    bio = BytesIO()
+    img.save(bio, format='PNG')
+    return bio.getvalue()
+
+
+def _generate_in_worker(python_exec: str, prompt: str, seed: Optional[int]) -> Optional[bytes]:
+    """Same retry policy as the per-call sd_worker.py path; None if the worker is unusable."""
+    try:
+        from ..config import settings as _settings
+        model_id = getattr(_settings, 'SD_MODEL_ID', None) or 'runwayml/stable-diffusion-v1-5'
+    except Exception:
+        model_id = 'runwayml/stable-diffusion-v1-5'
+    max_attempts = 3
+    data = None
+    for attempt in range(1, max_attempts + 1):
+        attempt_seed = seed if attempt == 1 else (attempt * 1009) % 2**31
+        prompt_variant = prompt if attempt == 1 else (prompt + f' , detailed, vivid, pass {attempt}')
+        try:
+            data = _worker_image(python_exec, model_id, prompt_variant, attempt_seed)
+        except Exception as e:
+            print('[SD] worker generation failed:', e)
+            return None
+        # two colours or fewer: likely a blank image, try again with another seed
+        if Image.open(BytesIO(data)).getcolors(2) is None:
+            return data
+    return data
+
+
+# Default bitmap font for the diagnostic image; loaded once instead of per call.
+try:
+    _FONT = ImageFont.load_default()
+except Exception:
+    _FONT = None
 
 
 def _dummy_generate(prompt: str) -> bytes:
@@ -28,7 +221,7 @@ def _dummy_generate(prompt: str) -> bytes:
         d.line([(0,y),(511,y)], fill=(r,g,b,255))
     # overlay prompt text at top-left for debugging
     try:
-        d.text((8,8), prompt[:200], fill=(255,255,255,255))
+        d.text((8,8), prompt[:200], fill=(255,255,255,255), font=_FONT)
     except Exception:
         # drawing may fail on some headless PIL builds; ignore
         pass
@@ -37,11 +230,46 @@ def _dummy_generate(prompt: str) -> bytes:
     return bio.getvalue()
 
 
+def _enable_fast_attention(pipe) -> str:
+    """Pick the fastest attention implementation available on this host.
+
+    Tries PyTorch SDPA (AttnProcessor2_0), then xFormers, then falls back to
+    attention slicing. Returns the name of the backend that was enabled.
+    """
+    try:
+        from diffusers.models.attention_processor import AttnProcessor2_0
+        import torch.nn.functional as F
+        if not hasattr(F, 'scaled_dot_product_attention'):
+            raise RuntimeError('torch without SDPA')
+        pipe.unet.set_attn_processor(AttnProcessor2_0())
+        return 'sdpa'
+    except Exception:
+        pass
+    try:
+        pipe.enable_xformers_memory_efficient_attention()
+        return 'xformers'
+    except Exception:
+        pass
+    try:
+        pipe.enable_attention_slicing()
+        return 'slicing'
+    except Exception:
+        return 'default'
+
+
 def load_sd_model(model_id: Optional[str] = None):
     """Load a Stable Diffusion pipeline if diffusers is available; otherwise return None."""
-    global _PIPELINE, _DEVICE
     if _PIPELINE is not None:
         return _PIPELINE
+    with _LOAD_LOCK:
+        # another thread may have finished loading while we waited
+        if _PIPELINE is not None:
+            return _PIPELINE
+        return _load_sd_model_locked(model_id)
+
+
+def _load_sd_model_locked(model_id: Optional[str] = None):
+    global _PIPELINE, _DEVICE
     # If an external SD venv is configured, prefer subprocess-based generation
     try:
         from ..config import settings as _settings
@@ -64,18 +292,26 @@ def load_sd_model(model_id: Optional[str] = None):
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         # Use CPU-friendly defaults when CUDA is not available
         torch_dtype = torch.float16 if device == 'cuda' else None
-        # low_cpu_mem_usage can help on constrained systems
-        try:
-            pipe = StableDiffusionPipeline.from_pretrained(model_id, torch_dtype=torch_dtype, low_cpu_mem_usage=(device!='cuda'))
-        except TypeError:
-            # older diffusers may not support low_cpu_mem_usage
-            pipe = StableDiffusionPipeline.from_pretrained(model_id, torch_dtype=torch_dtype)
-        # enable optimizations
+        # Prefer mmap'd safetensors (fp16 variant on GPU) and let accelerate place
+        # weights straight onto the device, avoiding the RAM -> GPU double copy.
+        placed = False
+        fast_kwargs = {'use_safetensors': True, 'low_cpu_mem_usage': True}
+        if device == 'cuda':
+            fast_kwargs.update(variant='fp16', device_map='balanced')
         try:
-            pipe.enable_attention_slicing()
+            pipe = StableDiffusionPipeline.from_pretrained(model_id, torch_dtype=torch_dtype, **fast_kwargs)
+            placed = device == 'cuda'
         except Exception:
-            pass
-        if device == 'cuda':
+            # model has no safetensors/fp16 files, or diffusers/accelerate too old
+            # low_cpu_mem_usage can help on constrained systems
+            try:
+                pipe = StableDiffusionPipeline.from_pretrained(model_id, torch_dtype=torch_dtype, low_cpu_mem_usage=(device!='cuda'))
+            except TypeError:
+                # older diffusers may not support low_cpu_mem_usage
+                pipe = StableDiffusionPipeline.from_pretrained(model_id, torch_dtype=torch_dtype)
+        # enable optimizations
+        _enable_fast_attention(pipe)
+        if device == 'cuda' and not placed:
             pipe = pipe.to('cuda')
         _DEVICE = device
         _PIPELINE = pipe
@@ -91,7 +327,28 @@ def load_sd_model(model_id: Optional[str] = None):
 
 
 def generate_image(model, prompt: str, seed: Optional[int]=None) -> bytes:
-    """Generate PNG bytes for the prompt. If model is None, use dummy generator."""
+    """Generate PNG bytes for the prompt. If model is None, use dummy generator.
+
+    Safe to call from several threads; generations run one at a time.
+    """
+    if model is None:
+        try:
+            from ..config import settings as _settings
+            sd_python = getattr(_settings, 'SD_VENV_PYTHON', None)
+            worker_mode = getattr(_settings, 'SD_MODE', 'worker') == 'worker'
+        except Exception:
+            sd_python, worker_mode = None, False
+        if sd_python and worker_mode:
+            # the worker serializes jobs itself; the shm copy, PNG encode and colour
+            # check run outside its lock, overlapping the next caller's generation
+            data = _generate_in_worker(sd_python, prompt, seed)
+            if data is not None:
+                return data
+    with _GEN_LOCK:
+        return _generate_image_locked(model, prompt, seed)
+
+
+def _generate_image_locked(model, prompt: str, seed: Optional[int]=None) -> bytes:
     try:
         # If no in-process model is loaded, but an external SD venv is configured,
         # prefer calling the sd_worker subprocess so real SD images can be produced
@@ -104,10 +361,7 @@ def generate_image(model, prompt: str, seed: Optional[int]=None) -> bytes:
                 sd_python = None
             if sd_python:
                 # call the sd_worker.py in the provided python venv with retries
-                worker = Path(__file__).resolve().parent.parent.parent / 'scripts' / 'sd_worker.py'
-                out_dir = worker.parent
-                out_path = out_dir / 'tmp_sd_out.png'
-                log_dir = Path(__file__).resolve().parent.parent.parent / 'backend' / 'cache' / 'sd_logs'
+                log_dir = _LOG_DIR
                 log_dir.mkdir(parents=True, exist_ok=True)
                 max_attempts = 3
                 base_prompt = prompt
@@ -115,7 +369,7 @@ def generate_image(model, prompt: str, seed: Optional[int]=None) -> bytes:
                     # vary seed and slightly vary prompt on retries
                     seed_arg = str( (attempt * 1009) % 2**31 )
                     prompt_variant = base_prompt if attempt == 1 else (base_prompt + f' , detailed, vivid, pass {attempt}')
-                    cmd = [sd_python, str(worker), '--prompt', prompt_variant, '--out', str(out_path), '--steps', '20']
+                    cmd = [sd_python, str(_WORKER_PATH), '--prompt', prompt_variant, '--out', str(_OUT_PATH), '--steps', '20']
                     try:
                         proc = subprocess.run(cmd, capture_output=True, text=True, timeout=240)
                     except Exception as e:
@@ -139,30 +393,26 @@ def generate_image(model, prompt: str, seed: Optional[int]=None) -> bytes:
                     except Exception:
                         pass
 
-                    # check output
-                    if out_path.exists():
-                        try:
-                            data = out_path.read_bytes()
-                            # sanity check: ensure not single-color
-                            try:
-                                img = Image.open(out_path).convert('RGBA')
-                                px = list(img.getdata())
-                                cols = set(px)
-                                if len(cols) <= 2:
-                                    # too few colors -> likely single-color, retry
-                                    if attempt < max_attempts:
-                                        continue
-                                    else:
-                                        return data
-                                else:
-                                    return data
-                            except Exception:
-                                return data
-                        finally:
-                            try:
-                                out_path.unlink()
-                            except Exception:
-                                pass
+                    # check output: read once, remove the temp file, validate in memory
+                    try:
+                        data = _OUT_PATH.read_bytes()
+                    except OSError:
+                        # not produced -> retry
+                        continue
+                    try:
+                        _OUT_PATH.unlink()
+                    except OSError:
+                        pass
+                    # sanity check: ensure not single-color
+                    try:
+                        img = Image.open(BytesIO(data)).convert('RGBA')
+                        cols = set(img.getdata())
+                        if len(cols) <= 2 and attempt < max_attempts:
+                            # too few colors -> likely single-color, retry
+                            continue
+                    except Exception:
+                        pass
+                    return data
                     # if not produced, loop to retry
                 # All attempts failed -> fall back to dummy
             # No external venv or subprocess failure: return diagnostic image
@@ -192,8 +442,7 @@ def generate_image(model, prompt: str, seed: Optional[int]=None) -> bytes:
                 sd_python = None
             if sd_python:
                 # call the sd_worker.py in the provided python venv
-                worker = Path(__file__).resolve().parent.parent.parent / 'scripts' / 'sd_worker.py'
-                cmd = [sd_python, str(worker), '--prompt', prompt, '--out', str(worker.parent / 'tmp_sd_out.png')]
+                cmd = [sd_python, str(_WORKER_PATH), '--prompt', prompt, '--out', str(_OUT_PATH)]
                 try:
                     proc = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
                 except Exception as e:
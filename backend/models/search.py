@@ -2,11 +2,27 @@ import os
 import json
 import time
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import requests
 import re
 import hashlib
+import zlib
 import random
+import functools
+import threading
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import ahocorasick
+except Exception:
+    ahocorasick = None
+
+try:
+    import orjson
+except Exception:
+    orjson = None
 
 # simple JP->EN token map for short queries
 JP_TO_EN = {
@@ -41,28 +57,140 @@ EN_TO_JP_SIMPLE = {
 
 CACHE_DIR = Path(__file__).resolve().parents[1] / 'cache' / 'vlm_logs'
 
+# Precompiled patterns used in the per-candidate scoring / parsing loops
+_RE_WORD = re.compile(r"\W+")
+_RE_WS = re.compile(r"\s+")
+_RE_ASCII_ONLY = re.compile(r'^[a-z\-]+$')
+_RE_ASCII_WORD = re.compile(r'([A-Za-z]{2,})')
+_JSON_DECODER = json.JSONDecoder()
+
 # System prompt in "妹口調" (imouto-style) for LMStudio chat-like API
 IMOUTO_SYSTEM_PROMPT = (
     "あなたは優しい妹のように振る舞ってください。ユーザーの質問には短く、親しみやすく、少し甘えた日本語の口調（妹口調）で答えてください。出力は冷静にJSONで返す部分と、妹口調の短いコメントを含める部分の両方を提供してください。"
 )
+# Constant prompt pieces, built once at import
+_FORMAT_SYSTEM_PROMPT = (
+    IMOUTO_SYSTEM_PROMPT + '\n'
+    "出力は必ず JSON 配列のみで返してください。各要素は {id, score, text, comment} を含めてください。"
+)
+_TRANSLATION_HINT = (
+    "注意: 入力クエリは日本語です。候補テキストは英語の場合があります。"
+    " クエリに合わせて候補の英語テキストを内部的に翻訳・照合してください。"
+)
+_TARGET_HINTS = {
+    'paint': '注: paint UI 用。comment は非常に短く（最大20文字）簡潔な妹口調でお願いします。',
+    'world_new': '注: world UI 用。comment は短め（10〜40文字）、場所の参照を含めても良いです。',
+    'world': '注: world UI 用。comment は短め（10〜40文字）、場所の参照を含めても良いです。',
+}
 
 
-def _read_vlm_logs() -> List[Dict[str, Any]]:
-    logs = []
-    if not CACHE_DIR.exists():
-        return logs
-    for p in sorted(CACHE_DIR.glob('*.json')):
+def _loads(raw: bytes) -> Any:
+    """Decode JSON bytes, preferring orjson (stdlib json handles e.g. NaN literals)."""
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except Exception:
+            pass
+    return json.loads(raw.decode('utf-8'))
+
+
+def _dumps(obj: Any) -> bytes:
+    """Encode obj as UTF-8 JSON bytes with sorted keys."""
+    if orjson is not None:
         try:
-            data = json.loads(p.read_text(encoding='utf-8'))
-            # Expect each log to contain at least: id, description/text, coords (x,y,z) or bbox
-            logs.append({'path': str(p), 'data': data, 'ts': p.stat().st_mtime})
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
         except Exception:
+            pass
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True).encode('utf-8')
+
+
+# Parsed log files: path -> (stat key, data). Unchanged files are neither
+# re-read nor re-parsed on later searches.
+_PARSE_CACHE: Dict[str, tuple] = {}
+_PARSE_FAILED = object()
+# Cold-cache reads go through a thread pool once there are this many files
+_PARSE_PARALLEL_MIN = 16
+_PARSE_WORKERS = 8
+# Candidate list memoized on the (path, mtime, size) listing of CACHE_DIR
+_CANDIDATES_CACHE: Dict[str, Any] = {'key': None, 'value': None}
+
+
+def _log_entries() -> List[tuple]:
+    """List (path, stat key, mtime) for every log file in CACHE_DIR."""
+    entries = []
+    try:
+        it = os.scandir(CACHE_DIR)
+    except OSError:
+        return entries
+    # DirEntry carries the type from readdir, so non-files are skipped without a stat
+    with it:
+        for e in it:
+            if not e.name.endswith('.json'):
+                continue
+            try:
+                if not e.is_file():
+                    continue
+                st = e.stat()
+            except OSError:
+                continue
+            entries.append((e.path, (st.st_mtime_ns, st.st_size), st.st_mtime))
+    entries.sort()
+    return entries
+
+
+def _parse_log_file(path: str) -> Any:
+    try:
+        return _loads(Path(path).read_bytes())
+    except Exception:
+        return _PARSE_FAILED
+
+
+def _read_vlm_logs(entries: Optional[List[tuple]] = None) -> List[Dict[str, Any]]:
+    if entries is None:
+        entries = _log_entries()
+    logs = []
+    live = set()
+    misses = [(path, key) for path, key, _ in entries
+              if (_PARSE_CACHE.get(path) or (None,))[0] != key]
+    if len(misses) >= _PARSE_PARALLEL_MIN:
+        # cold cache: file reads and json decoding release the GIL
+        with ThreadPoolExecutor(max_workers=_PARSE_WORKERS) as ex:
+            parsed = list(ex.map(_parse_log_file, (path for path, _ in misses)))
+    else:
+        parsed = [_parse_log_file(path) for path, _ in misses]
+    for (path, key), data in zip(misses, parsed):
+        _PARSE_CACHE[path] = (key, data)
+    for path, key, mtime in entries:
+        live.add(path)
+        data = _PARSE_CACHE[path][1]
+        if data is _PARSE_FAILED:
             continue
+        # Expect each log to contain at least: id, description/text, coords (x,y,z) or bbox
+        logs.append({'path': path, 'data': data, 'ts': mtime})
+    # forget files that were removed from the directory
+    for path in [k for k in _PARSE_CACHE if k not in live]:
+        del _PARSE_CACHE[path]
     return logs
 
 
 def _build_candidates_from_logs() -> List[Dict[str, Any]]:
-    logs = _read_vlm_logs()
+    entries = _log_entries()
+    key = tuple((path, k) for path, k, _ in entries)
+    if _CANDIDATES_CACHE['key'] == key and _CANDIDATES_CACHE['value'] is not None:
+        return list(_CANDIDATES_CACHE['value'])
+    candidates = _collect_candidates(_read_vlm_logs(entries))
+    _CANDIDATES_CACHE['key'] = key
+    _CANDIDATES_CACHE['value'] = candidates
+    return list(candidates)
+
+
+def _norm_text(s: str) -> str:
+    """Lowercase, trim and collapse whitespace runs to one space (dedup key)."""
+    # str.split() breaks on the same whitespace set as \s, without the regex engine
+    return ' '.join((s or '').lower().split())
+
+
+def _collect_candidates(logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     candidates = []
     for l in logs:
         d = l.get('data')
@@ -93,20 +221,164 @@ def _build_candidates_from_logs() -> List[Dict[str, Any]]:
             vid = Path(l['path']).stem
         candidates.append({'id': vid, 'text': text or '', 'coords': coords, 'ts': l['ts']})
     # deduplicate by normalized text (keep most recent)
-    def _norm(s: str) -> str:
-        return re.sub(r"\s+", ' ', (s or '').strip().lower())
-
     seen = {}
-    # keep only the most recent candidate per normalized text
-    for c in sorted(candidates, key=lambda x: x.get('ts', 0), reverse=True):
-        k = _norm(c.get('text',''))
+    # keep only the most recent candidate per normalized text (single pass, no sort)
+    for c in candidates:
+        k = _norm_text(c.get('text',''))
         if not k:
             # keep empty-text items keyed by id to avoid collapsing unrelated empties
             k = (c.get('id') or '') + '|__empty__'
-        if k in seen:
+        prev = seen.get(k)
+        if prev is None or c.get('ts', 0) > prev.get('ts', 0):
+            seen[k] = c
+    # newest first: callers rely on this order for ties and the LM candidate list
+    survivors = sorted(seen.values(), key=lambda x: x.get('ts', 0), reverse=True)
+    return [_prepare_candidate(c) for c in survivors]
+
+
+def _fast_tokens(s: str, min_len: int = 2) -> List[str]:
+    """Split on non-word runs (like _RE_WORD.split), keeping tokens of at least min_len chars."""
+    # plain ASCII words separated by spaces need no regex: str.split() gives the same tokens
+    if s.isascii() and s.replace(' ', '').isalnum():
+        return [tok for tok in s.split() if len(tok) >= min_len]
+    return [tok for tok in _RE_WORD.split(s) if tok and len(tok) >= min_len]
+
+
+def _prepare_candidate(c: Dict[str, Any]) -> Dict[str, Any]:
+    """Attach derived fields used by keyword scoring (computed once per candidate).
+
+    Keys are underscore-prefixed and stripped again from scored results.
+    """
+    text = c.get('text') or ''
+    low = text.lower()
+    c['_text_lower'] = low
+    c['_tokens'] = frozenset(_fast_tokens(low))
+    # space-joined tokens: one substring scan answers "tok inside any token"
+    c['_joined'] = ' '.join(c['_tokens'])
+    c['_len_stripped'] = len(text.strip())
+    # prompt-ready text, truncated to the 400 chars sent to the LM
+    c['_text_400'] = text[:400]
+    return c
+
+
+def _candidate_text_400(c: Dict[str, Any]) -> str:
+    txt = c.get('_text_400')
+    return txt if txt is not None else (c.get('text') or '')[:400]
+
+
+@functools.lru_cache(maxsize=128)
+def _token_automaton(tokens: tuple):
+    """Aho-Corasick automaton over query tokens (cached per token tuple)."""
+    A = ahocorasick.Automaton()
+    for tok in tokens:
+        A.add_word(tok, tok)
+    A.make_automaton()
+    return A
+
+
+def _automaton_hits(tokens: tuple, text: str) -> set:
+    """Return the set of tokens occurring as substrings of text, in one pass."""
+    if not tokens or not text:
+        return set()
+    return {tok for _, tok in _token_automaton(tokens).iter(text)}
+
+
+_FALLBACK_COMMENTS = (
+    'これ、なんだろうね〜でも可愛いよ〜',
+    'うーん、ちょっと自信ないけど……見つけたよ〜',
+    'わかったかも？これっぽいね、見てみて〜',
+    'お兄ちゃん、これかな〜？かわいいね〜',
+)
+_SUFFIX_VARIANTS = ('ね、かわいい〜', 'だよ〜', 'かな〜', 'すごいね〜', 'だね〜')
+_TECH_TOKENS = ('voxel', 'voxel-style', 'style', 'low-poly', 'lowpoly', 'game-friendly', '3d', 'primary', 'colors', 'color', 'render', 'front', 'view', 'detail', 'details', 'large', 'small', 'size', 'game', 'friendly', 'texture', 'textures')
+
+
+def _clip_comment(comment: str) -> str:
+    return comment if len(comment) <= 40 else (comment[:37] + '...')
+
+
+@functools.lru_cache(maxsize=1024)
+def _first_word_comment(first: str) -> str:
+    return _clip_comment(f'これ、{first}っぽいね、かわいい〜')
+
+
+def _gen_imouto_comment_from_text(text: str) -> str:
+    """Comment built from the first word of text (random fallback for empty text)."""
+    try:
+        if not text:
+            return random.choice(_FALLBACK_COMMENTS)
+        return _first_word_comment(text.split()[0])
+    except Exception:
+        return random.choice(_FALLBACK_COMMENTS)
+
+
+@functools.lru_cache(maxsize=1024)
+def _gen_imouto_comment(text: str) -> str:
+    """Comment for an LM result, mapping the leading noun to Japanese when known."""
+    try:
+        if not text:
+            return 'ん〜分かんないけど探してみたよ〜'
+        # prefer to avoid echoing technical style tokens like 'voxel-style' or 'style'
+        toks = [t.strip('\"\'.,:;()') for t in text.split() if t.strip()]
+        first = toks[0] if toks else ''
+        low = first.lower()
+        # try to map common english nouns to japanese
+        jp = EN_TO_JP_SIMPLE.get(low)
+        if not jp:
+            # if token contains '-' like 'voxel-style', try last part
+            if '-' in low:
+                part = low.split('-')[-1]
+                jp = EN_TO_JP_SIMPLE.get(part)
+        if jp:
+            subject = jp
+        else:
+            # if token is a tech token or obviously non-noun, avoid echoing it
+            if _RE_ASCII_ONLY.match(low) and any(tt in low for tt in _TECH_TOKENS):
+                subject = 'これ'
+            elif _RE_ASCII_ONLY.match(low):
+                # ascii fallback
+                subject = low
+            else:
+                subject = first
+        return _clip_comment(f'これ、{subject}っぽいね、かわいい〜')
+    except Exception:
+        return '見つけたよ〜、すごいね〜'
+
+
+# every byte that is not an ASCII letter, for bytes.translate(None, delete)
+_NON_LETTER_BYTES = bytes(b for b in range(256) if not (65 <= b <= 90 or 97 <= b <= 122))
+
+
+def _is_mostly_english(s: str) -> bool:
+    if not s: return False
+    # count ASCII letters in C: drop non-ASCII, then delete non-letter bytes
+    letters = len(s.encode('ascii', 'ignore').translate(None, _NON_LETTER_BYTES))
+    return letters > max(3, len(s) // 3)
+
+
+def _variant_comment(text: str, idx: int) -> str:
+    base = text.split()[0] if text and text.split() else 'これ'
+    return _clip_comment(f"これ、{base}{_SUFFIX_VARIANTS[idx % len(_SUFFIX_VARIANTS)]}")
+
+
+def _finalize_comments(items: List[Dict[str, Any]], gen=_gen_imouto_comment_from_text, replace_english: bool = False) -> None:
+    """Fill in missing comments and make them unique across items (in place).
+
+    Zero-score items get an empty comment. With replace_english, comments
+    that look English-only are regenerated via gen.
+    """
+    used_comments = set()
+    for idx, item in enumerate(items):
+        if (item.get('score') or 0.0) <= 0.0:
+            item['comment'] = ''
             continue
-        seen[k] = c
-    return list(seen.values())
+        c = (item.get('comment') or '').strip()
+        if not c or (replace_english and _is_mostly_english(c)):
+            c = item['comment'] = gen(item.get('text', ''))
+        # if duplicate comment, create a small variant
+        if c in used_comments:
+            c = item['comment'] = _variant_comment(item.get('text') or '', idx)
+        used_comments.add(c)
 
 
 def _score_with_keywords(query: str, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -119,7 +391,7 @@ def _score_with_keywords(query: str, candidates: List[Dict[str, Any]]) -> List[D
     q_tokens = []
     if not is_non_ascii:
         # tokenize query (works for latin words)
-        q_tokens = [tok for tok in re.split(r"\W+", q) if tok and len(tok) > 1]
+        q_tokens = _fast_tokens(q)
 
     # if query is short Japanese (like '車'), map to English tokens to match candidate english descriptions
     mapped = []
@@ -138,32 +410,39 @@ def _score_with_keywords(query: str, candidates: List[Dict[str, Any]]) -> List[D
         # fallback to query as a token (for japanese/multibyte or others)
         q_tokens = [q]
 
-    fallback_comments = [
-        'これ、なんだろうね〜でも可愛いよ〜',
-        'うーん、ちょっと自信ないけど……見つけたよ〜',
-        'わかったかも？これっぽいね、見てみて〜',
-        'お兄ちゃん、これかな〜？かわいいね〜'
-    ]
+    # Only tokens without separators can occur inside a single candidate
+    # token, so those are the ones matched against the joined tokens.
+    in_token_set = tuple(sorted({tok for tok in q_tokens if tok and not _RE_WORD.search(tok)}))
+    substr_set = tuple(sorted({tok for tok in q_tokens if tok}))
 
     for c in candidates:
+        if '_tokens' not in c:
+            c = _prepare_candidate(dict(c))
         t_raw = c.get('text') or ''
-        t = t_raw.lower()
+        t = c['_text_lower']
         # candidate tokens
-        c_tokens = [tok for tok in re.split(r"\W+", t) if tok and len(tok) > 1]
+        c_tokens = c['_tokens']
         # score = token overlap ratio
-        match_count = sum(1 for tok in q_tokens if tok in c_tokens or any(tok in ct for ct in c_tokens))
+        if ahocorasick is not None:
+            token_hits = _automaton_hits(in_token_set, c['_joined'])
+            substr_hit = bool(_automaton_hits(substr_set, t))
+        else:
+            exact = c_tokens.intersection(in_token_set)
+            token_hits = exact.union(tok for tok in in_token_set if tok not in exact and tok in c['_joined'])
+            substr_hit = any(qtok in t for qtok in substr_set)
+        match_count = sum(1 for tok in q_tokens if tok in token_hits)
         score = match_count / max(1, len(q_tokens))
         # boost if query substring appears or any mapped token appears as substring (stronger signal)
         if q in t:
             score += 0.25
-        if any(qtok in t for qtok in q_tokens):
+        if substr_hit:
             # if token appears as substring, ensure a noticeable positive score
             score = max(score, 0.5)
 
         # penalize extremely short/empty candidate texts
-        if len(t_raw.strip()) < 3:
+        if c['_len_stripped'] < 3:
             score *= 0.2
-        cpy = dict(c)
+        cpy = {k: v for k, v in c.items() if not k.startswith('_')}
         cpy['score'] = float(min(1.0, score))
         # generate a tiny imouto-style Japanese comment fallback (avoid echoing technical tokens)
         preview = t_raw.strip()
@@ -172,17 +451,16 @@ def _score_with_keywords(query: str, candidates: List[Dict[str, Any]]) -> List[D
             try:
                 if not text:
                     # deterministic selection based on id for empties
-                    seed = int(hashlib.sha1((cpy.get('id') or str(idx)).encode('utf-8')).hexdigest(), 16)
-                    return fallback_comments[seed % len(fallback_comments)]
-                toks = [tok for tok in re.split(r"\W+", text) if tok]
-                tech_tokens = ('voxel', 'voxel-style', 'style', 'low-poly', 'lowpoly', 'game-friendly', '3d', 'primary', 'colors', 'color', 'render', 'front', 'view', 'detail', 'details', 'large', 'small', 'size', 'game', 'friendly', 'texture', 'textures')
+                    seed = zlib.crc32((cpy.get('id') or str(idx)).encode('utf-8'))
+                    return _FALLBACK_COMMENTS[seed % len(_FALLBACK_COMMENTS)]
+                toks = _fast_tokens(text, min_len=1)
                 subject = None
                 # prefer safe ASCII tokens (letters/hyphen) that are not technical adjectives
                 for tok in toks:
                     lowtok = tok.lower()
-                    if not re.match(r'^[a-z\-]+$', lowtok):
+                    if not _RE_ASCII_ONLY.match(lowtok):
                         continue
-                    if any(tt in lowtok for tt in tech_tokens):
+                    if any(tt in lowtok for tt in _TECH_TOKENS):
                         continue
                     # map known english nouns to jp
                     if lowtok in EN_TO_JP_SIMPLE:
@@ -193,18 +471,15 @@ def _score_with_keywords(query: str, candidates: List[Dict[str, Any]]) -> List[D
                     break
                 if not subject:
                     # as a last resort, try to find any ascii word in the entire text
-                    m = re.search(r'([A-Za-z]{2,})', text)
+                    m = _RE_ASCII_WORD.search(text)
                     if m:
                         w = m.group(1).lower()
                         subject = EN_TO_JP_SIMPLE.get(w, 'これ')
                     else:
                         subject = 'これ'
-                comment = f'これ、{subject}っぽいね、かわいい〜'
-                if len(comment) > 40:
-                    comment = comment[:37] + '...'
-                return comment
+                return _clip_comment(f'これ、{subject}っぽいね、かわいい〜')
             except Exception:
-                return random.choice(fallback_comments)
+                return random.choice(_FALLBACK_COMMENTS)
 
         # produce comment with index to help uniqueness
         # Only attach a comment when score is positive; otherwise leave empty
@@ -215,40 +490,7 @@ def _score_with_keywords(query: str, candidates: List[Dict[str, Any]]) -> List[D
         out.append(cpy)
     out.sort(key=lambda x: x['score'], reverse=True)
     # ensure uniqueness of comments across returned list (for duplicated texts)
-    used_comments = set()
-    suffix_variants = ['ね、かわいい〜', 'だよ〜', 'かな〜', 'すごいね〜', 'だね〜']
-    def gen_imouto_comment_from_text(text: str) -> str:
-        try:
-            if not text:
-                return random.choice(fallback_comments)
-            first = text.split()[0]
-            comment = f'これ、{first}っぽいね、かわいい〜'
-            if len(comment) > 40:
-                comment = comment[:37] + '...'
-            return comment
-        except Exception:
-            return random.choice(fallback_comments)
-
-    def variant_comment(base: str, idx: int) -> str:
-        v = suffix_variants[idx % len(suffix_variants)]
-        cand = f"これ、{base}{v}"
-        return cand if len(cand) <= 40 else (cand[:37] + '...')
-
-    for idx, item in enumerate(out):
-        # Skip generating/adjusting comments for zero-score items
-        if (item.get('score') or 0.0) <= 0.0:
-            item['comment'] = ''
-            continue
-        c = (item.get('comment') or '').strip()
-        if not c:
-            item['comment'] = gen_imouto_comment_from_text(item.get('text',''))
-            c = item['comment']
-        # if duplicate comment, create a small variant
-        if c in used_comments:
-            base = (item.get('text') or '').split()[0] if item.get('text') else 'これ'
-            item['comment'] = variant_comment(base, idx)
-            c = item['comment']
-        used_comments.add(c)
+    _finalize_comments(out)
 
     # filter out very-low-score items
     filtered = [o for o in out if (o.get('score') or 0.0) > 0.02]
@@ -258,6 +500,128 @@ def _score_with_keywords(query: str, candidates: List[Dict[str, Any]]) -> List[D
     return filtered
 
 
+# LM ranking responses: key -> (timestamp, assistant text), oldest first
+_LM_CACHE: 'OrderedDict[str, tuple]' = OrderedDict()
+_LM_CACHE_LOCK = threading.Lock()
+_LM_CACHE_MAX = 256
+_LM_CACHE_TTL = 300  # seconds
+# Pooled keep-alive connections to the LM endpoint (one handshake per socket, not per call)
+_LM_SESSION = requests.Session()
+_LM_SESSION.headers.update({'Content-Type': 'application/json'})
+_LM_ADAPTER = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+_LM_SESSION.mount('http://', _LM_ADAPTER)
+_LM_SESSION.mount('https://', _LM_ADAPTER)
+# Large candidate sets are ranked in batches, sent concurrently
+_LM_BATCH_SIZE = 40
+_LM_MAX_WORKERS = 4
+
+
+def _merge_with_baseline(keyword_baseline: List[Dict[str, Any]], lm_items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keyword ordering/comments, taking positive LM scores (and comments where missing) by id."""
+    lm_by_id: Dict[Any, Dict[str, Any]] = {}
+    for x in lm_items:
+        # first occurrence wins, as with a linear search
+        lm_by_id.setdefault(x.get('id'), x)
+    merged = []
+    for kb in keyword_baseline:
+        it = dict(kb)
+        lm_item = lm_by_id.get(kb.get('id'))
+        if lm_item and (lm_item.get('score') or 0.0) > 0.0:
+            it['score'] = lm_item.get('score')
+        # keep kb comment if lm comment empty
+        if not it.get('comment') and lm_item:
+            it['comment'] = lm_item.get('comment') or ''
+        merged.append(it)
+    return merged
+
+
+# Debug dump of the last LM exchange; enable with GEOPLACE_DEBUG_LM=1
+_LM_DEBUG = os.environ.get('GEOPLACE_DEBUG_LM') == '1'
+_DEBUG_Q: 'queue.Queue[Dict[str, Any]]' = queue.Queue()
+_DEBUG_WRITER: Optional[threading.Thread] = None
+
+
+def _lm_debug_writer() -> None:
+    while True:
+        dump = _DEBUG_Q.get()
+        # only the newest dump matters; skip any that piled up behind it
+        while True:
+            try:
+                dump = _DEBUG_Q.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            if orjson is not None:
+                data = orjson.dumps(dump, option=orjson.OPT_INDENT_2)
+            else:
+                data = json.dumps(dump, ensure_ascii=False, indent=2).encode('utf-8')
+            dbg_dir = Path(CACHE_DIR)
+            dbg_dir.mkdir(parents=True, exist_ok=True)
+            dbg_path = dbg_dir / 'last_lm_parse_debug.json'
+            tmp = dbg_path.with_suffix('.json.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, dbg_path)
+        except Exception as e:
+            print('LM debug dump failed', e)
+
+
+def _queue_lm_debug(dump: Dict[str, Any]) -> None:
+    global _DEBUG_WRITER
+    if _DEBUG_WRITER is None:
+        with _LM_CACHE_LOCK:
+            if _DEBUG_WRITER is None:
+                _DEBUG_WRITER = threading.Thread(target=_lm_debug_writer, name='lm-debug-writer', daemon=True)
+                _DEBUG_WRITER.start()
+    _DEBUG_Q.put_nowait(dump)
+
+
+def clear_lm_cache() -> int:
+    """Drop all cached LM responses; returns the number of entries removed."""
+    with _LM_CACHE_LOCK:
+        n = len(_LM_CACHE)
+        _LM_CACHE.clear()
+    return n
+
+
+def _lmstudio_request(payload: Dict[str, Any], lm_url: str, headers: Dict[str, str]) -> str:
+    """POST payload to LMStudio and return the assistant text.
+
+    Identical payloads (same query, target and candidate set) are answered
+    from memory for _LM_CACHE_TTL seconds. Errors are raised, never cached.
+    """
+    body = _dumps(payload)
+    key = hashlib.blake2b(lm_url.encode('utf-8') + b'\n' + body, digest_size=16).hexdigest()
+    now = time.time()
+    with _LM_CACHE_LOCK:
+        hit = _LM_CACHE.get(key)
+        if hit is not None and now - hit[0] < _LM_CACHE_TTL:
+            _LM_CACHE.move_to_end(key)
+            return hit[1]
+
+    # send the already-encoded body (headers carry Content-Type: application/json)
+    r = _LM_SESSION.post(lm_url, headers=headers, data=body, timeout=10)
+    r.raise_for_status()
+    j = _loads(r.content)
+    # Try to extract assistant text -- adapt to LMStudio's response shape
+    assistant = ''
+    if isinstance(j, dict):
+        if 'choices' in j and isinstance(j['choices'], list) and j['choices']:
+            assistant = j['choices'][0].get('message', {}).get('content', '') or j['choices'][0].get('text','') or ''
+        elif 'output' in j:
+            assistant = j['output']
+        else:
+            assistant = json.dumps(j, ensure_ascii=False)
+    else:
+        assistant = str(j)
+
+    with _LM_CACHE_LOCK:
+        _LM_CACHE[key] = (now, assistant)
+        _LM_CACHE.move_to_end(key)
+        while len(_LM_CACHE) > _LM_CACHE_MAX:
+            _LM_CACHE.popitem(last=False)
+    return assistant
+
+
 def _call_lmstudio_chat(query: str, candidates: List[Dict[str, Any]], lm_url: str, lm_token: Optional[str], target: Optional[str] = None) -> List[Dict[str, Any]]:
     # Builds a chat-like prompt payload and asks LMStudio to rank or score candidates.
     # Because LMStudio APIs vary, we implement a lightweight "ask for similarity scores" approach.
@@ -268,11 +632,7 @@ def _call_lmstudio_chat(query: str, candidates: List[Dict[str, Any]], lm_url: st
     # Compose a single system + user message asking to rank candidates
     system = IMOUTO_SYSTEM_PROMPT
     # target-specific hint
-    target_hint = ''
-    if target == 'paint':
-        target_hint = '注: paint UI 用。comment は非常に短く（最大20文字）簡潔な妹口調でお願いします。'
-    elif target in ('world_new', 'world'):
-        target_hint = '注: world UI 用。comment は短め（10〜40文字）、場所の参照を含めても良いです。'
+    target_hint = _TARGET_HINTS.get(target, '')
 
     user_msg = (
         f"次の候補テキスト（英語で書かれていることがあります）を参照して、質問 '{query}' に類似している順に並べ、各候補に0.0から1.0の範囲でスコアを付けてください。"
@@ -289,74 +649,107 @@ def _call_lmstudio_chat(query: str, candidates: List[Dict[str, Any]], lm_url: st
     # Build candidate list string (truncate long texts)
     cand_texts = []
     for c in candidates:
-        txt = (c.get('text') or '')
-        if len(txt) > 400: txt = txt[:400] + '...'
+        txt = _candidate_text_400(c)
+        if len(c.get('text') or '') > 400: txt = txt + '...'
         cand_texts.append({'id': c.get('id'), 'text': txt})
 
-    payload = {
-        'model': 'gpt-4o-mini',
-        'messages': [
-            { 'role': 'system', 'content': system },
-            { 'role': 'user', 'content': user_msg + '\n\nCandidates:\n' + '\n'.join([f"[{i['id']}] {i['text']}" for i in cand_texts]) }
-        ],
-        'max_tokens': 512
-    }
-
-    try:
-        r = requests.post(lm_url, headers=headers, json=payload, timeout=10)
-        r.raise_for_status()
-        j = r.json()
-        # Try to extract assistant text -- adapt to LMStudio's response shape
-        assistant = ''
-        if isinstance(j, dict):
-            if 'choices' in j and isinstance(j['choices'], list) and j['choices']:
-                assistant = j['choices'][0].get('message', {}).get('content', '') or j['choices'][0].get('text','') or ''
-            elif 'output' in j:
-                assistant = j['output']
-            else:
-                assistant = json.dumps(j, ensure_ascii=False)
-        else:
-            assistant = str(j)
-
-        # Helper: strip code fences and language hints
-        def _strip_code_fences(s: str) -> str:
-            if not s:
-                return s
-            # remove leading/trailing ```json or ```
-            s = re.sub(r"^\s*```(?:json)?\s*", '', s, flags=re.I)
-            s = re.sub(r"\s*```\s*$", '', s)
+    # Helper: strip code fences and language hints
+    def _strip_code_fences(s: str) -> str:
+        if not s:
             return s
-
-        # Helper: find balanced JSON array substring from first '['
-        def _extract_json_array(s: str) -> Optional[str]:
-            if not s or '[' not in s:
-                return None
-            start = s.find('[')
-            depth = 0
-            for i in range(start, len(s)):
-                ch = s[i]
-                if ch == '[':
-                    depth += 1
-                elif ch == ']':
-                    depth -= 1
-                    if depth == 0:
-                        return s[start:i+1]
+        # remove leading/trailing ```json or ``` (plain slicing, no regex)
+        t = s.strip()
+        if t.startswith('```'):
+            t = t[7:] if t[3:7].lower() == 'json' else t[3:]
+        if t.endswith('```'):
+            t = t[:-3]
+        return t.strip()
+
+    # Helper: decode the JSON array starting at the first '[' (balanced scan runs in C)
+    def _parse_json_array(s: str) -> Optional[Any]:
+        start = s.find('[') if s else -1
+        if start < 0:
+            return None
+        if orjson is not None:
+            try:
+                return orjson.loads(s[start:])
+            except Exception:
+                pass
+        try:
+            obj, _end = _JSON_DECODER.raw_decode(s, start)
+            return obj
+        except ValueError:
             return None
 
-        import re
-        parsed = None
+    def _item_score(item: Any) -> float:
+        try:
+            return float(item.get('score') or 0.0)
+        except (TypeError, ValueError, AttributeError):
+            return 0.0
+
+    def _ask(batch: List[Dict[str, Any]]) -> Tuple[str, Optional[List[Any]]]:
+        """(reply, parsed JSON array) for one prompt over batch; ('', None) if the request failed."""
+        payload = {
+            'model': 'gpt-4o-mini',
+            'messages': [
+                { 'role': 'system', 'content': system },
+                { 'role': 'user', 'content': user_msg + '\n\nCandidates:\n' + '\n'.join([f"[{i['id']}] {i['text']}" for i in batch]) }
+            ],
+            'max_tokens': 512
+        }
+        try:
+            reply = _lmstudio_request(payload, lm_url, headers)
+        except Exception as e:
+            # network or API error: only this batch is lost
+            print('LMStudio call failed', e)
+            return '', None
         # try direct parse first
         try:
-            parsed = json.loads(assistant)
+            part = json.loads(reply)
         except Exception:
-            # strip common markdown fences and try to extract JSON array substring
-            txt = _strip_code_fences(assistant)
-            js_sub = _extract_json_array(txt)
-            if js_sub:
-                try:
-                    parsed = json.loads(js_sub)
-                except Exception:
-                    parsed = None
+            # strip common markdown fences and decode the embedded JSON array
+            part = _parse_json_array(_strip_code_fences(reply))
+        return reply, part if isinstance(part, list) else None
+
+    batches = [cand_texts[i:i + _LM_BATCH_SIZE] for i in range(0, len(cand_texts), _LM_BATCH_SIZE)] or [[]]
+
+    try:
+        if len(batches) == 1:
+            results = [_ask(batches[0])]
+        else:
+            # the requests only wait on the network, so threads overlap them
+            with ThreadPoolExecutor(max_workers=min(_LM_MAX_WORKERS, len(batches))) as ex:
+                results = list(ex.map(_ask, batches))
+        assistants = [reply for reply, _ in results]
+        # batches whose request failed or whose reply did not parse are skipped, not fatal
+        parts = [[it for it in part if isinstance(it, dict)] for _, part in results if part]
+
+        parsed = None
+        if len(parts) == 1:
+            parsed = parts[0]
+        elif parts:
+            parsed = [it for part in parts for it in part]
+            # each batch was scored by its own prompt, so scores across batches are not on
+            # one scale: re-rank the best of every batch together in one final prompt
+            per_batch = max(1, _LM_BATCH_SIZE // len(parts))
+            texts_by_id = {c['id']: c for c in cand_texts}
+            finalists = []
+            for part in parts:
+                for it in sorted(part, key=_item_score, reverse=True)[:per_batch]:
+                    if it.get('id') in texts_by_id:
+                        finalists.append(texts_by_id[it['id']])
+            reply, final = _ask(finalists) if finalists else ('', None)
+            final = [it for it in final or [] if isinstance(it, dict) and it.get('id') in texts_by_id]
+            if final:
+                assistants.append(reply)
+                final_ids = {it['id'] for it in final}
+                # the others rank below every finalist, in their own batch order
+                floor = min(_item_score(it) for it in final)
+                rest = [dict(it, score=min(_item_score(it), floor)) for it in parsed if it.get('id') not in final_ids]
+                parsed = final + rest
+            # else: the final prompt failed; keep the per-batch scores as the best available
+        assistant = '\n'.join(assistants)
+
         if parsed and isinstance(parsed, list):
             out = []
             idmap = {c['id']: c for c in candidates}
@@ -364,12 +757,11 @@ def _call_lmstudio_chat(query: str, candidates: List[Dict[str, Any]], lm_url: st
                 if not isinstance(item, dict):
                     continue
                 iid = item.get('id')
-                sc = item.get('score')
                 txt = item.get('text')
                 comment = item.get('comment') or item.get('comment_jp') or ''
                 # sanitize comment: normalize whitespace, remove newlines, limit length
                 try:
-                    comment = re.sub(r"\s+", ' ', (comment or '')).strip()
+                    comment = _RE_WS.sub(' ', (comment or '')).strip()
                     if len(comment) > 60:
                         comment = comment[:57] + '...'
                 except Exception:
@@ -379,7 +771,7 @@ def _call_lmstudio_chat(query: str, candidates: List[Dict[str, Any]], lm_url: st
                 base = idmap.get(iid, {})
                 out.append({
                     'id': iid,
-                    'score': float(sc) if sc is not None else 0.0,
+                    'score': _item_score(item),
                     'text': txt or base.get('text',''),
                     'coords': base.get('coords'),
                     'comment': comment
@@ -396,22 +788,9 @@ def _call_lmstudio_chat(query: str, candidates: List[Dict[str, Any]], lm_url: st
             kb_mean = sum((it.get('score') or 0.0) for it in keyword_baseline) / max(1, len(keyword_baseline))
             if lm_mean + 0.01 < kb_mean:
                 # merge: prefer keyword result ordering and comments, but retain LM scores when positive
-                merged = []
-                kb_map = {k['id']: k for k in keyword_baseline}
-                for kb in keyword_baseline:
-                    it = dict(kb)
-                    lm_item = next((x for x in out if x.get('id')==kb.get('id')), None)
-                    if lm_item and (lm_item.get('score') or 0.0) > 0.0:
-                        it['score'] = lm_item.get('score')
-                    # keep kb comment if lm comment empty
-                    if not it.get('comment') and lm_item:
-                        it['comment'] = lm_item.get('comment') or ''
-                    merged.append(it)
-                return merged
+                return _merge_with_baseline(keyword_baseline, out)
 
             # deduplicate by normalized text (keep first/highest score)
-            def _norm_text(s: str) -> str:
-                return re.sub(r"\s+", ' ', (s or '').strip().lower())
             seen = set()
             deduped = []
             for it in out:
@@ -422,94 +801,12 @@ def _call_lmstudio_chat(query: str, candidates: List[Dict[str, Any]], lm_url: st
                 deduped.append(it)
             out = deduped
 
-            # Clear comments for zero-score items so we don't attach imouto comments to non-matches
-            for it in out:
-                try:
-                    if (it.get('score') or 0.0) <= 0.0:
-                        it['comment'] = ''
-                except Exception:
-                    pass
-
-            # Ensure comment is Japanese imouto-style; if detected English-only, replace with a generated jp comment
-            def is_mostly_english(s: str) -> bool:
-                if not s: return False
-                letters = sum(1 for ch in s if 'a' <= ch.lower() <= 'z')
-                return letters > max(3, len(s) // 3)
-
-            def gen_imouto_comment(text: str) -> str:
-                try:
-                                if not text:
-                                    return 'ん〜分かんないけど探してみたよ〜'
-                                # prefer to avoid echoing technical style tokens like 'voxel-style' or 'style'
-                                toks = [t.strip('\"\'.,:;()') for t in text.split() if t.strip()]
-                                first = toks[0] if toks else ''
-                                low = first.lower()
-                                tech_tokens_local = ('voxel', 'voxel-style', 'style', 'low-poly', 'lowpoly', 'game-friendly', '3d', 'primary', 'colors', 'color', 'render', 'front', 'view', 'detail', 'details', 'large', 'small', 'size', 'game', 'friendly', 'texture', 'textures')
-                                # try to map common english nouns to japanese
-                                jp = EN_TO_JP_SIMPLE.get(low)
-                                if not jp:
-                                    # if token contains '-' like 'voxel-style', try last part
-                                    if '-' in low:
-                                        part = low.split('-')[-1]
-                                        jp = EN_TO_JP_SIMPLE.get(part)
-                                if jp:
-                                    subject = jp
-                                else:
-                                    # if token is a tech token or obviously non-noun, avoid echoing it
-                                    if re.match(r'^[a-z\-]+$', low) and any(tt in low for tt in tech_tokens_local):
-                                        subject = 'これ'
-                                    elif re.match(r'^[a-z\-]+$', low):
-                                        # ascii fallback
-                                        subject = low
-                                    else:
-                                        subject = first
-                                comment = f'これ、{subject}っぽいね、かわいい〜'
-                                if len(comment) > 40:
-                                    comment = comment[:37] + '...'
-                                return comment
-                except Exception:
-                    return '見つけたよ〜、すごいね〜'
-
-            # ensure uniqueness of comments across returned list
-            used_comments = set()
-            suffix_variants = ['ね、かわいい〜', 'だよ〜', 'かな〜', 'すごいね〜', 'だね〜']
-            def variant_comment(base: str, idx: int) -> str:
-                v = suffix_variants[idx % len(suffix_variants)]
-                cand = f"これ、{base}{v}"
-                return cand if len(cand) <= 40 else (cand[:37] + '...')
-
-            for idx, item in enumerate(out):
-                c = (item.get('comment') or '').strip()
-                if not c:
-                    item['comment'] = gen_imouto_comment(item.get('text',''))
-                    c = item['comment']
-                else:
-                    if is_mostly_english(c):
-                        item['comment'] = gen_imouto_comment(item.get('text',''))
-                        c = item['comment']
-                # if duplicate comment, create a small variant
-                if c in used_comments:
-                    base = (item.get('text') or '').split()[0] if item.get('text') else 'これ'
-                    item['comment'] = variant_comment(base, idx)
-                used_comments.add(item['comment'])
-            # If LM returned the exact same comment for all items, force index-based variants
-            try:
-                comments_set = set((it.get('comment') or '').strip() for it in out)
-                if len(comments_set) == 1 and len(out) > 1:
-                    for i, it in enumerate(out):
-                        base = (it.get('text') or '').split()[0] if it.get('text') else 'これ'
-                        it['comment'] = variant_comment(base, i)
-            except Exception:
-                pass
+            # Japanese imouto-style comments, unique per item; zero-score items get none
+            _finalize_comments(out, gen=_gen_imouto_comment, replace_english=True)
 
-            # persist debug dump to cache for inspection (utf-8)
-            try:
-                dbg_dir = Path(CACHE_DIR)
-                dbg_dir.mkdir(parents=True, exist_ok=True)
-                dbg_path = dbg_dir / 'last_lm_parse_debug.json'
-                dbg_path.write_text(json.dumps({'assistant_raw': assistant, 'parsed': parsed, 'final': out}, ensure_ascii=False, indent=2), encoding='utf-8')
-            except Exception:
-                pass
+            # persist debug dump to cache for inspection (opt-in, written off-thread)
+            if _LM_DEBUG:
+                _queue_lm_debug({'assistant_raw': assistant, 'parsed': parsed, 'final': [dict(it) for it in out]})
 
             return out
     except Exception as e:
@@ -520,6 +817,9 @@ def _call_lmstudio_chat(query: str, candidates: List[Dict[str, Any]], lm_url: st
 
 
 def search_similar(query: str, top_k: int = 5, lm_url: Optional[str] = None, lm_token: Optional[str] = None, target: Optional[str] = None) -> List[Dict[str, Any]]:
+    # nothing can match an empty query; skip the log scan and scoring entirely
+    if not query or not query.strip():
+        return []
     candidates = _build_candidates_from_logs()
     if not candidates:
         return []
@@ -556,18 +856,7 @@ def search_similar(query: str, top_k: int = 5, lm_url: Optional[str] = None, lm_
     # If LM average score is significantly worse than keyword baseline, prefer baseline
     if lm_mean + 0.01 < kb_mean:
         # Merge: prefer keyword ordering/comments but retain any positive LM scores for same ids
-        kb_map = {k['id']: k for k in keyword_baseline}
-        merged = []
-        for kb in keyword_baseline:
-            it = dict(kb)
-            lm_item = next((x for x in lm_out if x.get('id') == kb.get('id')), None)
-            if lm_item and (lm_item.get('score') or 0.0) > 0.0:
-                it['score'] = lm_item.get('score')
-            # keep kb comment if lm comment empty
-            if not it.get('comment') and lm_item:
-                it['comment'] = lm_item.get('comment') or ''
-            merged.append(it)
-        return merged[:top_k]
+        return _merge_with_baseline(keyword_baseline, lm_out)[:top_k]
 
     # Otherwise, prefer LM ordering but ensure comments are present (fallback to generated JP)
     out = lm_out
@@ -580,9 +869,6 @@ def search_similar(query: str, top_k: int = 5, lm_url: Optional[str] = None, lm_
             it['comment'] = ''
 
     # Deduplicate and filter very low-score items, keep at least one
-    def _norm_text(s: str) -> str:
-        return re.sub(r"\s+", ' ', (s or '').strip().lower())
-
     seen = set()
     deduped = []
     for it in out:
@@ -620,18 +906,12 @@ def format_for_lmstudio(query: str, candidates: List[Dict[str, Any]], rules: Opt
         rules = {}
     max_tokens = int(rules.get('max_tokens', 512))
 
-    system = (
-        IMOUTO_SYSTEM_PROMPT + '\n'
-        "出力は必ず JSON 配列のみで返してください。各要素は {id, score, text, comment} を含めてください。"
-    )
+    system = _FORMAT_SYSTEM_PROMPT
 
     # Add explicit translation instruction when query is non-latin or short
     translation_hint = ''
-    if len(query.strip()) <= 4 and any(ord(ch) > 127 for ch in query):
-        translation_hint = (
-            "注意: 入力クエリは日本語です。候補テキストは英語の場合があります。"
-            " クエリに合わせて候補の英語テキストを内部的に翻訳・照合してください。"
-        )
+    if len(query.strip()) <= 4 and not query.isascii():
+        translation_hint = _TRANSLATION_HINT
 
     user_msg = (
         f"次の候補を、質問 '{query}' に類似している順にスコア付けして返してください。"
@@ -639,7 +919,7 @@ def format_for_lmstudio(query: str, candidates: List[Dict[str, Any]], rules: Opt
         " comment は短い日本語（妹口調）で書いてください。\n"
         + translation_hint
         + "\nCandidates:\n"
-        + "\n".join([f"[{c.get('id')}] { (c.get('text') or '')[:400] }" for c in candidates])
+        + "\n".join([f"[{c.get('id')}] {_candidate_text_400(c)}" for c in candidates])
     )
 
     payload = {
@@ -8,24 +8,64 @@
 """
 from __future__ import annotations
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Dict
 import tempfile
 import subprocess
 import shutil
 import os
 from ..config import settings
+from ..fileutil import link_or_copy
+from ..inflight import InflightLocks
 import sys
 from datetime import datetime
 import traceback
 import time
 import json
+import base64
 import uuid
+import hashlib
+import functools
+import contextlib
+import threading
+import queue
+import atexit
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
 
 try:
     import trimesh
 except Exception:
     trimesh = None
 
+try:
+    # resolved once; export_glb takes a Scene or a bare Trimesh
+    from trimesh.exchange.gltf import export_glb as _GLB_EXPORT
+except Exception:
+    _GLB_EXPORT = None
+
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+try:
+    from multiprocessing import shared_memory
+except Exception:
+    shared_memory = None
+
+
+# map_Kd is the diffuse texture map; Blender expects this.
+_SIMPLE_MTL_TMPL = (
+    "newmtl {name}\n"
+    "Ka 1.000 1.000 1.000\n"
+    "Kd 1.000 1.000 1.000\n"
+    "Ks 0.000 0.000 0.000\n"
+    "d 1.0\n"
+    "illum 2\n"
+    "map_Kd {tex}\n"
+)
+
 
 def _write_simple_mtl(mtl_path: Path, tex_name: str, material_name: str = 'material_0') -> None:
     """Write a simple, Blender-friendly MTL referencing tex_name.
@@ -33,15 +73,7 @@ def _write_simple_mtl(mtl_path: Path, tex_name: str, material_name: str = 'mater
     Includes ambient/diffuse/specular coefficients, illum model and map_Kd.
     """
     try:
-        with open(mtl_path, 'w', encoding='utf-8') as mf:
-            mf.write(f"newmtl {material_name}\n")
-            mf.write("Ka 1.000 1.000 1.000\n")
-            mf.write("Kd 1.000 1.000 1.000\n")
-            mf.write("Ks 0.000 0.000 0.000\n")
-            mf.write("d 1.0\n")
-            mf.write("illum 2\n")
-            # map_Kd is the diffuse texture map; Blender expects this.
-            mf.write(f"map_Kd {tex_name}\n")
+        _write_bytes(mtl_path, _SIMPLE_MTL_TMPL.format(name=material_name, tex=tex_name).encode('utf-8'))
     except Exception:
         # Best-effort: ignore failures here; caller may handle logging.
         pass
@@ -64,24 +96,16 @@ def _ensure_uvs_in_obj(obj_path: Path) -> None:
 
     lines = txt.splitlines()
     verts = []
-    out_lines = []
-    in_vertex_block = True
-    # collect vertex lines and remember where to insert vt
-    for i, line in enumerate(lines):
-        if line.startswith('v '):
-            parts = line.split()
-            try:
-                x = float(parts[1]); y = float(parts[2]); z = float(parts[3])
-            except Exception:
-                x = y = z = 0.0
-            verts.append((x, y, z))
-            out_lines.append(line)
-        else:
-            # first non-vertex line -> mark end of vertex block
-            in_vertex_block = False
-            # append the rest as-is for now
-            out_lines.extend(lines[i:])
+    # collect the leading vertex block; vt lines go right after it
+    for line in lines:
+        if not line.startswith('v '):
             break
+        parts = line.split()
+        try:
+            x = float(parts[1]); y = float(parts[2]); z = float(parts[3])
+        except Exception:
+            x = y = z = 0.0
+        verts.append((x, y, z))
 
     if not verts:
         return
@@ -94,77 +118,29 @@ def _ensure_uvs_in_obj(obj_path: Path) -> None:
     dx = maxx - minx if maxx != minx else 1.0
     dy = maxy - miny if maxy != miny else 1.0
 
-    # build vt lines (1-based indexing matches vertex indices)
-    vt_lines = []
+    # Reconstruct file: vertex lines + vt lines (1-based, same indices as the
+    # vertices) + rest, with 'f a b c' rewritten to 'f a/a b/b c/c'
+    new_lines = lines[:len(verts)]
     for (x, y, z) in verts:
-        u = (x - minx) / dx
-        v = (y - miny) / dy
         # flip V to match many exporters' orientation preference
-        vt_lines.append(f"vt {u:.6f} {1.0 - v:.6f}")
-
-    # Now fix face lines in out_lines: replace 'f a b c' with 'f a/a b/b c/c'
-    fixed_lines = []
-    for line in out_lines:
-        if not line.startswith('f '):
-            fixed_lines.append(line)
-            continue
-        parts = line.split()
-        # parts[0] == 'f'
-        new_face_parts = ['f']
-        for p in parts[1:]:
-            # if already contains '/', leave as-is
-            if '/' in p:
-                new_face_parts.append(p)
-            else:
-                # assume p is an integer vertex index
-                try:
-                    vi = int(p)
-                    new_face_parts.append(f"{vi}/{vi}")
-                except Exception:
-                    new_face_parts.append(p)
-        fixed_lines.append(' '.join(new_face_parts))
-
-    # Reconstruct file: vertex lines + vt lines + rest (with fixed faces)
-    new_lines = []
-    # vertex lines are the first len(verts) lines in original
-    for i in range(len(verts)):
-        new_lines.append(lines[i])
-    # insert vt lines
-    new_lines.extend(vt_lines)
-    # append the remainder (skip the original vertex block)
-    remainder = lines[len(verts):]
-    # replace face lines in remainder with fixed versions where applicable
-    # We'll iterate through remainder and substitute face lines using an index
-    rem_idx = 0
-    for rl in remainder:
+        new_lines.append(f"vt {(x - minx) / dx:.6f} {1.0 - (y - miny) / dy:.6f}")
+    for rl in lines[len(verts):]:
         if rl.startswith('f '):
-            # pop from fixed_lines sequentially starting at first found face
-            # find next fixed face in fixed_lines
-            # search in fixed_lines for a face line not already consumed
-            # simplest: iterate fixed_lines and consume in order
-            # but to keep mapping simple, use the fixed_lines that correspond to remainder
-            # Build mapping by counting f-lines in remainder
-            break
-    # Simpler approach: rebuild remainder by transforming face lines on the fly
-    rebuilt_remainder = []
-    for rl in remainder:
-        if rl.startswith('f '):
-            parts = rl.split()
             new_face_parts = ['f']
-            for p in parts[1:]:
+            for p in rl.split()[1:]:
+                # if already contains '/', leave as-is
                 if '/' in p:
                     new_face_parts.append(p)
                 else:
+                    # assume p is an integer vertex index
                     try:
                         vi = int(p)
                         new_face_parts.append(f"{vi}/{vi}")
                     except Exception:
                         new_face_parts.append(p)
-            rebuilt_remainder.append(' '.join(new_face_parts))
+            new_lines.append(' '.join(new_face_parts))
         else:
-            rebuilt_remainder.append(rl)
-
-    new_lines.extend(rebuilt_remainder)
+            new_lines.append(rl)
 
     try:
         obj_path.write_text('\n'.join(new_lines), encoding='utf-8')
@@ -262,51 +238,578 @@ def _ensure_uv_count_matches_faces(obj_path: Path) -> None:
             pass
 
 
-def _find_glb_in_dir(d: Path) -> Optional[Path]:
-    # search recursively to handle cases where TripoSR writes into a nested folder (e.g. out/0/...)
-    for p in d.rglob('*.glb'):
-        return p
-    return None
+# textured-quad fallback: OBJ + MTL written whole (see generate_glb_from_image)
+_FALLBACK_MTL_TMPL = "newmtl fallback\nmap_Kd {tex}\n"
+_FALLBACK_OBJ_TMPL = (
+    "mtllib {mtl}\n"
+    "o fallback_quad\n"
+    "v -0.5 -0.5 0.0\nv 0.5 -0.5 0.0\nv 0.5 0.5 0.0\nv -0.5 0.5 0.0\n"
+    "vt 0 0\nvt 1 0\nvt 1 1\nvt 0 1\n"
+    "usemtl fallback\n"
+    "s off\n"
+    "f 1/1 2/2 3/3 4/4\n"
+)
+
+
+def _write_fallback_quad(obj_path: Path, out_path: Path, image_bytes: bytes, tex_src: Optional[Path] = None) -> Path:
+    """Write the textured-quad fallback: obj_path plus <stem>_fallback.mtl/.png next to out_path.
+
+    The texture is copied from tex_src when given (e.g. one TripoSR produced),
+    otherwise written from image_bytes.
+    """
+    mtl_name = out_path.stem + '_fallback.mtl'
+    tex_name = out_path.stem + '_fallback.png'
+    tex_out = out_path.parent / tex_name
+    if tex_src is not None:
+        try:
+            # tex_src lives in the scratch dir that is about to go away: a hardlink is enough
+            link_or_copy(tex_src, tex_out)
+        except Exception:
+            # if copy fails (maybe file vanished), write from the image bytes
+            tex_src = None
+    if tex_src is None:
+        _write_bytes(tex_out, image_bytes)
+    # MTL referencing the texture + OBJ with a single uv-mapped quad
+    _write_bytes(out_path.parent / mtl_name, _FALLBACK_MTL_TMPL.format(tex=tex_name).encode('utf-8'))
+    _write_bytes(obj_path, _FALLBACK_OBJ_TMPL.format(mtl=mtl_name).encode('utf-8'))
+    return obj_path
+
+
+def _move(src, dst) -> None:
+    """Move src -> dst, preferring a plain rename (same filesystem: no bytes copied)."""
+    try:
+        os.replace(str(src), str(dst))
+    except OSError:
+        shutil.move(str(src), str(dst))
+
+
+def _iter_files(d: Path):
+    """Yield os.DirEntry for every file under d (recursive, no Path objects, no extra stats)."""
+    stack = [str(d)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for e in it:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.is_file():
+                        yield e
+        except OSError:
+            continue
+
+
+# TripoSR's own file names, at the (flattened) root or in its out/0/ folder
+_KNOWN_OUTPUTS = {
+    '.glb': 'mesh.glb',
+    '.obj': 'mesh.obj',
+    '.ply': 'mesh.ply',
+    'tex': 'texture.png',
+}
+_TEX_SUFFIXES = ('.png', '.jpg', '.jpeg')
+
+
+def _index_outdir(d: Path) -> Dict[str, list]:
+    """One recursive scandir of d: lowercase suffix -> [Path, ...]; '*' lists every file."""
+    idx: Dict[str, list] = {'*': []}
+    for e in _iter_files(d):
+        p = Path(e.path)
+        idx['*'].append(p)
+        idx.setdefault(os.path.splitext(e.name)[1].lower(), []).append(p)
+    return idx
+
+
+def _find_outputs(d: Path, idx: Dict[str, list]) -> Dict[str, Optional[Path]]:
+    """First .glb / .obj / .ply / texture in idx, keyed '.glb', '.obj', '.ply', 'tex'.
+
+    TripoSR's own names (at d or its out/0/ folder) win over other matches.
+    """
+    found: Dict[str, Optional[Path]] = {}
+    for key, name in _KNOWN_OUTPUTS.items():
+        cands = [p for ext in (_TEX_SUFFIXES if key == 'tex' else (key,)) for p in idx.get(ext, ())]
+        known = [p for p in cands if p.name == name and p.parent in (d, d / '0')]
+        found[key] = (known or cands or [None])[0]
+    return found
 
 
 def _find_any_in_dir(d: Path, exts=('*.obj', '*.ply', '*.glb')) -> Optional[Path]:
-    """Find first file matching any of the provided glob patterns under directory d (recursive)."""
-    for ext in exts:
-        for p in d.rglob(ext):
-            return p
-    return None
+    """Find a file under d (recursive) matching exts; earlier patterns win.
 
+    One scandir walk for all patterns, stopping at the first match of the
+    first pattern (instead of one full rglob per pattern).
+    """
+    suffixes = [e.lstrip('*').lower() for e in exts]
+    best, rank = None, len(suffixes)
+    for e in _iter_files(d):
+        suffix = os.path.splitext(e.name)[1].lower()
+        if suffix in suffixes[:rank]:
+            best, rank = e.path, suffixes.index(suffix)
+            if rank == 0:
+                break
+    return Path(best) if best else None
 
-def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = 'light') -> Path:
+
+# TripoSR launches: no console window on Windows. close_fds=False skips the
+# per-spawn fd sweep; Python's own fds are non-inheritable anyway (PEP 446).
+_SPAWN_KW = {'close_fds': False, 'creationflags': getattr(subprocess, 'CREATE_NO_WINDOW', 0) if os.name == 'nt' else 0}
+
+
+_WORKER_SCRIPT = Path(__file__).resolve().parent / '_triposr_worker.py'
+# model load (first start may download weights) / no reply to any job for this long = wedged
+_WORKER_START_TIMEOUT = 600
+_WORKER_JOB_TIMEOUT = 600
+# after a failed start, requests go straight to run.py for this long before retrying
+_WORKER_RETRY_DELAY = 60
+
+
+class _TripoSRWorker:
+    """Long-lived TripoSR process (see _triposr_worker.py).
+
+    The interpreter, torch imports and model weights are paid once instead of
+    per request. Jobs are newline-delimited JSON over stdin/stdout, so this
+    works with a separate TRIPOSR_PYTHON venv and on Windows alike. Several
+    jobs may be in flight; the worker batches them and replies by job id.
+    """
+
+    def __init__(self, python_exec: str, cwd: Path):
+        self.python_exec = python_exec
+        self.cwd = cwd
+        self.proc: Optional[subprocess.Popen] = None
+        self.lock = threading.Lock()
+        # job id -> (process it was sent to, future for its reply)
+        self._pending: Dict[int, tuple] = {}
+        self._next_id = 0
+        self._retry_at = 0.0
+        # set while one caller starts the process outside the lock; others wait on it
+        self._starting: Optional[threading.Event] = None
+        self._starting_proc: Optional[subprocess.Popen] = None
+        # monotonic time of the running process's last reply (its liveness signal)
+        self._last_reply = 0.0
+
+    def _start(self) -> subprocess.Popen:
+        """Spawn the worker and wait for its ready message (called without self.lock)."""
+        logdir = settings.cache_path / 'triposr_logs'
+        logdir.mkdir(parents=True, exist_ok=True)
+        cmd = [self.python_exec, str(_WORKER_SCRIPT),
+               '--max-batch', str(int(getattr(settings, 'TRIPOSR_MAX_BATCH', 4))),
+               '--batch-wait-ms', str(int(getattr(settings, 'TRIPOSR_BATCH_WAIT_MS', 15))),
+               '--precision', str(getattr(settings, 'TRIPOSR_PRECISION', 'fp16'))]
+        if getattr(settings, 'TRIPOSR_COMPILE', True):
+            cmd.append('--compile')
+        # worker stderr (library output, tracebacks) is appended to one log file
+        with open(logdir / 'triposr_worker.log', 'ab') as errlog:
+            proc = subprocess.Popen(
+                cmd, cwd=str(self.cwd),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=errlog,
+                text=True, encoding='utf-8', bufsize=1, **_SPAWN_KW)
+        self._starting_proc = proc
+        ready_q: 'queue.Queue[Optional[dict]]' = queue.Queue()
+        threading.Thread(target=self._pump, args=(proc, ready_q), daemon=True).start()
+        try:
+            ready = ready_q.get(timeout=_WORKER_START_TIMEOUT)
+        except queue.Empty:
+            ready = None
+        if not ready or ready.get('status') != 'ready':
+            self._kill(proc)
+            raise RuntimeError(f"TripoSR worker failed to start: {(ready or {}).get('error', 'no ready message')}")
+        print('[TripoSR] worker ready on', ready.get('device'))
+        return proc
+
+    def _ensure_started(self) -> None:
+        """Make sure a worker process is running; the (slow) start happens outside self.lock."""
+        while True:
+            with self.lock:
+                if self.proc is not None and self.proc.poll() is None:
+                    return
+                starting = self._starting
+                if starting is None:
+                    if time.monotonic() < self._retry_at:
+                        raise RuntimeError('TripoSR worker failed to start recently; not retrying yet')
+                    starting = self._starting = threading.Event()
+                    owner = True
+                else:
+                    owner = False
+            if not owner:
+                # another caller is starting it; look again once it is done (it may have failed)
+                starting.wait(_WORKER_START_TIMEOUT + 5)
+                continue
+            try:
+                proc = self._start()
+            except Exception:
+                with self.lock:
+                    self._retry_at = time.monotonic() + _WORKER_RETRY_DELAY
+                    self._starting = self._starting_proc = None
+                starting.set()
+                raise
+            with self.lock:
+                self.proc, self._starting, self._starting_proc = proc, None, None
+                self._last_reply = time.monotonic()
+            starting.set()
+
+    def _pump(self, proc: subprocess.Popen, ready_q: 'queue.Queue[Optional[dict]]') -> None:
+        """Route worker replies to the waiting futures; fail them if the worker exits."""
+        for line in proc.stdout:
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            job_id = msg.get('id')
+            if job_id is None:
+                ready_q.put(msg)
+                continue
+            with self.lock:
+                entry = self._pending.pop(job_id, None)
+                if proc is self.proc:
+                    self._last_reply = time.monotonic()
+            if entry is not None:
+                entry[1].set_result(msg)
+        ready_q.put(None)
+        with self.lock:
+            orphaned = [k for k, (p, _) in self._pending.items() if p is proc]
+            futures = [self._pending.pop(k)[1] for k in orphaned]
+        for fut in futures:
+            fut.set_exception(RuntimeError('TripoSR worker exited'))
+
+    def run(self, job: dict, timeout: float = _WORKER_JOB_TIMEOUT) -> dict:
+        """Send job and wait for its reply.
+
+        timeout bounds the time without any reply from the worker, not this job's
+        own wait: a job queued behind other batches keeps waiting while the worker
+        answers them, and only a worker silent for a whole timeout is restarted.
+        """
+        fut: Future = Future()
+        self._ensure_started()
+        with self.lock:
+            proc = self.proc
+            try:
+                if proc is None:
+                    raise RuntimeError('TripoSR worker stopped')
+                self._next_id += 1
+                job = dict(job, id=self._next_id)
+                self._pending[job['id']] = (proc, fut)
+                proc.stdin.write(json.dumps(job) + '\n')
+                proc.stdin.flush()
+            except Exception:
+                self._pending.pop(job.get('id'), None)
+                if proc is not None and proc is self.proc:
+                    self._stop_locked()
+                raise
+        sent = time.monotonic()
+        while True:
+            try:
+                return fut.result(timeout=max(0.0, max(sent, self._last_reply) + timeout - time.monotonic()))
+            except FutureTimeout:
+                with self.lock:
+                    if proc is self.proc and max(sent, self._last_reply) + timeout > time.monotonic():
+                        # the worker answered other jobs meanwhile: still working through the queue
+                        continue
+                    self._pending.pop(job['id'], None)
+                    if proc is self.proc:
+                        # no reply to any job for a whole timeout: wedged, restart it
+                        self._stop_locked()
+                raise
+
+    @staticmethod
+    def _kill(proc: subprocess.Popen) -> None:
+        try:
+            proc.kill()
+            proc.wait(timeout=5)
+        except Exception:
+            pass
+
+    def _stop_locked(self) -> None:
+        proc, self.proc = self.proc, None
+        if proc is not None:
+            self._kill(proc)
+
+    def stop(self) -> None:
+        with self.lock:
+            self._stop_locked()
+            starting = self._starting_proc
+        # a start in progress fails its ready wait and records the failure itself
+        if starting is not None:
+            self._kill(starting)
+
+
+_WORKER: Optional[_TripoSRWorker] = None
+_WORKER_LOCK = threading.Lock()
+
+
+def _get_worker(python_exec: str, triposr_dir: Path) -> _TripoSRWorker:
+    global _WORKER
+    with _WORKER_LOCK:
+        if _WORKER is not None and (_WORKER.python_exec, _WORKER.cwd) != (python_exec, triposr_dir):
+            _WORKER.stop()
+            _WORKER = None
+        if _WORKER is None:
+            _WORKER = _TripoSRWorker(python_exec, triposr_dir)
+        return _WORKER
+
+
+@atexit.register
+def _stop_worker() -> None:
+    if _WORKER is not None:
+        _WORKER.stop()
+
+
+def _write_bytes(path: Path, *chunks: bytes) -> None:
+    """Write chunks to path with unbuffered os-level writes.
+
+    On POSIX a single os.writev hands the caller's buffers straight to the
+    kernel (no copy into a BufferedWriter); elsewhere plain open() is used.
+    """
+    if os.name != 'posix':
+        with open(path, 'wb') as f:
+            for c in chunks:
+                f.write(c)
+        return
+    fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        views = [memoryview(c) for c in chunks if c]
+        while views:
+            n = os.writev(fd, views)
+            # short writes are allowed: drop what went out and retry the rest
+            while views and n >= len(views[0]):
+                n -= len(views.pop(0))
+            if views and n:
+                views[0] = views[0][n:]
+    finally:
+        os.close(fd)
+
+
+def _write_input(inp: Path, image_bytes: bytes) -> None:
+    if not inp.exists():
+        _write_bytes(inp, image_bytes)
+
+
+def _pixels_to_shm(image_bytes: bytes):
+    """Decode image_bytes once and copy the raw pixels into shared memory.
+
+    Returns (SharedMemory, job fields) or None when the bytes cannot be decoded.
+    The caller owns the block and must close/unlink it after the worker replies.
+    """
+    if Image is None or shared_memory is None:
+        return None
+    try:
+        img = Image.open(BytesIO(image_bytes))
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if ('A' in img.getbands() or 'transparency' in img.info) else 'RGB')
+        data = img.tobytes()
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    except Exception:
+        return None
+    shm.buf[:len(data)] = data
+    return shm, {'shm': shm.name, 'size': list(img.size), 'mode': img.mode}
+
+
+def _run_in_worker(python_exec: str, triposr_dir: Path, image_bytes: bytes, outdir: Path, fmt: str, bake: bool) -> subprocess.CompletedProcess:
+    """Run one job on the persistent worker, shaped like subprocess.run's result.
+
+    Pixels travel through shared memory; when they cannot be decoded here (or
+    shared memory is unavailable) the encoded bytes go inline over the worker's
+    stdin. No input file is written either way.
+    """
+    job = {'output_dir': str(outdir), 'format': fmt, 'bake_texture': bool(bake)}
+    shm_entry = _pixels_to_shm(image_bytes)
+    if shm_entry is not None:
+        job.update(shm_entry[1])
+    else:
+        job['data'] = base64.b64encode(image_bytes).decode('ascii')
+    try:
+        msg = _get_worker(python_exec, triposr_dir).run(job)
+    finally:
+        if shm_entry is not None:
+            shm_entry[0].close()
+            try:
+                shm_entry[0].unlink()
+            except Exception:
+                pass
+    ok = msg.get('status') == 'ok'
+    # bytes, like a binary subprocess capture: written to the log as-is
+    logged = {k: (f'<{len(v)} chars>' if k == 'data' else v) for k, v in job.items()}
+    stdout = (f"worker job: {logged}\nworker reply: {json.dumps(msg)}\n" + (msg.get('trace') or '')).encode('utf-8')
+    return subprocess.CompletedProcess([python_exec, str(_WORKER_SCRIPT)], 0 if ok else 1, stdout=stdout)
+
+
+def _convert_to_glb(source_path: str) -> bytes:
+    """Load a mesh file with trimesh and return GLB bytes (runs in _CONV_POOL)."""
+    # TripoSR's mesh already has clean topology: skip trimesh's merge/normals pass.
+    # A single mesh exports to GLB as-is; anything else still goes through a scene
+    # so materials/textures are preserved.
+    loaded = trimesh.load(source_path, process=False)
+    if not isinstance(loaded, (trimesh.Trimesh, trimesh.Scene)):
+        loaded = trimesh.Scene(loaded)
+    if _GLB_EXPORT is not None:
+        return _GLB_EXPORT(loaded)
+    return loaded.export(file_type='glb')
+
+
+def _convert_to_obj(source_path: str) -> bytes:
+    """Load a GLB with trimesh and return OBJ bytes (runs in _CONV_POOL)."""
+    obj = trimesh.load(source_path).export(file_type='obj')
+    # trimesh returns str for obj
+    return obj.encode('utf-8') if isinstance(obj, str) else obj
+
+
+def _warm_converter() -> None:
+    """Pool initializer: pay for the trimesh import and PLY loader setup before the first job."""
+    if trimesh is None:
+        return
+    try:
+        trimesh.load(BytesIO(b'ply\nformat ascii 1.0\nelement vertex 0\nend_header\n'), file_type='ply')
+    except Exception:
+        pass
+
+
+_CONV_POOL: Optional[ProcessPoolExecutor] = None
+_CONV_POOL_LOCK = threading.Lock()
+
+
+def _convert_off_thread(convert, source_path: str) -> bytes:
+    """Run convert (_convert_to_glb / _convert_to_obj) in a worker process so the
+    CPU-heavy load/export does not hold this process's GIL; falls back to
+    converting in-process."""
+    global _CONV_POOL
+    with _CONV_POOL_LOCK:
+        if _CONV_POOL is None:
+            try:
+                _CONV_POOL = ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2), initializer=_warm_converter)
+            except Exception:
+                _CONV_POOL = None
+        pool = _CONV_POOL
+    if pool is not None:
+        try:
+            return pool.submit(convert, source_path).result()
+        except BrokenProcessPool as e:
+            # a pool process died (or could not start): drop the pool, convert here this time
+            print('[TripoSR] conversion pool failed, converting in-process:', e)
+            with _CONV_POOL_LOCK:
+                if _CONV_POOL is pool:
+                    _CONV_POOL = None
+            pool.shutdown(wait=False)
+    return convert(source_path)
+
+
+def _run_logged(cmd: list, cwd: Path, logpath: Path, header: str) -> subprocess.CompletedProcess:
+    """Run cmd with stdout/stderr going straight into logpath (binary, nothing buffered here).
+
+    The log can be followed live (tail -f) while run.py works.
+    """
+    # unbuffered so the log really is live. No -S/-I: run.py needs the
+    # site-packages (and PYTHONPATH) of TRIPOSR_PYTHON's environment.
+    env = {**os.environ, 'PYTHONUNBUFFERED': '1'}
+    try:
+        lf = open(logpath, 'wb')
+    except Exception:
+        lf = None
+    try:
+        if lf is not None:
+            lf.write(header.encode('utf-8') + b'\n')
+            lf.flush()
+        proc = subprocess.Popen(cmd, cwd=str(cwd), stdout=lf if lf is not None else subprocess.DEVNULL,
+                                stderr=subprocess.STDOUT, env=env, **_SPAWN_KW)
+        proc.wait()
+        if lf is not None:
+            lf.write(f"\nreturncode: {proc.returncode}\n".encode('utf-8'))
+    finally:
+        if lf is not None:
+            lf.close()
+    return subprocess.CompletedProcess(cmd, proc.returncode)
+
+
+_GLB_OPTIMIZE_TIMEOUT = 120
+
+
+def _optimize_glb(glb_path: Path, logpath: Path) -> None:
+    """Rewrite glb_path in place with `gltf-transform optimize` (meshopt geometry, WebP textures).
+
+    Only when GLB_OPTIMIZE is on and the CLI is installed; the viewer then needs
+    a meshopt decoder (three.js: GLTFLoader.setMeshoptDecoder). Any failure keeps
+    the original file.
+    """
+    if not getattr(settings, 'GLB_OPTIMIZE', False):
+        return
+    exe = shutil.which(getattr(settings, 'GLB_OPTIMIZE_CMD', None) or 'gltf-transform')
+    if exe is None:
+        print('[TripoSR] GLB_OPTIMIZE is on but gltf-transform was not found; skipping')
+        return
+    # gltf-transform picks the output format from the extension: keep .glb last
+    tmp = glb_path.with_name(f'{glb_path.stem}.opt-{uuid.uuid4().hex[:8]}.glb')
+    cmd = [exe, 'optimize', str(glb_path), str(tmp), '--compress', 'meshopt', '--texture-compress', 'webp']
+    try:
+        with open(logpath, 'ab') as lf:
+            lf.write(f"\nGLB optimize: {' '.join(cmd)}\n".encode('utf-8'))
+            lf.flush()
+            res = subprocess.run(cmd, stdout=lf, stderr=subprocess.STDOUT, timeout=_GLB_OPTIMIZE_TIMEOUT, **_SPAWN_KW)
+        if res.returncode == 0 and tmp.is_file() and tmp.stat().st_size > 0:
+            os.replace(str(tmp), str(glb_path))
+    except Exception as e:
+        print('[TripoSR] GLB optimize failed, keeping the original:', e)
+    finally:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+
+
+@functools.lru_cache(maxsize=4)
+def _triposr_launch(triposr_dir_setting, triposr_py_setting: str, python_exec: str, fmt: str, bake: bool):
+    """Validate TRIPOSR_DIR and build the fixed parts of the run.py command.
+
+    Returns (triposr_dir, cmd_head, cmd_tail); the per-request arguments go
+    between head and tail. A missing directory raises and is not cached, so
+    fixing config.yaml takes effect on the next request.
+    """
+    # read TripoSR path from Settings
+    try:
+        triposr_dir = Path(triposr_dir_setting)
+    except Exception:
+        triposr_dir = None
+
+    if not triposr_dir or not triposr_dir.exists():
+        raise FileNotFoundError(f'TripoSR directory not found; check TRIPOSR_DIR in backend/config.yaml (tried: {triposr_dir})')
+
+    triposr_py = triposr_dir / (triposr_py_setting or 'run.py')
+    if not triposr_py.exists():
+        # maybe entry is just filename in dir
+        triposr_py = triposr_dir / 'run.py'
+    cmd_tail = ('--model-save-format', fmt)
+    # optionally pass bake-texture
+    if bake:
+        cmd_tail += ('--bake-texture',)
+    return triposr_dir, (python_exec, str(triposr_py)), cmd_tail
+
+
+def _generate(image_bytes: bytes, out_path: Path, quality: str, produced: dict) -> Path:
+    """Run TripoSR and install its result; sets produced['ok'] when a real mesh (not a fallback) is returned."""
     out_path.parent.mkdir(parents=True, exist_ok=True)
     # write image to temp file
-    with tempfile.TemporaryDirectory() as td:
+    # keep the scratch dir on the cache filesystem so moving results out is a rename,
+    # unless TRIPOSR_TMP_DIR points somewhere else (e.g. /dev/shm)
+    # settings are read once per request, so a config change mid-request cannot mix two configurations
+    cache_root = settings.cache_path
+    scratch_root = Path(getattr(settings, 'TRIPOSR_TMP_DIR', None) or cache_root / 'tmp')
+    try:
+        scratch_root.mkdir(parents=True, exist_ok=True)
+    except Exception:
+        scratch_root = None
+    with tempfile.TemporaryDirectory(dir=str(scratch_root) if scratch_root else None) as td, \
+            contextlib.ExitStack() as stack:
         td_path = Path(td)
         inp = td_path / 'input.png'
         # keep a copy of original bytes in memory in case external processes
         # remove the temporary file while we're still working
         orig_image_bytes = image_bytes
-        with open(inp, 'wb') as f:
-            f.write(orig_image_bytes)
+        # the persistent worker takes decoded pixels via shared memory; the PNG is
+        # written only for the run.py subprocess path (see _write_input below)
+        use_worker = getattr(settings, 'TRIPOSR_MODE', 'worker') != 'subprocess'
+        if not use_worker:
+            _write_input(inp, orig_image_bytes)
 
         # prepare output dir
         outdir = td_path / 'out'
         outdir.mkdir()
 
-        # build command
-        # read TripoSR path from Settings
-        try:
-            triposr_dir = Path(settings.TRIPOSR_DIR)
-        except Exception:
-            triposr_dir = None
-
-        if not triposr_dir or not triposr_dir.exists():
-            raise FileNotFoundError(f'TripoSR directory not found; check TRIPOSR_DIR in backend/config.yaml (tried: {triposr_dir})')
-
-        triposr_py = triposr_dir / getattr(settings, 'TRIPOSR_PY', 'run.py')
-        if not triposr_py.exists():
-            # maybe entry is just filename in dir
-            triposr_py = triposr_dir / 'run.py'
+        # build command (paths / fixed arguments are resolved once, see _triposr_launch)
         # Choose which Python executable to use to run TripoSR.
         # By default we use the current interpreter, but administrators can set
         # `TRIPOSR_PYTHON` in `backend/config.yaml` to point to a dedicated venv's
@@ -314,318 +817,209 @@ def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = '
         # allow selecting output format via settings (e.g. 'glb' or 'obj')
         fmt = getattr(settings, 'TRIPOSR_OUTPUT_FORMAT', 'glb')
         python_exec = getattr(settings, 'TRIPOSR_PYTHON', None) or sys.executable
-        cmd = [
-            python_exec, str(triposr_py), str(inp),
-            '--output-dir', str(outdir),
-            '--model-save-format', fmt
-        ]
-        # optionally pass bake-texture
         bake = getattr(settings, 'TRIPOSR_BAKE_TEXTURE', True)
-        if bake:
-            cmd.append('--bake-texture')
+        triposr_dir, cmd_head, cmd_tail = _triposr_launch(
+            getattr(settings, 'TRIPOSR_DIR', None), getattr(settings, 'TRIPOSR_PY', 'run.py'), python_exec, fmt, bool(bake))
+        cmd = [*cmd_head, str(inp), '--output-dir', str(outdir), *cmd_tail]
 
         # run
         try:
-            # capture output for debugging
-            res = subprocess.run(cmd, cwd=str(triposr_dir), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
             # Always write an invocation log (success or failure) containing the command,
             # python executable used, cwd, returncode and stdout. This helps diagnose
             # cases where TripoSR silently exits without producing outputs.
-            logdir = settings.cache_path / 'triposr_logs'
+            logdir = cache_root / 'triposr_logs'
             logdir.mkdir(parents=True, exist_ok=True)
-            ts = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+            # suffix keeps logs/snapshots of jobs finishing in the same second apart
+            ts = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ') + '_' + uuid.uuid4().hex[:6]
             logpath = logdir / f'triposr_{ts}.log'
-            try:
-                with open(logpath, 'w', encoding='utf-8') as lf:
-                    lf.write(f"command: {cmd}\n")
-                    lf.write(f"python_exec: {python_exec}\n")
-                    lf.write(f"cwd: {triposr_dir}\n")
-                    lf.write(f"returncode: {res.returncode}\n\n")
-                    lf.write(res.stdout or '')
-            except Exception:
-                # If logging the stdout fails, still continue to handle the result below.
-                pass
-
-            # Add debug output listing to help diagnose missing file issues
-            debug_files = []
-            for p in outdir.rglob('*'):
-                if p.is_file():
-                    debug_files.append(f"{p.relative_to(outdir)} ({p.stat().st_size} bytes)")
-            debug_msg = f"TripoSR outdir contents: {debug_files}" if debug_files else "TripoSR outdir is empty"
-            try:
-                with open(logpath, 'a', encoding='utf-8') as lf:
-                    lf.write(f"\n{debug_msg}\n")
-            except Exception:
-                pass
-
-            # Persist a snapshot of the outdir for offline debugging (copy tree)
-            try:
-                debug_snapshot_dir = settings.cache_path / 'triposr_debug' / ts
-                if debug_snapshot_dir.exists():
-                    # ensure unique
-                    debug_snapshot_dir = settings.cache_path / 'triposr_debug' / (ts + '_2')
-                shutil.copytree(str(outdir), str(debug_snapshot_dir))
+            header = f"command: {cmd}\npython_exec: {python_exec}\ncwd: {triposr_dir}\n"
+            res = None
+            if use_worker:
                 try:
-                    with open(logpath, 'a', encoding='utf-8') as lf:
-                        lf.write(f"Snapshot of TripoSR outdir copied to: {debug_snapshot_dir}\n")
-                except Exception:
-                    pass
-                # Prefer searching the persisted snapshot if copy succeeded. This
-                # avoids race conditions where the original temporary outdir is
-                # cleaned up or its contents are transient. We'll switch the
-                # working outdir reference to the snapshot for subsequent
-                # discovery and copying logic.
+                    res = _run_in_worker(python_exec, triposr_dir, orig_image_bytes, outdir, fmt, bake)
+                except Exception as e:
+                    print('[TripoSR] worker unavailable, falling back to run.py subprocess:', e)
+            if res is None:
+                _write_input(inp, orig_image_bytes)
+                res = _run_logged(cmd, triposr_dir, logpath, header)
+            else:
                 try:
-                    outdir = debug_snapshot_dir
-                    with open(logpath, 'a', encoding='utf-8') as lf:
-                        lf.write(f"Switched discovery root to snapshot dir: {outdir}\n")
+                    _write_bytes(logpath, f"{header}returncode: {res.returncode}\n\n".encode('utf-8'), res.stdout or b'')
                 except Exception:
+                    # If logging the stdout fails, still continue to handle the result below.
                     pass
-                # If TripoSR wrote outputs into a nested numeric folder (e.g. out/0/*),
-                # flatten those files into the snapshot root to make discovery simpler
+            # everything logged from here on goes through one buffered handle (closed with the scratch dir)
+            try:
+                lf = stack.enter_context(open(logpath, 'a', encoding='utf-8', errors='replace', buffering=1 << 16))
+            except OSError:
+                lf = stack.enter_context(open(os.devnull, 'w'))
+
+            # Optionally persist a snapshot of the outdir for offline debugging (copy tree);
+            # without it, discovery below runs on the scratch outdir itself
+            if getattr(settings, 'TRIPOSR_DEBUG_SNAPSHOT', False):
                 try:
-                    # look for single-directory nests (common pattern: '0')
-                    children = [p for p in outdir.iterdir() if p.is_dir()]
-                    if len(children) == 1:
-                        nested = children[0]
-                        moved = []
-                        for p in nested.rglob('*'):
-                            if p.is_file():
-                                dest = outdir / p.name
-                                # avoid overwriting; if exists, prefix with subdir name
-                                if dest.exists():
-                                    dest = outdir / (nested.name + '_' + p.name)
-                                try:
-                                    shutil.move(str(p), str(dest))
-                                    moved.append((str(p), str(dest)))
-                                except Exception:
-                                    try:
-                                        shutil.copy(str(p), str(dest))
-                                        moved.append((str(p), str(dest)))
-                                    except Exception:
-                                        pass
-                        # attempt to remove the now-empty nested dir
+                    debug_snapshot_dir = cache_root / 'triposr_debug' / ts
+                    if debug_snapshot_dir.exists():
+                        # ensure unique
+                        debug_snapshot_dir = cache_root / 'triposr_debug' / (ts + '_2')
+                    shutil.copytree(str(outdir), str(debug_snapshot_dir))
+                    lf.write(f"Snapshot of TripoSR outdir copied to: {debug_snapshot_dir}\n")
+                    # Prefer searching the persisted snapshot if copy succeeded. This
+                    # avoids race conditions where the original temporary outdir is
+                    # cleaned up or its contents are transient. We'll switch the
+                    # working outdir reference to the snapshot for subsequent
+                    # discovery and copying logic.
+                    try:
+                        outdir = debug_snapshot_dir
+                        lf.write(f"Switched discovery root to snapshot dir: {outdir}\n")
+                    except Exception:
+                        pass
+                except Exception as e:
+                    lf.write(f"Failed to snapshot outdir: {e}\n{traceback.format_exc()}\n")
+
+            # If TripoSR wrote outputs into a nested numeric folder (e.g. out/0/*),
+            # flatten those files into the discovery root to make discovery simpler
+            try:
+                # look for single-directory nests (common pattern: '0')
+                children = [p for p in outdir.iterdir() if p.is_dir()]
+                if len(children) == 1:
+                    nested = children[0]
+                    moved = []
+                    for e in list(_iter_files(nested)):
+                        p = Path(e.path)
+                        dest = outdir / p.name
+                        # avoid overwriting; if exists, prefix with subdir name
+                        if dest.exists():
+                            dest = outdir / (nested.name + '_' + p.name)
                         try:
-                            nested.rmdir()
+                            _move(p, dest)
+                            moved.append((str(p), str(dest)))
                         except Exception:
-                            pass
-                        if moved:
                             try:
-                                with open(logpath, 'a', encoding='utf-8') as lf:
-                                    lf.write(f"Flattened snapshot: moved {moved}\n")
+                                shutil.copyfile(str(p), str(dest))
+                                moved.append((str(p), str(dest)))
                             except Exception:
                                 pass
-                except Exception:
+                    # attempt to remove the now-empty nested dir
                     try:
-                        with open(logpath, 'a', encoding='utf-8') as lf:
-                            lf.write(f"Failed to flatten snapshot dir {outdir}: {traceback.format_exc()}\n")
+                        nested.rmdir()
                     except Exception:
                         pass
-            except Exception as e:
+                    if moved:
+                        lf.write(f"Flattened outdir: moved {moved}\n")
+            except Exception:
+                lf.write(f"Failed to flatten outdir {outdir}: {traceback.format_exc()}\n")
+
+            # one recursive scandir of the (flattened) outdir serves the listing below and all discovery
+            idx = _index_outdir(outdir)
+            # Add debug output listing to help diagnose missing file issues
+            debug_files = []
+            for p in idx['*']:
                 try:
-                    with open(logpath, 'a', encoding='utf-8') as lf:
-                        lf.write(f"Failed to snapshot outdir: {e}\n{traceback.format_exc()}\n")
-                except Exception:
+                    debug_files.append(f"{p.relative_to(outdir)} ({p.stat().st_size} bytes)")
+                except OSError:
                     pass
+            debug_msg = f"TripoSR outdir contents: {debug_files}" if debug_files else "TripoSR outdir is empty"
+            lf.write(f"\n{debug_msg}\n")
 
             if res.returncode != 0:
                 # Fall back: TripoSR failed (missing deps).
                 # Create a minimal placeholder in the requested output format.
                 if fmt == 'obj':
-                    # Create a simple textured quad OBJ as a usable fallback.
-                    obj_name = out_path.stem + '_fallback.obj'
-                    obj_path = out_path.parent / obj_name
-                    mtl_name = out_path.stem + '_fallback.mtl'
-                    mtl_path = out_path.parent / mtl_name
-                    tex_name = out_path.stem + '_fallback.png'
-                    tex_path = out_path.parent / tex_name
-                    # write texture (prefer any texture produced by TripoSR,
-                    # otherwise fall back to the original image bytes)
-                    try:
-                        if inp.exists():
-                            tex_path.write_bytes(inp.read_bytes())
-                        else:
-                            tex_path.write_bytes(orig_image_bytes)
-                    except Exception:
-                        # last resort: write orig bytes
-                        tex_path.write_bytes(orig_image_bytes)
-                    # write MTL referencing the texture
-                    with open(mtl_path, 'w', encoding='utf-8') as mf:
-                        mf.write(f"newmtl fallback\nmap_Kd {tex_name}\n")
-                    # write OBJ: a single quad with uv coords
-                    with open(obj_path, 'w', encoding='utf-8') as of:
-                        of.write(f"mtllib {mtl_name}\n")
-                        of.write("o fallback_quad\n")
-                        # vertices
-                        of.write("v -0.5 -0.5 0.0\n")
-                        of.write("v 0.5 -0.5 0.0\n")
-                        of.write("v 0.5 0.5 0.0\n")
-                        of.write("v -0.5 0.5 0.0\n")
-                        # uvs
-                        of.write("vt 0 0\n")
-                        of.write("vt 1 0\n")
-                        of.write("vt 1 1\n")
-                        of.write("vt 0 1\n")
-                        of.write("usemtl fallback\n")
-                        of.write("s off\n")
-                        of.write("f 1/1 2/2 3/3 4/4\n")
-                    # move to expected out_path (with .obj extension)
-                    final_obj = out_path.with_suffix('.obj')
-                    shutil.move(str(obj_path), str(final_obj))
-                    # ensure texture and mtl are present next to final_obj
-                    shutil.move(str(mtl_path), str(out_path.parent / mtl_name))
-                    shutil.move(str(tex_path), str(out_path.parent / tex_name))
-                    return final_obj
+                    # Create a simple textured quad OBJ as a usable fallback,
+                    # straight at the expected out_path (with .obj extension)
+                    # run.py's input.png already holds these bytes: link it rather than write them again
+                    return _write_fallback_quad(out_path.with_suffix('.obj'), out_path, orig_image_bytes,
+                                                tex_src=inp if inp.is_file() else None)
                 else:
-                    placeholder = out_path.parent / (out_path.stem + '_fallback.glb')
-                    with open(placeholder, 'wb') as f:
-                        f.write(b'GLB_FALLBACK_PLACEHOLDER\n')
-                        f.write(b'PROMPT_IMAGE_PNG:\n')
-                        with open(inp, 'rb') as ib:
-                            f.write(ib.read())
-                    shutil.move(str(placeholder), str(out_path))
+                    _write_bytes(out_path, b'GLB_FALLBACK_PLACEHOLDER\n', b'PROMPT_IMAGE_PNG:\n', orig_image_bytes)
                     return out_path
         except FileNotFoundError as e:
             # very unlikely since we use sys.executable, but handle defensively
-            logdir = settings.cache_path / 'triposr_logs'
+            logdir = cache_root / 'triposr_logs'
             logdir.mkdir(parents=True, exist_ok=True)
             ts = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
             logpath = logdir / f'triposr_missing_{ts}.log'
             with open(logpath, 'w', encoding='utf-8') as lf:
                 lf.write(str(e))
-            # create fallback placeholder
-            placeholder = out_path.parent / (out_path.stem + '_fallback_nopython.glb')
-            with open(placeholder, 'wb') as f:
-                f.write(b'GLB_FALLBACK_NO_PYTHON\n')
-            shutil.move(str(placeholder), str(out_path))
+            # create fallback placeholder (the marker line tells the fallback kind)
+            _write_bytes(out_path, b'GLB_FALLBACK_NO_PYTHON\n')
             return out_path
 
+        # discover/install outputs while the scratch dir still exists
+        result = _collect_outputs(outdir, idx, out_path, orig_image_bytes, fmt, lf, ts, produced)
+    if produced.get('ok') and result.suffix.lower() == '.glb':
+        # before the result cache stores it, so cache hits are served optimized too
+        _optimize_glb(result, logpath)
+    return result
+
+
+def _collect_outputs(outdir: Path, idx: Dict[str, list], out_path: Path, orig_image_bytes: bytes, fmt: str,
+                     lf, ts: str, produced: dict) -> Path:
+    """Find TripoSR's output under outdir (idx: its _index_outdir) and install it next to out_path (or write a fallback).
+
+    fmt is the TRIPOSR_OUTPUT_FORMAT TripoSR was run with; lf is the request's open TripoSR log.
+    """
     # find any outputs in the outdir (search recursively)
-    found = _find_glb_in_dir(outdir)
+    outputs = _find_outputs(outdir, idx)
+    found = outputs['.glb']
     
     # Debug: log what files we're looking for and what we found
-    try:
-        with open(logpath, 'a', encoding='utf-8') as lf:
-            lf.write(f"\nSearching for GLB: found={found}\n")
-    except Exception:
-        pass
+    lf.write(f"\nSearching for GLB: found={found}\n")
+    desired_fmt = str(fmt)
+    if found and desired_fmt.lower() != 'obj':
+        # GLB requested and produced: install it as-is, nothing else to discover
+        try:
+            _move(found, out_path)
+            lf.write(f"Installed {found} -> {out_path}\n")
+            produced['ok'] = True
+            return out_path
+        except Exception:
+            # fall through to the discovery rounds below
+            pass
     if found:
         # If config requests OBJ (TripoSR is known to favor OBJ+texture),
         # attempt to convert GLB -> OBJ if trimesh is available; otherwise
         # move the GLB but warn in the logs.
-        desired_fmt = getattr(settings, 'TRIPOSR_OUTPUT_FORMAT', 'glb')
         if desired_fmt.lower() == 'obj':
             if trimesh is not None:
                 try:
-                    scene = trimesh.load(str(found))
-                    # export as obj (may produce separate material/texture files)
-                    obj_bytes = scene.export(file_type='obj')
-                    # trimesh returns str for obj, ensure bytes
-                    if isinstance(obj_bytes, str):
-                        obj_bytes = obj_bytes.encode('utf-8')
+                    # load + export in the conversion pool, off this thread
+                    obj_bytes = _convert_off_thread(_convert_to_obj, str(found))
                     obj_out = out_path.with_suffix('.obj')
                     with open(obj_out, 'wb') as of:
                         of.write(obj_bytes)
                     # try to export textures/mtl if available via export to 'obj' produced files
                     # Note: trimesh may not include textures; preserve any texture files present.
-                    for p in outdir.rglob('*'):
-                        if p.suffix.lower() in ('.png', '.jpg', '.jpeg', '.mtl'):
+                    for ext in _TEX_SUFFIXES + ('.mtl',):
+                        for p in idx.get(ext, ()):
                             try:
-                                shutil.move(str(p), str(out_path.parent / p.name))
+                                _move(p, out_path.parent / p.name)
                             except Exception:
                                 pass
+                    produced['ok'] = True
                     return obj_out
                 except Exception:
                     # conversion failed; fall back to moving the GLB and also produce a textured quad OBJ
                     pass
             # trimesh not available or conversion failed -> fall back to generating a textured quad OBJ
-            # create a textured quad using the input image if present
-            tex_path = None
-            for p in outdir.rglob('*'):
-                if p.suffix.lower() in ('.png', '.jpg', '.jpeg'):
-                    tex_path = p
-                    break
-            if tex_path is None:
-                # try to use the original input if present (inp)
-                tex_src = inp if inp.exists() else None
-            else:
-                tex_src = tex_path
-
-            obj_name = out_path.stem + '_fallback.obj'
-            obj_path = out_path.parent / obj_name
-            mtl_name = out_path.stem + '_fallback.mtl'
-            mtl_path = out_path.parent / mtl_name
-            tex_name = out_path.stem + '_fallback.png'
-            tex_out = out_path.parent / tex_name
-            if tex_src is not None and tex_src.exists():
-                try:
-                    shutil.copy(str(tex_src), str(tex_out))
-                except Exception:
-                    # if copy fails (maybe file vanished), write from orig bytes
-                    tex_out.write_bytes(orig_image_bytes)
-            # write MTL referencing the texture
-            with open(mtl_path, 'w', encoding='utf-8') as mf:
-                mf.write(f"newmtl fallback\nmap_Kd {tex_name}\n")
-            # write OBJ: a single quad with uv coords
-            with open(obj_path, 'w', encoding='utf-8') as of:
-                of.write(f"mtllib {mtl_name}\n")
-                of.write("o fallback_quad\n")
-                # vertices
-                of.write("v -0.5 -0.5 0.0\n")
-                of.write("v 0.5 -0.5 0.0\n")
-                of.write("v 0.5 0.5 0.0\n")
-                of.write("v -0.5 0.5 0.0\n")
-                # uvs
-                of.write("vt 0 0\n")
-                of.write("vt 1 0\n")
-                of.write("vt 1 1\n")
-                of.write("vt 0 1\n")
-                of.write("usemtl fallback\n")
-                of.write("s off\n")
-                of.write("f 1/1 2/2 3/3 4/4\n")
-            return obj_path
-
-    # No .glb: try to find .obj/.ply and textures recursively
-    # Some environments may not match rglob('*.OBJ') in a case-insensitive way,
-    # so enumerate all files and filter by suffix.lower() to be robust.
-    # Additionally, perform an os.walk dump to catch any filesystem oddities
-    # (permissions, transient deletions, symlinks) that pathlib.rglob may miss.
-    try:
-        import os as _os
-        walk_rows = []
-        for root, dirs, files in _os.walk(str(outdir)):
-            for fn in files:
-                fp = Path(root) / fn
-                try:
-                    walk_rows.append((str(fp), fp.exists(), fp.is_file(), fp.stat().st_size))
-                except Exception as _e:
-                    walk_rows.append((str(fp), 'error', str(_e)))
-        try:
-            with open(logpath, 'a', encoding='utf-8') as lf:
-                lf.write(f"os.walk rows: {walk_rows}\n")
-        except Exception:
-            pass
-    except Exception:
-        # If os.walk fails for any reason, continue; we'll still use rglob below.
-        pass
-
-    all_files = [p for p in outdir.rglob('*') if p.is_file()]
-    obj_list = [p for p in all_files if p.suffix.lower() == '.obj']
-    ply_list = [p for p in all_files if p.suffix.lower() == '.ply']
-    tex_list = [p for p in all_files if p.suffix.lower() in ('.png', '.jpg', '.jpeg')]
+            # create a textured quad using a produced texture if present
+            tex_path = outputs['tex']
+            # (no texture found: the original image bytes are used, same as inp)
+            return _write_fallback_quad(out_path.parent / (out_path.stem + '_fallback.obj'), out_path,
+                                        orig_image_bytes, tex_src=tex_path)
+
+    # No .glb: use the .obj/.ply and texture already found in idx
+    # (_find_outputs matches suffixes case-insensitively, see there; every file
+    # and its size is in the outdir listing logged by _generate).
+    obj_path = outputs['.obj']
+    ply_path = outputs['.ply']
+    tex_path = outputs['tex']
 
     # Debug: log exact files found (full paths)
-    try:
-        with open(logpath, 'a', encoding='utf-8') as lf:
-            lf.write(f"OBJ candidates: {[str(p) for p in obj_list]}\n")
-            lf.write(f"PLY candidates: {[str(p) for p in ply_list]}\n")
-            lf.write(f"Texture candidates: {[str(p) for p in tex_list]}\n")
-    except Exception:
-        pass
-
-    obj_path = obj_list[0] if obj_list else None
-    ply_path = ply_list[0] if ply_list else None
-    tex_path = tex_list[0] if tex_list else None
+    lf.write(f"OBJ candidate: {obj_path}\n")
+    lf.write(f"PLY candidate: {ply_path}\n")
+    lf.write(f"Texture candidate: {tex_path}\n")
 
     if obj_path:
         # Use OBJ directly - change output extension to .obj
@@ -633,35 +1027,27 @@ def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = '
         # ensure parent exists
         obj_out_path.parent.mkdir(parents=True, exist_ok=True)
         try:
-            shutil.move(str(obj_path), str(obj_out_path))
+            _move(obj_path, obj_out_path)
         except Exception as e:
                 try:
-                    shutil.copy(str(obj_path), str(obj_out_path))
+                    shutil.copyfile(str(obj_path), str(obj_out_path))
                     obj_path.unlink()
                 except Exception as e2:
-                    try:
-                        with open(logpath, 'a', encoding='utf-8') as lf:
-                            lf.write(f"Failed to move or copy OBJ {obj_path} -> {obj_out_path}: {e} / {e2}\n")
-                            lf.write(traceback.format_exc())
-                    except Exception:
-                        pass
+                    lf.write(f"Failed to move or copy OBJ {obj_path} -> {obj_out_path}: {e} / {e2}\n")
+                    lf.write(traceback.format_exc())
 
         # Also move texture if present
         if tex_path:
             tex_out_path = out_path.parent / (out_path.stem + tex_path.suffix)
             try:
-                shutil.move(str(tex_path), str(tex_out_path))
+                _move(tex_path, tex_out_path)
             except Exception as e:
                 try:
-                    shutil.copy(str(tex_path), str(tex_out_path))
+                    shutil.copyfile(str(tex_path), str(tex_out_path))
                     tex_path.unlink()
                 except Exception as e2:
-                    try:
-                        with open(logpath, 'a', encoding='utf-8') as lf:
-                            lf.write(f"Failed to move or copy texture {tex_path} -> {tex_out_path}: {e} / {e2}\n")
-                            lf.write(traceback.format_exc())
-                    except Exception:
-                        pass
+                    lf.write(f"Failed to move or copy texture {tex_path} -> {tex_out_path}: {e} / {e2}\n")
+                    lf.write(traceback.format_exc())
 
         # If there's no .mtl but we have a texture file, create an MTL and ensure
         # the OBJ references it. Also handle cases where OBJ exists but doesn't
@@ -673,8 +1059,7 @@ def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = '
                 tex_name = (out_path.stem + tex_path.suffix)
                 try:
                     _write_simple_mtl(mtl_expected, tex_name, material_name='material_0')
-                    with open(logpath, 'a', encoding='utf-8') as lf:
-                        lf.write(f"Generated MTL {mtl_expected} referencing texture {tex_name}\n")
+                    lf.write(f"Generated MTL {mtl_expected} referencing texture {tex_name}\n")
                 except Exception:
                     pass
 
@@ -700,45 +1085,9 @@ def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = '
                             new_lines.insert(insert_idx, 'usemtl material_0')
                             new_txt = '\n'.join(new_lines)
                         obj_out_path.write_text(new_txt, encoding='utf-8')
-                        try:
-                            with open(logpath, 'a', encoding='utf-8') as lf:
-                                lf.write(f"Patched OBJ {obj_out_path} to reference generated MTL {mtl_name}\n")
-                        except Exception:
-                            pass
-                    # Ensure OBJ has UVs so Blender and other importers can map textures
-                    try:
-                        _ensure_uvs_in_obj(obj_out_path)
-                    except Exception:
-                        pass
-            except Exception:
-                try:
-                    with open(logpath, 'a', encoding='utf-8') as lf:
-                        lf.write(f"Failed to ensure mtllib/usemtl for OBJ {obj_out_path}: {traceback.format_exc()}\n")
-                except Exception:
-                    pass
-        except Exception:
-            pass
-
-        # Ensure an accompanying .mtl exists. Some TripoSR runs may export an OBJ
-        # without an MTL; create one referencing the texture we moved above.
-        mtl_expected = out_path.parent / (out_path.stem + '.mtl')
-        # If there is no mtl present but we have a texture file, generate a simple MTL.
-        if (not mtl_expected.exists()) and tex_path:
-            tex_name = (out_path.stem + tex_path.suffix)
-            try:
-                _write_simple_mtl(mtl_expected, tex_name, material_name='material_0')
+                        lf.write(f"Patched OBJ {obj_out_path} to reference generated MTL {mtl_name}\n")
             except Exception:
-                pass
-
-        # Ensure the OBJ references the mtllib line. If missing, prepend it.
-        try:
-            txt = obj_out_path.read_text(encoding='utf-8')
-            if 'mtllib' not in txt.splitlines()[0:5]:
-                # Prepend mtllib line
-                mtl_name = mtl_expected.name if mtl_expected.exists() else ''
-                if mtl_name:
-                    new_txt = f"mtllib {mtl_name}\n" + txt
-                    obj_out_path.write_text(new_txt, encoding='utf-8')
+                lf.write(f"Failed to ensure mtllib/usemtl for OBJ {obj_out_path}: {traceback.format_exc()}\n")
         except Exception:
             pass
 
@@ -749,61 +1098,39 @@ def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = '
             pass
         
 
+        produced['ok'] = True
         return obj_out_path
 
     elif ply_path:
         if trimesh is None:
             # cannot convert without trimesh; create fallback marker
-            placeholder = out_path.parent / (out_path.stem + '_fallback_no_trimesh.glb')
-            with open(placeholder, 'wb') as f:
-                f.write(b'GLB_FALLBACK_NO_TRIMESH\n')
-            shutil.move(str(placeholder), str(out_path))
+            _write_bytes(out_path, b'GLB_FALLBACK_NO_TRIMESH\n')
             return out_path
 
         try:
-            # load as scene to preserve materials/textures
-            source = str(ply_path)
-            scene = trimesh.load(source, force='scene')
-            glb_bytes = scene.export(file_type='glb')
+            glb_bytes = _convert_off_thread(_convert_to_glb, str(ply_path))
             if isinstance(glb_bytes, (bytes, bytearray)):
-                with open(out_path, 'wb') as f:
-                    f.write(glb_bytes)
+                _write_bytes(out_path, glb_bytes)
+                produced['ok'] = True
                 return out_path
         except Exception:
-            # conversion failed, fallback to embedding the PNG into a placeholder glb
-            placeholder = out_path.parent / (out_path.stem + '_fallback_conv_error.glb')
-            with open(placeholder, 'wb') as f:
-                f.write(b'GLB_FALLBACK_CONV_ERROR\n')
-            shutil.move(str(placeholder), str(out_path))
+            # conversion failed, fallback to a marker placeholder glb
+            _write_bytes(out_path, b'GLB_FALLBACK_CONV_ERROR\n')
             return out_path
 
-    # If nothing was produced, raise
-    # Implement a robust discovery + copy workflow with retries and fallbacks.
-    attempts = []
-
-    def is_file_stable(p: Path, checks: int = 3, interval: float = 0.5) -> bool:
-        """Return True if file exists and its size is stable across checks."""
-        try:
-            last = p.stat().st_size
-        except Exception:
-            return False
-        for _ in range(checks):
-            time.sleep(interval)
-            try:
-                cur = p.stat().st_size
-            except Exception:
-                return False
-            if cur != last:
-                last = cur
-                continue
-        return True
-
+    # Nothing in the expected places: one more discovery pass with broader
+    # strategies, then fall back. TripoSR has already exited (run.py returned /
+    # the worker replied), so its files are complete: no waiting or retry rounds.
     def atomic_copy(src: Path, dest: Path) -> bool:
         """Copy src -> dest atomically by writing to temp and os.replace. Return True on success."""
         try:
             dest.parent.mkdir(parents=True, exist_ok=True)
             tmp = dest.parent / (dest.name + f'.tmp-{uuid.uuid4().hex}')
-            shutil.copy(str(src), str(tmp))
+            try:
+                # same filesystem: a new name for the same data, nothing copied
+                os.link(str(src), str(tmp))
+            except OSError:
+                shutil.copyfile(str(src), str(tmp))
             os.replace(str(tmp), str(dest))
             return True
         except Exception:
@@ -815,12 +1142,14 @@ def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = '
             return False
 
     def try_copy(src: Path, dest: Path) -> bool:
-        # wait for file to stabilize before copying
-        if not is_file_stable(src, checks=2, interval=0.5):
-            # try one more time quickly
-            if not is_file_stable(src, checks=1, interval=0.2):
-                return False
-        # attempt atomic copy
+        # same filesystem: an atomic rename, no data copied
+        try:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(str(src), str(dest))
+            return True
+        except OSError:
+            pass
+        # otherwise (e.g. another volume) attempt atomic copy
         if atomic_copy(src, dest):
             try:
                 # try to remove original if on same filesystem
@@ -830,11 +1159,11 @@ def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = '
             return True
         # fallback to move (less atomic) then copy
         try:
-            shutil.move(str(src), str(dest))
+            _move(src, dest)
             return True
         except Exception:
             try:
-                shutil.copy(str(src), str(dest))
+                shutil.copyfile(str(src), str(dest))
                 return True
             except Exception:
                 return False
@@ -846,13 +1175,14 @@ def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = '
     snapshot_dir.mkdir(parents=True, exist_ok=True)
 
     # discovery strategies (ordered): glb recursive, any obj/ply anywhere, filename contains 'mesh', nested dirs
+    # (all from the one outdir index; nothing has been moved out of it on this path)
     strategies = []
-    strategies.append(lambda d: list(d.rglob('*') if False else []))  # placeholder to keep indices stable
-    strategies.append(lambda d: [p for p in d.rglob('*') if p.suffix.lower() == '.glb'])
-    strategies.append(lambda d: [p for p in d.rglob('*') if p.suffix.lower() == '.obj'])
-    strategies.append(lambda d: [p for p in d.rglob('*') if p.suffix.lower() == '.ply'])
-    strategies.append(lambda d: [p for p in d.rglob('*') if 'mesh' in p.name.lower()])
-    strategies.append(lambda d: [p for sub in d.iterdir() if sub.is_dir() for p in sub.rglob('*')])
+    strategies.append(lambda d: [])  # placeholder to keep indices stable
+    strategies.append(lambda d: list(idx.get('.glb', ())))
+    strategies.append(lambda d: list(idx.get('.obj', ())))
+    strategies.append(lambda d: list(idx.get('.ply', ())))
+    strategies.append(lambda d: [p for p in idx['*'] if 'mesh' in p.name.lower()])
+    strategies.append(lambda d: [p for p in idx['*'] if p.parent != d])
 
     # validation helpers
     def validate_obj(path: Path) -> bool:
@@ -863,133 +1193,200 @@ def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = '
         except Exception:
             return False
 
-    max_total_seconds = 60
-    deadline = time.time() + max_total_seconds
-    max_rounds = 5
-    round_no = 0
-    found_any = False
-
-    # Try multiple rounds with backoff to capture transient files; bounded by deadline and max_rounds
-    while time.time() < deadline and round_no < max_rounds:
-        round_no += 1
+    for strat_idx, strat in enumerate(strategies, start=1):
+        candidates = []
         try:
-            with open(logpath, 'a', encoding='utf-8') as lf:
-                lf.write(f"Discovery round {round_no} starting; deadline in {int(deadline - time.time())}s\n")
-        except Exception:
-            pass
+            candidates = strat(outdir)
+        except Exception as e:
+            lf.write(f"Strategy {strat_idx} raised: {e}\n{traceback.format_exc()}\n")
+
+        # filter files only and ensure exists
+        candidates = [p for p in candidates if p.exists() and p.is_file()]
+        lf.write(f"Strategy {strat_idx} candidates: {[str(p) for p in candidates]}\n")
+
+        for c in candidates:
+            # copy into snapshot (atomic) and then install to expected out_path
+            dest_snapshot = snapshot_dir / (c.name)
+            if try_copy(c, dest_snapshot):
+                # validate if obj
+                if dest_snapshot.suffix.lower() == '.obj' and not validate_obj(dest_snapshot):
+                    lf.write(f"Rejected OBJ (too few verts): {dest_snapshot}\n")
+                    continue
+
+                # atomic install to final
+                if c.suffix.lower() == '.glb':
+                    final_dest = out_path
+                else:
+                    final_dest = out_path.with_suffix(c.suffix.lower())
+
+                if try_copy(dest_snapshot, final_dest):
+                    lf.write(f"Installed {dest_snapshot} -> {final_dest} (strat {strat_idx})\n")
+                    # record metadata
+                    meta = {
+                        'source': str(c),
+                        'snapshot': str(dest_snapshot),
+                        'final': str(final_dest),
+                        'strategy': strat_idx,
+                        'timestamp': datetime.utcnow().isoformat()
+                    }
+                    try:
+                        (snapshot_dir / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
+                    except Exception:
+                        pass
+                    if final_dest.suffix.lower() in ('.obj', '.glb'):
+                        produced['ok'] = True
+                        return final_dest
+            else:
+                lf.write(f"Failed to snapshot candidate {c} to {dest_snapshot}\n")
 
-        for strat_idx, strat in enumerate(strategies, start=1):
-            candidates = []
-            try:
-                candidates = strat(outdir)
-            except Exception as e:
-                try:
-                    with open(logpath, 'a', encoding='utf-8') as lf:
-                        lf.write(f"Strategy {strat_idx} raised: {e}\n{traceback.format_exc()}\n")
-                except Exception:
-                    pass
+    # if we reached here, give up and log attempts
+    lf.write(f"Discovery exhausted. No valid outputs found.\n")
 
-            # filter files only and ensure exists
-            candidates = [p for p in candidates if p.exists() and p.is_file()]
-            try:
-                with open(logpath, 'a', encoding='utf-8') as lf:
-                    lf.write(f"Round {round_no} Strategy {strat_idx} candidates: {[str(p) for p in candidates]}\n")
-            except Exception:
-                pass
+    # Fallback: create textured quad OBJ (ensure deterministic fallback path)
+    obj_path = _write_fallback_quad(out_path.parent / (out_path.stem + '_fallback.obj'), out_path, orig_image_bytes)
+    lf.write(f"Using fallback textured quad: {obj_path}\n")
+    return obj_path
 
-            for c in candidates:
-                # copy into snapshot (atomic) and then install to expected out_path
-                dest_snapshot = snapshot_dir / (c.name)
-                if try_copy(c, dest_snapshot):
-                    # validate if obj
-                    if dest_snapshot.suffix.lower() == '.obj' and not validate_obj(dest_snapshot):
-                        try:
-                            with open(logpath, 'a', encoding='utf-8') as lf:
-                                lf.write(f"Rejected OBJ (too few verts): {dest_snapshot}\n")
-                        except Exception:
-                            pass
-                        continue
 
-                    # atomic install to final
-                    if c.suffix.lower() == '.glb':
-                        final_dest = out_path
-                    else:
-                        final_dest = out_path.with_suffix(c.suffix.lower())
+# companions installed next to an OBJ result (<stem>.mtl, <stem>.<texture ext>)
+_COMPANION_SUFFIXES = ('.mtl',) + _TEX_SUFFIXES
+_RESULT_CACHE_LOCK = threading.Lock()
 
-                    if try_copy(dest_snapshot, final_dest):
-                        try:
-                            with open(logpath, 'a', encoding='utf-8') as lf:
-                                lf.write(f"Installed {dest_snapshot} -> {final_dest} (round {round_no} strat {strat_idx})\n")
-                        except Exception:
-                            pass
-                        # record metadata
-                        meta = {
-                            'source': str(c),
-                            'snapshot': str(dest_snapshot),
-                            'final': str(final_dest),
-                            'round': round_no,
-                            'strategy': strat_idx,
-                            'timestamp': datetime.utcnow().isoformat()
-                        }
-                        try:
-                            (snapshot_dir / 'meta.json').write_text(json.dumps(meta), encoding='utf-8')
-                        except Exception:
-                            pass
-                        if final_dest.suffix.lower() == '.obj':
-                            return final_dest
-                        if final_dest.suffix.lower() == '.glb':
-                            return final_dest
-                else:
-                    try:
-                        with open(logpath, 'a', encoding='utf-8') as lf:
-                            lf.write(f"Failed to snapshot candidate {c} to {dest_snapshot}\n")
-                    except Exception:
-                        pass
 
-        # exponential backoff before next round
-        sleep_for = min(2 ** round_no, 8)
-        time.sleep(sleep_for)
+def _result_cache_key(image_bytes: bytes, quality: str) -> str:
+    # output format / texture baking change the produced files, so they are part of the key
+    fmt = str(getattr(settings, 'TRIPOSR_OUTPUT_FORMAT', 'glb')).lower()
+    bake = 'tex' if getattr(settings, 'TRIPOSR_BAKE_TEXTURE', True) else 'notex'
+    return f"{hashlib.blake2b(image_bytes, digest_size=16).hexdigest()}_{quality}_{fmt}_{bake}"
 
-    # if we reached here, give up and log attempts
+
+def _restore_cached(entry: Path, out_path: Path) -> Optional[Path]:
+    """Install a cached result next to out_path; None if the entry is missing or broken."""
     try:
-        with open(logpath, 'a', encoding='utf-8') as lf:
-            lf.write(f"All discovery rounds exhausted. No valid outputs found.\n")
+        meta = json.loads((entry / 'meta.json').read_text(encoding='utf-8'))
+        old, new = meta['stem'], out_path.stem
+        result = None
+        for name in meta['files']:
+            src = entry / name
+            dst = out_path.parent / (new + name[len(old):])
+            if old != new and dst.suffix.lower() in ('.obj', '.mtl'):
+                # mtllib / map_Kd refer to the companions by file name. dst may still be a
+                # hardlink into another entry (an earlier same-stem hit): write a new file
+                # and rename it over dst instead of truncating the shared inode
+                tmp = dst.with_name(f'.{dst.name}.{uuid.uuid4().hex}.tmp')
+                try:
+                    _write_bytes(tmp, src.read_bytes().replace(old.encode('utf-8') + b'.', new.encode('utf-8') + b'.'))
+                    os.replace(str(tmp), str(dst))
+                except Exception:
+                    try:
+                        tmp.unlink()
+                    except OSError:
+                        pass
+                    raise
+            else:
+                link_or_copy(src, dst)
+            if name == meta['main']:
+                result = dst
+        # LRU: hits refresh the entry's age
+        os.utime(str(entry / 'meta.json'))
+        return result
     except Exception:
-        pass
+        return None
 
-    # Fallback: create textured quad OBJ (ensure deterministic fallback path)
-    obj_name = out_path.stem + '_fallback.obj'
-    obj_path = out_path.parent / obj_name
-    mtl_name = out_path.stem + '_fallback.mtl'
-    mtl_path = out_path.parent / mtl_name
-    tex_name = out_path.stem + '_fallback.png'
-    tex_path = out_path.parent / tex_name
+
+def _store_cached(entry: Path, result: Path) -> None:
+    """Hardlink result (and its <stem>.* companions) into the cache entry, then evict."""
+    if entry.exists():
+        return
+    tmp = entry.parent / f'.tmp-{uuid.uuid4().hex}'
     try:
-        if inp.exists():
-            tex_path.write_bytes(inp.read_bytes())
-        else:
-            tex_path.write_bytes(orig_image_bytes)
+        tmp.mkdir(parents=True)
+        files = [result.name]
+        for suffix in _COMPANION_SUFFIXES:
+            p = result.with_suffix(suffix)
+            if suffix != result.suffix.lower() and p.is_file():
+                files.append(p.name)
+        for name in files:
+            link_or_copy(result.parent / name, tmp / name)
+        (tmp / 'meta.json').write_text(json.dumps({'stem': result.stem, 'main': result.name, 'files': files}), encoding='utf-8')
+        os.replace(str(tmp), str(entry))
     except Exception:
-        tex_path.write_bytes(orig_image_bytes)
-    with open(mtl_path, 'w', encoding='utf-8') as mf:
-        mf.write(f"newmtl fallback\nmap_Kd {tex_name}\n")
-    with open(obj_path, 'w', encoding='utf-8') as of:
-        of.write(f"mtllib {mtl_name}\n")
-        of.write("o fallback_quad\n")
-        of.write("v -0.5 -0.5 0.0\n")
-        of.write("v 0.5 -0.5 0.0\n")
-        of.write("v 0.5 0.5 0.0\n")
-        of.write("v -0.5 0.5 0.0\n")
-        of.write("vt 0 0\n")
-        of.write("vt 1 0\n")
-        of.write("vt 1 1\n")
-        of.write("vt 0 1\n")
-        of.write("usemtl fallback\n")
-        of.write("s off\n")
-        of.write("f 1/1 2/2 3/3 4/4\n")
+        shutil.rmtree(str(tmp), ignore_errors=True)
+        return
+    _evict_cache(entry.parent)
+
+
+def _evict_cache(cache_dir: Path) -> None:
     try:
-        with open(logpath, 'a', encoding='utf-8') as lf:
-            lf.write(f"Using fallback textured quad: {obj_path}\n")
+        max_bytes = float(getattr(settings, 'TRIPOSR_CACHE_MAX_GB', 2)) * (1 << 30)
     except Exception:
-        pass
-    return obj_path
+        return
+    entries = []
+    total = 0
+    with _RESULT_CACHE_LOCK:
+        for e in os.scandir(str(cache_dir)):
+            if not e.is_dir() or e.name.startswith('.'):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(e.path))
+                age = os.stat(os.path.join(e.path, 'meta.json')).st_mtime
+            except OSError:
+                continue
+            entries.append((age, size, e.path))
+            total += size
+        entries.sort()
+        while entries and total > max_bytes:
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+# TripoSR cache entry name -> lock while that entry is being produced
+_inflight = InflightLocks()
+
+
+def generate_glb_from_image(image_bytes: bytes, out_path: Path, quality: str = 'light') -> Path:
+    """Image -> 3D model via TripoSR (GLB, or OBJ + MTL + texture per TRIPOSR_OUTPUT_FORMAT).
+
+    Results are cached by image content, so an identical image is served from
+    triposr_cache/ without running TripoSR again. Fallback placeholders are not cached.
+
+    Safe to call from several threads: in worker mode, calls that overlap are
+    coalesced into one batched forward (TRIPOSR_MAX_BATCH / TRIPOSR_BATCH_WAIT_MS).
+    """
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if float(getattr(settings, 'TRIPOSR_CACHE_MAX_GB', 2) or 0) <= 0:
+        _unshare_outputs(out_path)
+        return _generate(image_bytes, out_path, quality, {})
+    entry = settings.cache_path / 'triposr_cache' / _result_cache_key(image_bytes, quality)
+    # identical images submitted together run TripoSR once: later callers wait, then hit the cache
+    with _inflight(entry.name):
+        return _generate_cached(image_bytes, out_path, quality, entry)
+
+
+def _unshare_outputs(out_path: Path) -> None:
+    """Unlink output files that are hardlinked elsewhere (cache entries, reused tiles).
+
+    _generate writes results and placeholders onto out_path in place, which would
+    otherwise rewrite every other name for the same file too.
+    """
+    for p in (out_path, out_path.with_suffix('.obj'), *(out_path.with_suffix(x) for x in _COMPANION_SUFFIXES)):
+        try:
+            if p.stat().st_nlink > 1:
+                p.unlink()
+        except OSError:
+            pass
+
+
+def _generate_cached(image_bytes: bytes, out_path: Path, quality: str, entry: Path) -> Path:
+    if entry.is_dir():
+        cached = _restore_cached(entry, out_path)
+        if cached is not None:
+            print('[TripoSR] cache hit', entry.name, '->', cached)
+            return cached
+    _unshare_outputs(out_path)
+    produced: dict = {}
+    result = _generate(image_bytes, out_path, quality, produced)
+    if produced.get('ok'):
+        _store_cached(entry, result)
+    return result
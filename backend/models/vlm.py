@@ -6,15 +6,59 @@
 Logs requests/responses to backend/cache/vlm_logs for auditing.
 """
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Optional, Tuple
 from base64 import b64encode
+import functools
+import atexit
+import hashlib
 import json
+import os
+import queue
+import threading
 import time
 import traceback
 from pathlib import Path
 import requests
 import subprocess
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+
+# Static parts of the VLM request, built once; only the image part changes per call
+_OPENAI_CHAT_SYSTEM_MSG = {
+    'role': 'system',
+    'content': (
+        "You are an assistant that inspects a single input image and returns exactly ONE JSON object and NOTHING else. "
+        "The JSON must follow this schema (example):\n"
+        "{\"category\": \"object\", \"colors\": [\"red\",\"white\"], \"size\": \"small\", \"orientation\": \"front\", \"details\": [\"detail1\"]}\n"
+        "Fields:\n"
+        " - category: one-word label (e.g. object, building, person, abstract)\n"
+        " - colors: array of color names\n"
+        " - size: one of small, medium, large\n"
+        " - orientation: one of front, side, top, angled\n"
+        " - details: array of short strings describing notable features\n"
+    )
+}
+_IMAGE_B64_SYSTEM_MSG = {
+    'role': 'system',
+    'content': (
+        "Return exactly ONE JSON object and nothing else. The JSON must follow this example schema: "
+        "{\"category\":\"object\",\"colors\":[\"red\"],\"size\":\"medium\",\"orientation\":\"front\",\"details\":[\"detail\"]}."
+    )
+}
+_IMAGE_B64_USER_PROMPT = 'Analyze the attached image and respond with JSON only following the schema above. The image is provided in the payload as image_b64.'
+# part of the attribute cache key: bump when the prompts above change
+_PROMPT_VERSION = 1
+
+# Pooled keep-alive connections to the VLM endpoint (one handshake per socket, not per call)
+_SESSION = requests.Session()
+_SESSION.headers.update({'Accept': 'application/json'})
+_ADAPTER = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+_SESSION.mount('http://', _ADAPTER)
+_SESSION.mount('https://', _ADAPTER)
 
 
 @dataclass
@@ -26,25 +70,95 @@ class VLMAttributes:
     details: List[str]
 
 
-def _log_vlm(name: str, payload: Dict[str, Any]):
+def _loads(raw) -> Any:
+    """Decode JSON text or bytes, preferring orjson (stdlib json handles e.g. NaN literals)."""
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except Exception:
+            pass
+    return json.loads(raw)
+
+
+# VLM logs are written by one daemon thread so disk I/O stays off the request path
+_LOG_Q: 'queue.SimpleQueue' = queue.SimpleQueue()
+_LOG_WRITER: Optional[threading.Thread] = None
+_LOG_WRITER_LOCK = threading.Lock()
+
+
+def _vlm_log_dir() -> Path:
+    return Path(__file__).resolve().parent.parent / 'cache' / 'vlm_logs'
+
+
+def _write_vlm_log(ts: str, name: str, payload) -> None:
+    """Write one log entry: a dict as {ts}_{name}.json, raw bytes (e.g. the sent image) as {ts}_{name}."""
     try:
-        cache = Path(__file__).resolve().parent.parent / 'cache' / 'vlm_logs'
+        cache = _vlm_log_dir()
         cache.mkdir(parents=True, exist_ok=True)
-        ts = time.strftime('%Y%m%dT%H%M%SZ')
-        p = cache / f"{ts}_{name}.json"
-        p.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding='utf-8')
+        if isinstance(payload, bytes):
+            p = cache / f"{ts}_{name}"
+            data = payload
+        else:
+            p = cache / f"{ts}_{name}.json"
+            data = None
+        if data is None and orjson is not None:
+            try:
+                data = orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+            except Exception:
+                data = None
+        if data is None:
+            data = json.dumps(payload, ensure_ascii=False, indent=2).encode('utf-8')
+        tmp = p.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, p)
     except Exception:
         pass
 
 
+def _vlm_log_writer() -> None:
+    while True:
+        item = _LOG_Q.get()
+        if item is None:
+            return
+        _write_vlm_log(*item)
+
+
+def _drain_vlm_logs() -> None:
+    # flush queued entries at interpreter exit (bounded, the writer is a daemon)
+    if _LOG_WRITER is not None and _LOG_WRITER.is_alive():
+        _LOG_Q.put(None)
+        _LOG_WRITER.join(timeout=1)
+
+
+def _queue_vlm_log(ts: str, name: str, payload) -> None:
+    global _LOG_WRITER
+    if _LOG_WRITER is None:
+        with _LOG_WRITER_LOCK:
+            if _LOG_WRITER is None:
+                _LOG_WRITER = threading.Thread(target=_vlm_log_writer, name='vlm-log-writer', daemon=True)
+                _LOG_WRITER.start()
+                atexit.register(_drain_vlm_logs)
+    _LOG_Q.put_nowait((ts, name, payload))
+
+
+def _log_vlm(name: str, payload: Dict[str, Any]):
+    # timestamp taken now, not when the writer gets to it
+    _queue_vlm_log(time.strftime('%Y%m%dT%H%M%SZ'), name, payload)
+
+
 def load_vlm_model():
     # interface-compatible placeholder; actual loading not required for HTTP mode
     return {'name': 'vlm-client'}
 
 
-def _http_call(url: str, token: Optional[str], image_bytes: bytes, timeout: int) -> Optional[Dict[str, Any]]:
+def _http_call(url: str, token: Optional[str], image_bytes: bytes, timeout: int,
+               img_b64: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], int]:
+    """POST image_bytes to the VLM; img_b64 is its base64 text when the caller already has it.
+
+    Returns (decoded body, HTTP status); (None, 0) if the request itself failed.
+    """
     try:
-        hdr = {'Accept': 'application/json'}
+        hdr = {}
         if token:
             hdr['Authorization'] = f'Bearer {token}'
         # adapt payload by configured mode
@@ -55,67 +169,52 @@ def _http_call(url: str, token: Optional[str], image_bytes: bytes, timeout: int)
             mode = 'image_b64'
 
         # persist the raw tile image for auditing so we can inspect what was sent
+        # (written by the log writer thread like the other entries; the path is known now)
         try:
-            cache = Path(__file__).resolve().parent.parent / 'cache' / 'vlm_logs'
-            cache.mkdir(parents=True, exist_ok=True)
             ts_local = time.strftime('%Y%m%dT%H%M%SZ')
-            img_path = cache / f"{ts_local}_sent.png"
-            img_path.write_bytes(image_bytes)
+            img_path = _vlm_log_dir() / f"{ts_local}_sent.png"
+            _queue_vlm_log(ts_local, 'sent.png', bytes(image_bytes))
         except Exception:
             img_path = None
 
+        # logged instead of the request body, which carries the whole image as base64
+        img_stub = {'image_sha256': hashlib.sha256(image_bytes, usedforsecurity=False).hexdigest()[:16],
+                    'image_bytes': len(image_bytes), 'mode': mode}
+
         if mode == 'openai_chat':
             # Build OpenAI-like messages array with data URL image
-            img_b64 = b64encode(image_bytes).decode('ascii')
+            if img_b64 is None:
+                img_b64 = b64encode(image_bytes).decode('ascii')
             data_url = f"data:image/png;base64,{img_b64}"
             # Use a strict system+user prompt pair to force JSON-only responses
-            system_msg = {
-                'role': 'system',
-                'content': (
-                    "You are an assistant that inspects a single input image and returns exactly ONE JSON object and NOTHING else. "
-                    "The JSON must follow this schema (example):\n"
-                    "{\"category\": \"object\", \"colors\": [\"red\",\"white\"], \"size\": \"small\", \"orientation\": \"front\", \"details\": [\"detail1\"]}\n"
-                    "Fields:\n"
-                    " - category: one-word label (e.g. object, building, person, abstract)\n"
-                    " - colors: array of color names\n"
-                    " - size: one of small, medium, large\n"
-                    " - orientation: one of front, side, top, angled\n"
-                    " - details: array of short strings describing notable features\n"
-                )
-            }
+            system_msg = _OPENAI_CHAT_SYSTEM_MSG
             user_msg = {
                 'role': 'user',
                 'content': f'Analyze the image and return JSON only following the schema above. Image data (base64): {data_url}'
             }
             payload = {'messages': [system_msg, user_msg]}
-            _log_vlm('request_openai_chat', {'url': url, 'payload_preview': str(payload)[:1000], 'sent_image': str(img_path) if img_path is not None else None})
-            resp = requests.post(url, json=payload, headers=hdr, timeout=timeout)
+            _log_vlm('request_openai_chat', {'url': url, **img_stub, 'text_part': user_msg['content'][:200], 'sent_image': str(img_path) if img_path is not None else None})
+            resp = _SESSION.post(url, json=payload, headers=hdr, timeout=timeout)
         elif mode == 'multipart':
             # send as multipart/form-data file upload
             files = {'file': ('tile.png', image_bytes, 'image/png')}
-            _log_vlm('request_multipart', {'url': url, 'files': list(files.keys()), 'sent_image': str(img_path) if img_path is not None else None})
-            resp = requests.post(url, files=files, headers={'Authorization': hdr.get('Authorization')} if token else None, timeout=timeout)
+            _log_vlm('request_multipart', {'url': url, 'files': list(files.keys()), **img_stub, 'sent_image': str(img_path) if img_path is not None else None})
+            resp = _SESSION.post(url, files=files, headers=hdr, timeout=timeout)
         else:
             # Include messages alongside image_b64 for compatibility with
             # LMStudio/Gemma3 chat-completions endpoints which require a
             # `messages` field. We'll also add a stricter instruction to
             # attempt to return JSON-first; however servers may still reply
             # with free-form text, so we handle that downstream.
-            img_b64 = b64encode(image_bytes).decode('ascii')
-            data_url = f"data:image/png;base64,{img_b64}"
-            system_msg = {
-                'role': 'system',
-                'content': (
-                    "Return exactly ONE JSON object and nothing else. The JSON must follow this example schema: "
-                    "{\"category\":\"object\",\"colors\":[\"red\"],\"size\":\"medium\",\"orientation\":\"front\",\"details\":[\"detail\"]}."
-                )
-            }
+            if img_b64 is None:
+                img_b64 = b64encode(image_bytes).decode('ascii')
+            system_msg = _IMAGE_B64_SYSTEM_MSG
             # Do NOT embed the full data URL twice: the binary/base64 is already
             # included as the top-level 'image_b64' field. Some servers want the
             # image as a separate field while others parse inline data URLs; to
             # avoid sending huge duplicate payloads we reference the attachment
             # in the message instead of repeating the data URL.
-            user_content = 'Analyze the attached image and respond with JSON only following the schema above. The image is provided in the payload as image_b64.'
+            user_content = _IMAGE_B64_USER_PROMPT
             if img_path is not None:
                 user_content += f' (sent_image: {str(img_path)})'
             user_msg = {
@@ -126,18 +225,18 @@ def _http_call(url: str, token: Optional[str], image_bytes: bytes, timeout: int)
                 'image_b64': img_b64,
                 'messages': [system_msg, user_msg]
             }
-            _log_vlm('request_image_b64_with_messages', {'url': url, 'headers': {k: hdr.get(k) for k in ('Authorization',)}, 'payload_preview': str(payload)[:1000], 'sent_image': str(img_path) if img_path is not None else None})
-            resp = requests.post(url, json=payload, headers=hdr, timeout=timeout)
+            _log_vlm('request_image_b64_with_messages', {'url': url, 'headers': {k: hdr.get(k) for k in ('Authorization',)}, **img_stub, 'text_part': user_content[:200], 'sent_image': str(img_path) if img_path is not None else None})
+            resp = _SESSION.post(url, json=payload, headers=hdr, timeout=timeout)
 
         try:
-            j = resp.json()
+            j = _loads(resp.content)
         except Exception:
             j = {'status_code': resp.status_code, 'text': resp.text}
         _log_vlm('response', {'status': resp.status_code, 'body': j})
-        return j
+        return j, resp.status_code
     except Exception as e:
         _log_vlm('error', {'error': str(e), 'trace': traceback.format_exc()})
-        return None
+        return None, 0
 
 
 def _subprocess_call(cmd: List[str], image_path: Path, timeout: int) -> Optional[Dict[str, Any]]:
@@ -146,7 +245,7 @@ def _subprocess_call(cmd: List[str], image_path: Path, timeout: int) -> Optional
         proc = subprocess.run(cmd + [str(image_path)], capture_output=True, text=True, timeout=timeout)
         out = proc.stdout or proc.stderr
         try:
-            j = json.loads(out)
+            j = _loads(out)
         except Exception:
             j = {'status': 'ok', 'raw': out}
         _log_vlm('subprocess_response', {'cmd': cmd, 'returncode': proc.returncode, 'out_len': len(out) if out else 0})
@@ -156,103 +255,135 @@ def _subprocess_call(cmd: List[str], image_path: Path, timeout: int) -> Optional
         return None
 
 
+def _attr_cache_dir() -> Path:
+    return Path(__file__).resolve().parent.parent / 'cache' / 'vlm_attrs'
+
+
+def _attr_cache_path(image_bytes: bytes) -> Path:
+    # the answer depends on who was asked and how, not only on the image: endpoint,
+    # request mode, model and prompt version are part of the key
+    try:
+        from ..config import settings
+        ctx = (getattr(settings, 'VLM_URL', None), getattr(settings, 'VLM_MODE', 'image_b64'),
+               getattr(settings, 'VLM_MODEL', None))
+    except Exception:
+        ctx = (None, None, None)
+    tag = hashlib.blake2b(repr((*ctx, _PROMPT_VERSION)).encode('utf-8'), digest_size=6).hexdigest()
+    return _attr_cache_dir() / f"{hashlib.sha256(image_bytes).hexdigest()}_{tag}.json"
+
+
+def clear_attr_cache() -> int:
+    """Delete every cached attribute set (cache/vlm_attrs); returns how many were removed."""
+    global _ATTR_CACHE_COUNT
+    removed = 0
+    with _ATTR_CACHE_LOCK:
+        try:
+            for e in os.scandir(_attr_cache_dir()):
+                if e.name.endswith('.json'):
+                    try:
+                        os.remove(e.path)
+                        removed += 1
+                    except OSError:
+                        pass
+        except FileNotFoundError:
+            pass
+        _ATTR_CACHE_COUNT = None
+    return removed
+
+
+# entries kept in cache/vlm_attrs before the least recently used are evicted
+_ATTR_CACHE_MAX = 4096
+# approximate entry count (None until the directory is first counted)
+_ATTR_CACHE_COUNT: Optional[int] = None
+_ATTR_CACHE_LOCK = threading.Lock()
+
+
+def _attr_cache_max() -> int:
+    try:
+        from ..config import settings
+        return int(getattr(settings, 'VLM_ATTR_CACHE_MAX', _ATTR_CACHE_MAX))
+    except Exception:
+        return _ATTR_CACHE_MAX
+
+
+def _load_cached_attrs(path: Path) -> Optional[VLMAttributes]:
+    try:
+        attrs = VLMAttributes(**_loads(path.read_bytes()))
+    except Exception:
+        # missing, or written by an incompatible version
+        return None
+    try:
+        # mtime is the recency used for eviction
+        os.utime(path)
+    except OSError:
+        pass
+    return attrs
+
+
+def _evict_cached_attrs(cache_dir: Path, keep: int) -> int:
+    """Delete the least recently used entries so at most keep remain; returns the count left."""
+    entries = []
+    for e in os.scandir(cache_dir):
+        if e.name.endswith('.json'):
+            try:
+                entries.append((e.stat().st_mtime, e.path))
+            except OSError:
+                pass
+    entries.sort()
+    for _, p in entries[:max(0, len(entries) - keep)]:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+    return min(len(entries), keep)
+
+
+def _store_cached_attrs(path: Path, attrs: VLMAttributes) -> None:
+    global _ATTR_CACHE_COUNT
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_text(json.dumps(asdict(attrs), ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp, path)
+        limit = _attr_cache_max()
+        if limit <= 0:
+            return
+        with _ATTR_CACHE_LOCK:
+            if _ATTR_CACHE_COUNT is None:
+                _ATTR_CACHE_COUNT = sum(1 for e in os.scandir(path.parent) if e.name.endswith('.json'))
+            else:
+                _ATTR_CACHE_COUNT += 1
+            if _ATTR_CACHE_COUNT > limit:
+                # trim to 90% so the directory is not rescanned on every store
+                _ATTR_CACHE_COUNT = _evict_cached_attrs(path.parent, int(limit * 0.9))
+    except Exception:
+        pass
+
+
 def extract_attributes(model, image_bytes: bytes) -> VLMAttributes:
+    """Attributes of image_bytes. Structured answers from a 2xx VLM reply are cached
+    on disk by image content (cache/vlm_attrs, LRU-bounded by VLM_ATTR_CACHE_MAX),
+    so a tile seen before skips the round trip; raw-text and placeholder
+    fallbacks are never cached.
+    """
     # decide mode from settings
     try:
         from ..config import settings
     except Exception:
         settings = None
 
+    cache_path = _attr_cache_path(image_bytes)
+    cached = _load_cached_attrs(cache_path)
+    if cached is not None:
+        return cached
+
     # 1) HTTP mode
     if settings and getattr(settings, 'VLM_URL', None):
-        for attempt in range(getattr(settings, 'VLM_RETRIES', 2)):
-            resp = _http_call(settings.VLM_URL, getattr(settings, 'VLM_TOKEN', None), image_bytes, getattr(settings, 'VLM_TIMEOUT', 10))
-            if resp:
-                # Attempt to extract structured attributes. LM servers may
-                # return either JSON object directly or a chat-like response
-                # structure. Try several common patterns.
-                try:
-                    # If resp is already a mapping with keys
-                    if isinstance(resp, dict):
-                        # common OpenAI-like choice structure
-                        if 'choices' in resp and isinstance(resp['choices'], list) and resp['choices']:
-                            # extract message content
-                            msg = resp['choices'][0].get('message') or resp['choices'][0].get('text')
-                            content = None
-                            if isinstance(msg, dict):
-                                content = msg.get('content')
-                            elif isinstance(msg, str):
-                                content = msg
-                        else:
-                            # direct object
-                            content = None
-                            # If dict contains category/colors etc, use it
-                            if all(k in resp for k in ('category', 'colors')):
-                                return VLMAttributes(
-                                    category=resp.get('category','object'),
-                                    colors=resp.get('colors', ['gray']),
-                                    size=resp.get('size','medium'),
-                                    orientation=resp.get('orientation','front'),
-                                    details=resp.get('details', [])
-                                )
-                        # if we have textual content, try to parse JSON inside
-                        if content:
-                            # try direct JSON parse
-                            try:
-                                j = json.loads(content)
-                                if isinstance(j, dict) and 'category' in j:
-                                    return VLMAttributes(
-                                        category=j.get('category','object'),
-                                        colors=j.get('colors', ['gray']),
-                                        size=j.get('size','medium'),
-                                        orientation=j.get('orientation','front'),
-                                        details=j.get('details', [])
-                                    )
-                            except Exception:
-                                # attempt to extract JSON substring
-                                import re
-                                m = re.search(r"\{[\s\S]*\}", content)
-                                if m:
-                                    try:
-                                        j = json.loads(m.group(0))
-                                        if isinstance(j, dict) and 'category' in j:
-                                            return VLMAttributes(
-                                                category=j.get('category','object'),
-                                                colors=j.get('colors', ['gray']),
-                                                size=j.get('size','medium'),
-                                                orientation=j.get('orientation','front'),
-                                                details=j.get('details', [])
-                                            )
-                                    except Exception:
-                                        pass
-                        # If we get here, we couldn't parse structured attrs.
-                        # As a fallback, if there is text content available,
-                        # return a VLMAttributes with category='object' and
-                        # put the raw text into details so pipeline can use it
-                        raw_text = None
-                        if isinstance(resp, dict):
-                            # flatten likely text fields
-                            if 'choices' in resp and resp['choices']:
-                                c0 = resp['choices'][0]
-                                raw_text = c0.get('message', {}).get('content') if isinstance(c0.get('message'), dict) else c0.get('text') or c0.get('message')
-                            else:
-                                # try common fields
-                                raw_text = resp.get('text') or resp.get('content') or str(resp)
-                        else:
-                            raw_text = str(resp)
-                        if raw_text:
-                            # keep the raw text so pipeline can fall back to sending
-                            # it directly to SD if structured parsing fails
-                            return VLMAttributes(
-                                category='object',
-                                colors=['gray'],
-                                size='medium',
-                                orientation='front',
-                                details=[raw_text]
-                            )
-                except Exception:
-                    # parsing attempt failed for this resp; try next attempt
-                    continue
+        attrs, cacheable = _extract_http(settings, image_bytes)
+        if attrs is not None:
+            if cacheable:
+                _store_cached_attrs(cache_path, attrs)
+            return attrs
         # if HTTP mode fails, fallthrough to other modes
 
     # 2) Subprocess/local mode (not implemented fully; placeholder showing where to add)
@@ -270,8 +401,135 @@ def extract_attributes(model, image_bytes: bytes) -> VLMAttributes:
     )
 
 
-def to_prompt(attrs: VLMAttributes) -> str:
+def _extract_http(settings, image_bytes: bytes) -> Tuple[Optional[VLMAttributes], bool]:
+    """Ask the VLM at settings.VLM_URL (with retries).
+
+    Returns (attrs, cacheable): attrs is None if no attempt gave a usable answer;
+    cacheable is True only for structured attributes parsed from a 2xx reply,
+    not for the raw-text fallback (which may be an error page or error object).
+    """
+    raw_fallback = None
+    # encoded once for all attempts (multipart uploads the raw bytes instead)
+    img_b64 = None
+    if getattr(settings, 'VLM_MODE', 'image_b64') != 'multipart':
+        img_b64 = b64encode(image_bytes).decode('ascii')
+    for attempt in range(getattr(settings, 'VLM_RETRIES', 2)):
+        resp, status = _http_call(settings.VLM_URL, getattr(settings, 'VLM_TOKEN', None), image_bytes,
+                                  getattr(settings, 'VLM_TIMEOUT', 10), img_b64=img_b64)
+        ok = 200 <= status < 300
+        if resp:
+            # Attempt to extract structured attributes. LM servers may
+            # return either JSON object directly or a chat-like response
+            # structure. Try several common patterns.
+            try:
+                # If resp is already a mapping with keys
+                if isinstance(resp, dict):
+                    # common OpenAI-like choice structure
+                    if 'choices' in resp and isinstance(resp['choices'], list) and resp['choices']:
+                        # extract message content
+                        msg = resp['choices'][0].get('message') or resp['choices'][0].get('text')
+                        content = None
+                        if isinstance(msg, dict):
+                            content = msg.get('content')
+                        elif isinstance(msg, str):
+                            content = msg
+                    else:
+                        # direct object
+                        content = None
+                        # If dict contains category/colors etc, use it
+                        if all(k in resp for k in ('category', 'colors')):
+                            attrs = VLMAttributes(
+                                category=resp.get('category','object'),
+                                colors=resp.get('colors', ['gray']),
+                                size=resp.get('size','medium'),
+                                orientation=resp.get('orientation','front'),
+                                details=resp.get('details', [])
+                            )
+                            if ok:
+                                return attrs, True
+                            raw_fallback = raw_fallback or attrs
+                            continue
+                    # if we have textual content, try to parse JSON inside
+                    if content:
+                        # try direct JSON parse
+                        try:
+                            j = _loads(content)
+                            if isinstance(j, dict) and 'category' in j:
+                                attrs = VLMAttributes(
+                                    category=j.get('category','object'),
+                                    colors=j.get('colors', ['gray']),
+                                    size=j.get('size','medium'),
+                                    orientation=j.get('orientation','front'),
+                                    details=j.get('details', [])
+                                )
+                                if ok:
+                                    return attrs, True
+                                raw_fallback = raw_fallback or attrs
+                                continue
+                        except Exception:
+                            # attempt to extract JSON substring: outermost {...}, found in linear time
+                            i, k = content.find('{'), content.rfind('}')
+                            if i != -1 and k > i:
+                                try:
+                                    j = _loads(content[i:k + 1])
+                                    if isinstance(j, dict) and 'category' in j:
+                                        attrs = VLMAttributes(
+                                            category=j.get('category','object'),
+                                            colors=j.get('colors', ['gray']),
+                                            size=j.get('size','medium'),
+                                            orientation=j.get('orientation','front'),
+                                            details=j.get('details', [])
+                                        )
+                                        if ok:
+                                            return attrs, True
+                                        raw_fallback = raw_fallback or attrs
+                                        continue
+                                except Exception:
+                                    pass
+                    # If we get here, we couldn't parse structured attrs.
+                    # As a fallback, if there is text content available,
+                    # return a VLMAttributes with category='object' and
+                    # put the raw text into details so pipeline can use it
+                    raw_text = None
+                    if isinstance(resp, dict):
+                        # flatten likely text fields
+                        if 'choices' in resp and resp['choices']:
+                            c0 = resp['choices'][0]
+                            raw_text = c0.get('message', {}).get('content') if isinstance(c0.get('message'), dict) else c0.get('text') or c0.get('message')
+                        else:
+                            # try common fields
+                            raw_text = resp.get('text') or resp.get('content') or str(resp)
+                    else:
+                        raw_text = str(resp)
+                    if raw_text and ok:
+                        # keep the raw text so pipeline can fall back to sending
+                        # it directly to SD if structured parsing fails (not cached)
+                        return VLMAttributes(
+                            category='object',
+                            colors=['gray'],
+                            size='medium',
+                            orientation='front',
+                            details=[raw_text]
+                        ), False
+            except Exception:
+                # parsing attempt failed for this resp; try next attempt
+                continue
+    # only error replies: use the best of them for this call but never cache it
+    return raw_fallback, False
+
+
+@functools.lru_cache(maxsize=2048)
+def _cached_prompt(category: str, colors: tuple, size: str, details: tuple) -> str:
     return (
-        f"voxel-style {attrs.category}, {attrs.size}, primary colors: {', '.join(attrs.colors)}, "
-        f"details: {', '.join(attrs.details)}, low-poly, game-friendly, 3D render, front view"
+        f"voxel-style {category}, {size}, primary colors: {', '.join(colors)}, "
+        f"details: {', '.join(details)}, low-poly, game-friendly, 3D render, front view"
     )
+
+
+def to_prompt(attrs: VLMAttributes) -> str:
+    # repeated tiles give identical attributes; key the cache on a hashable snapshot
+    try:
+        return _cached_prompt(attrs.category, tuple(attrs.colors), attrs.size, tuple(attrs.details))
+    except TypeError:
+        # unhashable field values (e.g. nested JSON from the VLM)
+        return _cached_prompt.__wrapped__(attrs.category, attrs.colors, attrs.size, attrs.details)
@@ -9,37 +9,126 @@ Caching strategy (simplified):
 """
 from __future__ import annotations
 from pathlib import Path
+import base64
 import hashlib
+import io
 import json
-from typing import Tuple, Dict, Any
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Tuple, Dict, Any, List, Optional
 from .config import settings
+from .fileutil import link_or_copy
+from .inflight import InflightLocks
 from .models import vlm, sd, three_d
 
 import dataclasses
 
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 
 # Lazy singletons
 _vlm_model = None
 _sd_model = None
+# run_light_pipeline_many: tiles run concurrently so VLM round trips overlap and TripoSR batches them
+_TILE_POOL: Optional[ThreadPoolExecutor] = None
+_TILE_POOL_LOCK = threading.Lock()
+# tile hash -> lock while that tile is being generated
+_inflight = InflightLocks()
 
-def _ensure_models():
-    global _vlm_model, _sd_model
-    if _vlm_model is None:
-        _vlm_model = vlm.load_vlm_model()
-    if _sd_model is None:
-        # try to load model id from YAML
+_MODELS_READY = False
+_MODELS_LOCK = threading.Lock()
+
+
+def _load_sd():
+    # try to load model id from YAML
+    model_id = None
+    try:
+        cfg = __import__('..config', fromlist=['get_config'])
+        config_dict = cfg.get_config()
+        model_id = config_dict.get('SD_MODEL_ID')
+    except Exception:
         model_id = None
-        try:
-            cfg = __import__('..config', fromlist=['get_config'])
-            config_dict = cfg.get_config()
-            model_id = config_dict.get('SD_MODEL_ID')
-        except Exception:
-            model_id = None
-        _sd_model = sd.load_sd_model(model_id)
+    return sd.load_sd_model(model_id)
+
+
+def _sd_out_of_process() -> bool:
+    # SD_VENV_PYTHON: SD runs in the worker / per-call subprocess, load_sd_model returns None
+    return bool(getattr(settings, 'SD_VENV_PYTHON', None))
+
+
+def _ensure_models():
+    global _vlm_model, _sd_model, _MODELS_READY
+    # load_sd_model returns None both when SD runs out of process and when the load
+    # failed; the flag is only set in the first case, so a failed load is retried
+    if _MODELS_READY:
+        return
+    with _MODELS_LOCK:
+        if _MODELS_READY:
+            return
+        # cold start: load the VLM client and SD side by side instead of one after the other
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='model-load') as ex:
+            fv = ex.submit(vlm.load_vlm_model) if _vlm_model is None else None
+            fs = ex.submit(_load_sd) if _sd_model is None else None
+            if fv is not None:
+                _vlm_model = fv.result()
+            if fs is not None:
+                _sd_model = fs.result()
+        if _sd_model is not None or _sd_out_of_process():
+            _MODELS_READY = True
+
+
+def ensure_models() -> Dict[str, Any]:
+    """Load the VLM client and SD if not done yet (e.g. warm-up at startup) and report their state.
+
+    sd_loaded is True only for an in-process SD pipeline; sd_out_of_process means
+    SD_VENV_PYTHON is set and images come from the external SD process instead.
+    """
+    _ensure_models()
+    return {
+        'vlm_loaded': _vlm_model is not None,
+        'sd_loaded': _sd_model is not None,
+        'sd_out_of_process': _sd_out_of_process(),
+    }
 
 
 def _hash_bytes(b: bytes) -> str:
-    return hashlib.sha256(b).hexdigest()
+    # sha256 on purpose: OpenSSL runs it on SHA-NI where available (faster than
+    # blake2b there), and a painted tile PNG (~1-40 KB) hashes in 1-35 us, so a
+    # faster hash (BLAKE3) would buy nothing but another cache-name migration.
+    # The first 160 bits in base32 name the cache files: 32 chars instead of 64
+    # hex digits, still far beyond any realistic collision risk.
+    d = hashlib.sha256(b, usedforsecurity=False).digest()
+    return base64.b32encode(d[:20]).decode('ascii').lower()
+
+
+def _legacy_hash(b: bytes) -> str:
+    # cache entries written before the base32 names used the full hex digest
+    return hashlib.sha256(b, usedforsecurity=False).hexdigest()
+
+
+def _write_json(path: Path, obj: Any) -> None:
+    """Write obj as indented UTF-8 JSON via a temp file, so readers never see a partial file."""
+    data = None
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        except Exception:
+            data = None
+    if data is None:
+        data = json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    # per-thread temp name: tiles of one job run concurrently
+    tmp = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
 
 
 def _cache_dir() -> Path:
@@ -48,6 +137,95 @@ def _cache_dir() -> Path:
     return p
 
 
+# Near-duplicate tiles: content hash -> (64-bit dHash, mean RGB) of every cached
+# light result. dHash only sees gradients (a red and a blue flat tile hash the
+# same), so the mean colour has to match as well. On a 32px tile a painted 2-4px
+# square moves the dHash by a few bits and the mean by 1-3 levels, so the mean
+# must be exact: only re-encodes of the same pixels count as duplicates.
+_PHASH_INDEX: Optional[Dict[str, Tuple[int, Tuple[int, ...]]]] = None
+_PHASH_LOCK = threading.Lock()
+_PHASH_COLOR_TOL = 0
+
+
+def _phash(b: bytes) -> Optional[Tuple[int, Tuple[int, ...]]]:
+    """(dHash, mean RGB) of an encoded image; None if it cannot be decoded."""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(b)) as im:
+            rgb = im.convert('RGB')
+        px = list(rgb.convert('L').resize((9, 8), Image.BILINEAR).getdata())
+        mean = tuple(rgb.resize((1, 1), Image.BOX).getpixel((0, 0)))
+    except Exception:
+        return None
+    bits = 0
+    for y in range(8):
+        row = px[y * 9:y * 9 + 9]
+        for x in range(8):
+            bits = (bits << 1) | (row[x] < row[x + 1])
+    return bits, mean
+
+
+def _phash_index(cache_dir: Path) -> Dict[str, Tuple[int, Tuple[int, ...]]]:
+    """Load the index from the cached metas once (caller holds _PHASH_LOCK)."""
+    global _PHASH_INDEX
+    if _PHASH_INDEX is None:
+        index = {}
+        with os.scandir(cache_dir) as it:
+            for e in it:
+                if not e.name.endswith('.json'):
+                    continue
+                try:
+                    meta = json.loads(Path(e.path).read_text(encoding='utf-8'))
+                    if meta.get('phash') and meta.get('output') and not meta.get('error'):
+                        index[meta['hash']] = (int(meta['phash'][0], 16), tuple(meta['phash'][1]))
+                except Exception:
+                    continue
+        _PHASH_INDEX = index
+    return _PHASH_INDEX
+
+
+def _phash_lookup(ph: Tuple[int, Tuple[int, ...]], cache_dir: Path, max_dist: int) -> Optional[Tuple[Path, Dict[str, Any], int]]:
+    """Closest cached light result within max_dist bits (and similar colour): (output, meta, distance)."""
+    bits, mean = ph
+    with _PHASH_LOCK:
+        index = _phash_index(cache_dir)
+        cands = sorted(
+            (bin(bits ^ b).count('1'), h) for h, (b, m) in index.items()
+            if max(abs(x - y) for x, y in zip(mean, m)) <= _PHASH_COLOR_TOL)
+    for dist, h in cands:
+        if dist > max_dist:
+            break
+        try:
+            meta = json.loads((cache_dir / f"{h}.json").read_text(encoding='utf-8'))
+            out = settings.glb_dir / meta['output']
+            if not meta.get('error') and out.exists():
+                return out, meta, dist
+        except Exception:
+            pass
+        # meta or model is gone: forget it
+        with _PHASH_LOCK:
+            index.pop(h, None)
+    return None
+
+
+def _phash_add(h: str, ph: Tuple[int, Tuple[int, ...]]) -> None:
+    with _PHASH_LOCK:
+        # not loaded yet: the first lookup reads it from the meta just written
+        if _PHASH_INDEX is not None:
+            _PHASH_INDEX[h] = ph
+
+
+def _check_sd_image(b: bytes) -> None:
+    """Raise if the SD output is a single solid colour (what the SD fallbacks produce)."""
+    from PIL import Image
+    im = Image.open(io.BytesIO(b)).convert('RGBA')
+    # per-band (min, max) computed in C; a channel with min == max has only one value
+    (r0, r1), (g0, g1), (b0, b1) = im.getextrema()[:3]
+    if r0 == r1 and g0 == g1 and b0 == b1:
+        raise RuntimeError(f'SD output appears to be single-color: R={r0},G={g0},B={b0}')
+
+
 def _safe_serialize(obj):
     """Recursively convert an object to JSON-serializable types.
 
@@ -85,9 +263,26 @@ def _safe_serialize(obj):
         return str(obj)
 
 
-def run_light_pipeline(tile_image_bytes: bytes) -> Tuple[Path, Dict[str, Any]]:
+class PipelineAborted(RuntimeError):
+    """The caller set the abort event before this tile's next stage started."""
+
+
+def _check_abort(abort: Optional[threading.Event], h: str, stage: str) -> None:
+    if abort is not None and abort.is_set():
+        raise PipelineAborted(f'aborted before {stage} for {h}')
+
+
+def run_light_pipeline(tile_image_bytes: bytes, abort: Optional[threading.Event] = None) -> Tuple[Path, Dict[str, Any]]:
+    """Light result for one tile. abort, if given and set, stops it before its next VLM/SD/3D stage."""
     _ensure_models()
     h = _hash_bytes(tile_image_bytes)
+    # the same tile requested concurrently: one caller runs the pipeline, the others
+    # wait and then take its result from the meta cache
+    with _inflight(h):
+        return _run_light(tile_image_bytes, h, abort)
+
+
+def _run_light(tile_image_bytes: bytes, h: str, abort: Optional[threading.Event] = None) -> Tuple[Path, Dict[str, Any]]:
     cache_dir = _cache_dir()
     meta_path = cache_dir / f"{h}.json"
 
@@ -104,9 +299,44 @@ def run_light_pipeline(tile_image_bytes: bytes) -> Tuple[Path, Dict[str, Any]]:
             return out_path, meta
         else:
             print(f'[PIPELINE] cache contains error for {h}, will attempt regeneration')
+    elif not meta_path.exists():
+        # tile cached before the switch to base32 names
+        legacy_h = _legacy_hash(tile_image_bytes)
+        legacy_meta = cache_dir / f"{legacy_h}.json"
+        legacy_out = settings.glb_dir / f"{legacy_h}_light.{fmt}"
+        if legacy_meta.exists() and legacy_out.exists():
+            meta = json.loads(legacy_meta.read_text(encoding='utf-8'))
+            if not meta.get('error'):
+                print(f'[PIPELINE] cache hit for {h} (legacy name), returning {legacy_out}')
+                return legacy_out, meta
+
+    # near-duplicate of a tile already generated (e.g. a re-encoded PNG): reuse its model
+    max_dist = getattr(settings, 'PHASH_MAX_DISTANCE', -1)
+    ph = _phash(tile_image_bytes) if max_dist is not None and max_dist >= 0 else None
+    if ph is not None:
+        hit = _phash_lookup(ph, cache_dir, max_dist)
+        if hit is not None:
+            near_path, near_meta, dist = hit
+            # record the result under this tile's own hash, so a repeat is a plain cache hit
+            own_path = settings.glb_dir / f"{h}_light{near_path.suffix}"
+            try:
+                link_or_copy(near_path, own_path)
+                meta = dict(near_meta, hash=h, output=own_path.name,
+                            phash=[f'{ph[0]:016x}', list(ph[1])],
+                            near_duplicate={'of': near_meta['hash'], 'distance': dist})
+                _write_json(meta_path, meta)
+                _phash_add(h, ph)
+                print(f'[PIPELINE] near-duplicate of {near_meta["hash"]} (distance {dist}) for {h}, returning {own_path}')
+                return own_path, meta
+            except Exception as e:
+                print(f'[PIPELINE] could not reuse near-duplicate {near_meta["hash"]} for {h}: {e}')
 
     try:
         # 1. VLM attr
+        _check_abort(abort, h, 'VLM')
+        # extract_attributes answers repeats (e.g. a retry after SD/3D failed) from its own
+        # content-hash cache; the {h}_vlm.json below is not read back because it also records
+        # placeholder answers, which would pin the tile to the fallback prompt
         print(f'[PIPELINE] extracting VLM attributes for {h}')
         attrs = vlm.extract_attributes(_vlm_model, tile_image_bytes)
         # persist VLM meta for debugging
@@ -123,7 +353,7 @@ def run_light_pipeline(tile_image_bytes: bytes) -> Tuple[Path, Dict[str, Any]]:
                         raw_fallback = attrs.details[0]
             except Exception:
                 raw_fallback = None
-            vlm_cache_file.write_text(json.dumps({'attrs': dataclasses.asdict(attrs), 'prompt': vlm.to_prompt(attrs), 'raw_fallback': raw_fallback}, ensure_ascii=False, indent=2), encoding='utf-8')
+            _write_json(vlm_cache_file, {'attrs': dataclasses.asdict(attrs), 'prompt': vlm.to_prompt(attrs), 'raw_fallback': raw_fallback})
         except Exception:
             pass
 
@@ -169,30 +399,43 @@ def run_light_pipeline(tile_image_bytes: bytes) -> Tuple[Path, Dict[str, Any]]:
         print(f'[PIPELINE] prompt generated: {prompt[:200]}')
 
         # 3. SD image generation
-        print(f'[PIPELINE] generating SD image for {h}')
-        sd_img_bytes = sd.generate_image(_sd_model, prompt)
-        # save SD image to cache for inspection
+        _check_abort(abort, h, 'SD')
         sd_img_path = cache_dir / f"{h}_sd.png"
-        sd_img_path.parent.mkdir(parents=True, exist_ok=True)
-        sd_img_path.write_bytes(sd_img_bytes)
-        print(f'[PIPELINE] SD image saved to {sd_img_path}')
-        # Quick sanity check: ensure SD output is not a single solid color (common fallback)
-        try:
-            from PIL import Image
-            im = Image.open(sd_img_path).convert('RGBA')
-            # check if each channel has only one unique value
-            pixels = list(im.getdata())
-            rs = set(p[0] for p in pixels)
-            gs = set(p[1] for p in pixels)
-            bs = set(p[2] for p in pixels)
-            if len(rs) == 1 and len(gs) == 1 and len(bs) == 1:
-                raise RuntimeError(f'SD output appears to be single-color: R={next(iter(rs))},G={next(iter(gs))},B={next(iter(bs))}')
-        except Exception as e:
-            # Log and raise to make the failure visible to the caller
-            print(f'[PIPELINE] SD output sanity check failed: {e}')
-            raise
+        # prompt that produced the cached SD image; an image without it is not reused
+        sd_prompt_path = cache_dir / f"{h}_sd.prompt"
+        sd_img_bytes = None
+        if sd_img_path.exists():
+            # kept from an earlier attempt (e.g. the 3D step failed): skip SD if it came from the
+            # same prompt (not e.g. the placeholder one while the VLM was down) and still looks valid
+            try:
+                if sd_prompt_path.read_text(encoding='utf-8') == prompt:
+                    cached_sd = sd_img_path.read_bytes()
+                    _check_sd_image(cached_sd)
+                    sd_img_bytes = cached_sd
+                    print(f'[PIPELINE] reusing cached SD image {sd_img_path}')
+            except Exception:
+                sd_img_bytes = None
+        if sd_img_bytes is None:
+            print(f'[PIPELINE] generating SD image for {h}')
+            # sd serializes generations; decoding the result overlaps the next tile's
+            sd_img_bytes = sd.generate_image(_sd_model, prompt)
+            # save SD image to cache for inspection (and for retries / refinement)
+            sd_img_path.parent.mkdir(parents=True, exist_ok=True)
+            # dropped first so a half-finished save never pairs the new image with an old prompt
+            sd_prompt_path.unlink(missing_ok=True)
+            sd_img_path.write_bytes(sd_img_bytes)
+            sd_prompt_path.write_text(prompt, encoding='utf-8')
+            print(f'[PIPELINE] SD image saved to {sd_img_path}')
+            # Quick sanity check: ensure SD output is not a single solid color (common fallback)
+            try:
+                _check_sd_image(sd_img_bytes)
+            except Exception as e:
+                # Log and raise to make the failure visible to the caller
+                print(f'[PIPELINE] SD output sanity check failed: {e}')
+                raise
 
         # 4. 3D generation (TripoSR or fallback)
+        _check_abort(abort, h, '3D')
         print(f'[PIPELINE] invoking 3D generator (TripoSR) for {h} -> {out_path}')
         settings.glb_dir.mkdir(parents=True, exist_ok=True)
         result_path = three_d.generate_glb_from_image(sd_img_bytes, out_path, quality='light')
@@ -207,10 +450,18 @@ def run_light_pipeline(tile_image_bytes: bytes) -> Tuple[Path, Dict[str, Any]]:
             'output': result_path.name,
             'output_type': out_suffix.lstrip('.')
         }
+        if ph is not None:
+            meta['phash'] = [f'{ph[0]:016x}', list(ph[1])]
         # write meta
-        meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+        _write_json(meta_path, meta)
+        if ph is not None:
+            _phash_add(h, ph)
         print(f'[PIPELINE] generated output at {result_path} (type={out_suffix})')
         return result_path, meta
+    except PipelineAborted:
+        # not a failure of this tile: no error meta, the next request simply runs it
+        print(f'[PIPELINE] {h} aborted')
+        raise
     except Exception as e:
         import traceback
         tb = traceback.format_exc()
@@ -218,19 +469,45 @@ def run_light_pipeline(tile_image_bytes: bytes) -> Tuple[Path, Dict[str, Any]]:
         # write an error meta for debugging
         err_meta = {'hash': h, 'error': str(e), 'trace': tb}
         try:
-            meta_path.write_text(json.dumps(err_meta, ensure_ascii=False, indent=2), encoding='utf-8')
+            _write_json(meta_path, err_meta)
         except Exception:
             pass
         raise
 
 
+def _tile_pool() -> ThreadPoolExecutor:
+    global _TILE_POOL
+    with _TILE_POOL_LOCK:
+        if _TILE_POOL is None:
+            workers = max(1, int(getattr(settings, 'TILE_CONCURRENCY', 4) or 1))
+            _TILE_POOL = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tile')
+        return _TILE_POOL
+
+
+def run_light_pipeline_many(tiles: List[bytes], abort: Optional[threading.Event] = None) -> List[Future]:
+    """Submit run_light_pipeline for every tile; the futures come back in input order.
+
+    Each future resolves to (path, meta) or raises that tile's error. Cancelling a
+    future only drops a tile that has not started; setting abort also stops running
+    tiles at their next stage (they raise PipelineAborted). Stages are
+    bounded separately: up to TILE_CONCURRENCY VLM calls in flight, SD one image
+    at a time (serialized in sd), and the 3D step batched by the TripoSR worker, so a
+    job takes roughly as long as its slowest stage rather than the sum.
+    """
+    # load models once here rather than racing the lazy load from every tile thread
+    _ensure_models()
+    pool = _tile_pool()
+    return [pool.submit(run_light_pipeline, b, abort) for b in tiles]
+
+
 def run_refine_pipeline(existing_glb_path: Path) -> Tuple[Path, Dict[str, Any]]:
     # ここでは既存 GLB をコピーして refined ラベルに変更するだけ
     refined_path = existing_glb_path.with_name(existing_glb_path.stem.replace('_light','') + '_refined.glb')
     if not refined_path.exists():
-        data = existing_glb_path.read_bytes()
-        with open(refined_path, 'wb') as f:
-            f.write(data + b'_REFINED')
+        # a real copy, not a hard link: regenerating the light model rewrites its file in
+        # place, which must not change the refined one. The model bytes stay a valid GLB;
+        # "refined" is recorded in the returned meta
+        shutil.copyfile(existing_glb_path, refined_path)
     meta = {
         'base': existing_glb_path.name,
         'refined': refined_path.name,
@@ -11,6 +11,11 @@ from PIL import Image
 from io import BytesIO
 import sys
 import os
+try:
+    # optional: libvips streams the canvas PNG instead of decoding all of it
+    import pyvips
+except Exception:
+    pyvips = None
 
 # Add backend to path
 sys.path.insert(0, str(Path(__file__).parent / 'backend'))
@@ -44,6 +49,25 @@ def load_canvas():
     Image.MAX_IMAGE_PIXELS = 2000000000
     return Image.open(CANVAS_PATH).convert('RGBA')
 
+_VIPS_MODES = {1: 'L', 2: 'LA', 3: 'RGB', 4: 'RGBA'}
+
+
+def crop_canvas(box):
+    """Return the RGBA pixels of box (x0, y0, x1, y1) without converting the whole canvas."""
+    x0, y0, x1, y1 = box
+    if pyvips is not None:
+        try:
+            # sequential access decodes rows top-down with O(width) memory, stopping at y1
+            region = pyvips.Image.new_from_file(str(CANVAS_PATH), access='sequential').crop(x0, y0, x1 - x0, y1 - y0)
+            if region.format == 'uchar' and region.bands in _VIPS_MODES:
+                return Image.frombytes(_VIPS_MODES[region.bands], (region.width, region.height),
+                                       region.write_to_memory()).convert('RGBA')
+        except Exception:
+            pass
+    with Image.open(CANVAS_PATH) as canvas_img:
+        # crop first: only the tile is converted to RGBA, not a full-canvas copy
+        return canvas_img.crop(box).convert('RGBA')
+
 def load_objects():
     """Load 3D objects list"""
     if OBJECTS_JSON.exists():
@@ -108,21 +132,24 @@ def get_tile(tile_x, tile_y):
         if tile_path.exists():
             return send_file(tile_path, mimetype='image/png')
         
-        # Extract from main canvas
-        canvas_img = load_canvas()
+        # Extract from main canvas (the header gives the size; pixels are decoded by crop_canvas)
+        ensure_canvas()
+        Image.MAX_IMAGE_PIXELS = 2000000000
+        with Image.open(CANVAS_PATH) as canvas_img:
+            canvas_w, canvas_h = canvas_img.size
         
         start_x = tile_x * settings.tile_px
         start_y = tile_y * settings.tile_px
-        end_x = min(start_x + settings.tile_px, canvas_img.width)
-        end_y = min(start_y + settings.tile_px, canvas_img.height)
+        end_x = min(start_x + settings.tile_px, canvas_w)
+        end_y = min(start_y + settings.tile_px, canvas_h)
         
         # Check bounds
-        if start_x >= canvas_img.width or start_y >= canvas_img.height:
+        if start_x >= canvas_w or start_y >= canvas_h:
             # Create transparent tile
             tile_img = Image.new('RGBA', (settings.tile_px, settings.tile_px), (0, 0, 0, 0))
         else:
             # Extract tile
-            tile_img = canvas_img.crop((start_x, start_y, end_x, end_y))
+            tile_img = crop_canvas((start_x, start_y, end_x, end_y))
             
             # Pad if needed
             if tile_img.width < settings.tile_px or tile_img.height < settings.tile_px:
@@ -23,10 +23,20 @@ try:
     from diffusers import StableDiffusionPipeline
     import torch
     pipe = StableDiffusionPipeline.from_pretrained(args.model)
+    # attention backend: SDPA -> xFormers -> attention slicing
     try:
-        pipe.enable_attention_slicing()
+        from diffusers.models.attention_processor import AttnProcessor2_0
+        if not hasattr(torch.nn.functional, 'scaled_dot_product_attention'):
+            raise RuntimeError('torch without SDPA')
+        pipe.unet.set_attn_processor(AttnProcessor2_0())
     except Exception:
-        pass
+        try:
+            pipe.enable_xformers_memory_efficient_attention()
+        except Exception:
+            try:
+                pipe.enable_attention_slicing()
+            except Exception:
+                pass
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     if device == 'cuda':
         pipe = pipe.to('cuda')
@@ -0,0 +1,79 @@
+"""Near-duplicate tile lookup (PHASH_MAX_DISTANCE): a re-encoded tile reuses the
+cached light model, a tile with a small painted edit is generated anew.
+
+VLM / SD / TripoSR are replaced by stubs, so this runs without models or servers:
+
+  python scripts/test_phash_near_duplicate.py
+"""
+import sys
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, PngImagePlugin
+
+proj_root = Path(__file__).resolve().parent.parent
+if str(proj_root) not in sys.path:
+    sys.path.insert(0, str(proj_root))
+
+from backend.config import settings
+from backend import pipeline
+from backend.models import vlm, sd, three_d
+
+
+def _png(img, **kw):
+    bio = BytesIO()
+    img.save(bio, format='PNG', **kw)
+    return bio.getvalue()
+
+
+def main():
+    tmp = Path(tempfile.mkdtemp(prefix='phash_test_'))
+    settings.cache_dir = str(tmp / 'cache')
+    settings.assets_dir = str(tmp / 'assets')
+    settings.PHASH_MAX_DISTANCE = 0
+    pipeline._PHASH_INDEX = None
+
+    generated = []
+
+    def fake_glb(img_bytes, out_path, quality='light'):
+        generated.append(out_path.name)
+        out_path.write_bytes(b'glTF')
+        return out_path
+
+    vlm.extract_attributes = lambda model, b: vlm.VLMAttributes('object', ['blue'], 'small', 'front', [])
+    sd.generate_image = lambda model, prompt, seed=None: _png(Image.linear_gradient('L').convert('RGB'))
+    three_d.generate_glb_from_image = fake_glb
+
+    base = Image.new('RGB', (32, 32), (40, 90, 200))
+    first = _png(base)
+    path1, meta1 = pipeline._run_light(first, pipeline._hash_bytes(first))
+    assert len(generated) == 1
+
+    # same pixels, different bytes: reused and recorded under the new hash
+    info = PngImagePlugin.PngInfo()
+    info.add_text('note', 're-encoded')
+    reencoded = _png(base, compress_level=9, pnginfo=info)
+    h2 = pipeline._hash_bytes(reencoded)
+    assert h2 != meta1['hash']
+    path2, meta2 = pipeline._run_light(reencoded, h2)
+    assert len(generated) == 1, 're-encode should not regenerate'
+    assert meta2['hash'] == h2 and meta2['near_duplicate']['of'] == meta1['hash']
+    assert path2.name.startswith(h2) and path2.exists()
+    assert (pipeline._cache_dir() / f'{h2}.json').exists()
+    # and a repeat of it is a plain cache hit
+    assert pipeline._run_light(reencoded, h2)[0] == path2
+
+    # a small painted square is a real edit, not a duplicate
+    for n in (2, 3, 4):
+        edited = base.copy()
+        edited.paste((255, 255, 255), (10, 10, 10 + n, 10 + n))
+        b = _png(edited)
+        pipeline._run_light(b, pipeline._hash_bytes(b))
+    assert len(generated) == 4, f'small edits should regenerate, got {generated}'
+    print('OK: re-encode reused, small edits regenerated')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""TripoSR result cache: restoring two entries onto one output stem must not
+write through a hardlink into the first entry.
+
+Entry E1 has the output's stem, so its OBJ/MTL are hardlinked into place; E2
+has another stem, so its OBJ/MTL are rewritten with the new name. The second
+restore must replace the linked files, not truncate them.
+
+  python scripts/test_triposr_cache_restore.py
+"""
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+proj_root = Path(__file__).resolve().parent.parent
+if str(proj_root) not in sys.path:
+    sys.path.insert(0, str(proj_root))
+
+from backend.models import three_d
+
+
+def _entry(root: Path, name: str, stem: str, vertex: bytes) -> Path:
+    entry = root / name
+    entry.mkdir(parents=True)
+    (entry / f'{stem}.obj').write_bytes(b'mtllib ' + stem.encode() + b'.mtl\n' + vertex)
+    (entry / f'{stem}.mtl').write_bytes(b'newmtl m\nmap_Kd ' + stem.encode() + b'.png\n')
+    (entry / f'{stem}.png').write_bytes(b'PNG-' + stem.encode())
+    (entry / 'meta.json').write_text(json.dumps({
+        'stem': stem, 'main': f'{stem}.obj',
+        'files': [f'{stem}.obj', f'{stem}.mtl', f'{stem}.png']}), encoding='utf-8')
+    return entry
+
+
+def main():
+    tmp = Path(tempfile.mkdtemp(prefix='triposr_cache_test_'))
+    e1 = _entry(tmp / 'cache', 'e1', 'tile_light', b'v 1 1 1\n')
+    e2 = _entry(tmp / 'cache', 'e2', 'other_light', b'v 2 2 2\n')
+    e1_obj = (e1 / 'tile_light.obj').read_bytes()
+    e1_mtl = (e1 / 'tile_light.mtl').read_bytes()
+
+    out = tmp / 'out' / 'tile_light.obj'
+    out.parent.mkdir()
+    assert three_d._restore_cached(e1, out) == out
+    assert out.read_bytes() == e1_obj
+
+    assert three_d._restore_cached(e2, out) == out
+    assert out.read_bytes() == b'mtllib tile_light.mtl\nv 2 2 2\n', out.read_bytes()
+    assert (e1 / 'tile_light.obj').read_bytes() == e1_obj, f'E1 entry now: {(e1 / "tile_light.obj").read_bytes()!r}'
+    assert (e1 / 'tile_light.mtl').read_bytes() == e1_mtl
+    print('OK: second restore left the first cache entry intact')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())